@@ -114,6 +114,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Cache shared by the web workers, the reset commands and the scheduler, which invalidate the cached
+# dashboard statistics from other processes. Defaults to the database cache table, set CACHE_BACKEND and
+# CACHE_LOCATION to use e.g. django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379 instead.
+# The table of the database cache is created by `python manage.py createcachetable`, run after `migrate`.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='taskmaster_cache'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -170,6 +185,10 @@ STATIC_URL = 'static/'  # URL for serving static files.
 # Directory for collecting static files.
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Directory of the compressed segment files holding the archived task history.
+TASK_HISTORY_ARCHIVE_DIR = config(
+    'TASK_HISTORY_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'history_archive'))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -12,3 +12,18 @@ admin.site.register(UserProfile)
 
 # Registering the TaskHistory model to make it manageable through the Django admin interface.
 admin.site.register(TaskHistory)
+
+# Registering the TaskHistorySummary model to make it manageable through the Django admin interface.
+admin.site.register(TaskHistorySummary)
+
+# Registering the TaskCounter model to make it manageable through the Django admin interface.
+admin.site.register(TaskCounter)
+
+# Registering the TaskCompletionRollup model to make it manageable through the Django admin interface.
+admin.site.register(TaskCompletionRollup)
+
+# Registering the TaskCompletionBitmap model to make it manageable through the Django admin interface.
+admin.site.register(TaskCompletionBitmap)
+
+# Registering the TaskHistoryArchiveBlock model to make it manageable through the Django admin interface.
+admin.site.register(TaskHistoryArchiveBlock)
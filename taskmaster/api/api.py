@@ -1,13 +1,17 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Case, When, Value
+import datetime
 import json
 from django.http import JsonResponse, HttpResponseRedirect, Http404
 from django.contrib.auth.models import User
 from ..forms.forms import *
 from ..models import *
 from ..serializers.serializers import *
+from ..resets.resets import schedule_profile_resets
+from ..counters.counters import get_task_state, apply_task_change
+from django.db import transaction
+from ..timezones import canonicalize_timezone
 from drf_yasg.utils import swagger_auto_schema
 
 
@@ -81,41 +85,66 @@ class TaskViewSet(viewsets.ModelViewSet):
         if user_id:
             queryset = queryset.filter(user=user_id)  # Filter tasks by user ID
         if daily == 'true':
-            queryset = queryset.filter(daily=True)  # Filter for daily tasks
+            queryset = queryset.filter(task_type='daily')  # Filter for daily tasks
             # Order by completion status and execution time
-            queryset = queryset.order_by('completed', 'execution_time')
+            queryset = queryset.order_by(*TASK_LIST_ORDERING['daily'])
         if weekly == 'true':
-            queryset = queryset.filter(weekly=True)  # Filter for weekly tasks
-            day_order = {'Monday': 1, 'Tuesday': 2, 'Wednesday': 3,
-                         'Thursday': 4, 'Friday': 5, 'Saturday': 6, 'Sunday': 7}
-            queryset = queryset.order_by(
-                'completed',
-                Case(
-                    *[When(execution_day=day, then=Value(order))
-                      for day, order in day_order.items()],
-                    default=8,
-                    output_field=models.IntegerField()
-                ),
-                'execution_time',
-            )
+            queryset = queryset.filter(task_type='weekly')
+            # Order by completion status, weekday number and execution time, served by an index
+            queryset = queryset.order_by(*TASK_LIST_ORDERING['weekly'])
         if monthly == 'true':
             # Filter for monthly tasks
-            queryset = queryset.filter(monthly=True)
+            queryset = queryset.filter(task_type='monthly')
             # Order by completion status, execution date, and time
-            queryset = queryset.order_by(
-                'completed', 'execution_date', 'execution_time')
+            queryset = queryset.order_by(*TASK_LIST_ORDERING['monthly'])
         if completed == 'true':
             # Filter for completed tasks
             queryset = queryset.filter(completed=True)
         if days:
             # Filter by execution day
-            queryset = queryset.filter(execution_day=days.capitalize())
+            queryset = queryset.filter(
+                execution_weekday=get_weekday_number(days))
         if date:
             # Filter by execution date
             queryset = queryset.filter(execution_date=date)
 
         return queryset
 
+    def perform_create(self, serializer):
+        """
+        Save a new task and count it in the same transaction.
+
+        Parameters:
+            serializer: The validated task serializer.
+        """
+        with transaction.atomic():
+            task = serializer.save()
+            apply_task_change(None, get_task_state(task))
+
+    def perform_update(self, serializer):
+        """
+        Save an updated task and move its counts in the same transaction.
+
+        Parameters:
+            serializer: The validated task serializer bound to the existing task.
+        """
+        old_state = get_task_state(serializer.instance)
+        with transaction.atomic():
+            task = serializer.save()
+            apply_task_change(old_state, get_task_state(task))
+
+    def perform_destroy(self, instance):
+        """
+        Delete a task and uncount it in the same transaction.
+
+        Parameters:
+            instance: The task to delete.
+        """
+        old_state = get_task_state(instance)
+        with transaction.atomic():
+            instance.delete()
+            apply_task_change(old_state, None)
+
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
         """
@@ -129,12 +158,63 @@ class TaskViewSet(viewsets.ModelViewSet):
             Response with serialized task data.
         """
         task = self.get_object()
+        old_state = get_task_state(task)
         task.completed = not task.completed  # Toggle the 'completed' field
-        task.save()
+        with transaction.atomic():
+            task.save()
+            apply_task_change(old_state, get_task_state(task))
         serializer = TaskSerializer(task)
         return Response(serializer.data)
 
 
+class TaskCompletionRollupViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only ViewSet serving the completion rate series of the authenticated user from the completion rollup.
+    """
+    serializer_class = TaskCompletionRollupSerializer
+
+    # Every user only reads their own series
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        """
+        Get the queryset for TaskCompletionRollup model based on query parameters.
+
+        The rows are those of the authenticated user. It supports filtering by task type (daily, weekly,
+        monthly) and a date range given by since and until (YYYY-MM-DD, both included). Every period of the
+        range is a single row.
+
+        Returns:
+            QuerySet: The rollup rows ordered by date and task type.
+        """
+        queryset = TaskCompletionRollup.objects.filter(user=self.request.user).order_by('date', 'task_type')
+
+        # Extract query parameters from the request
+        task_type = self.request.query_params.get('task_type')
+        since = self.request.query_params.get('since')
+        until = self.request.query_params.get('until')
+
+        # Ensure the dates are valid
+        try:
+            since = datetime.date.fromisoformat(since) if since else None
+            until = datetime.date.fromisoformat(until) if until else None
+        except ValueError:
+            raise Http404
+
+        # Ensure the task type is one of the supported types
+        if task_type and task_type not in dict(TaskHistory.DATE_TYPE_CHOICES):
+            raise Http404
+
+        if task_type:
+            queryset = queryset.filter(task_type=task_type)
+        if since:
+            queryset = queryset.filter(date__gte=since)
+        if until:
+            queryset = queryset.filter(date__lte=until)
+
+        return queryset
+
+
 def set_timezone(request):
     """
     Set the timezone for the user's profile.
@@ -143,19 +223,23 @@ def set_timezone(request):
         request: HTTP request object.
 
     Returns:
-        JsonResponse with success status.
+        JsonResponse with success status, or status 400 if the timezone is not a known timezone.
     """
     if request.method == 'POST':
         # Get the JSON data from the request body
         data = json.loads(request.body)
 
-        # Extract the timeZone value from the JSON data
-        time_zone = data.get('timeZone')
+        # Extract the timeZone value from the JSON data and canonicalize it
+        time_zone = canonicalize_timezone(data.get('timeZone'))
+        if time_zone is None:
+            return JsonResponse({'success': False, 'error': 'Invalid timezone.'}, status=400)
         # Get the user's profile or create it if it doesn't exist
         profile, created = UserProfile.objects.get_or_create(user=request.user)
         if created:
             profile = profile[0]  # Access the created profile from the tuple
         profile.timezone = time_zone
+        # Move the next resets to the boundaries of the new timezone
+        schedule_profile_resets(profile)
         profile.save()
 
         return JsonResponse({'success': True})
@@ -0,0 +1,202 @@
+"""
+This module maintains the per-user task counters read by the dashboard and the task pages.
+
+Every write to a task records the task's counted state (owner, task type and completion) before and after the
+write, and applies the difference to the owner's TaskCounter row with a single UPDATE in the same transaction
+as the write. A user without a counter row yet gets one rebuilt from the tasks table, so the first write or
+read after an upgrade is always correct. rebuild_counters repairs any drift with one aggregate query.
+
+The dashboard caches its rendered statistics per user under a version token. Every change to the counters
+drops the user's token, so the next dashboard load renders under a new token and repeat loads in between
+read the cache without querying the tasks or the counters. The tokens are dropped by the reset commands and
+the scheduler too, so the cache must be shared by every process (see CACHES in the settings).
+"""
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+from ..models import *
+
+
+# Supported task types, matching Task.task_type
+TASK_TYPES = ('daily', 'weekly', 'monthly')
+
+# Counter fields of every task type
+COUNTER_FIELDS = {task_type: (f'{task_type}_total', f'{task_type}_completed')
+                  for task_type in TASK_TYPES}
+
+# Seconds the rendered dashboard statistics of a user stay cached
+STATS_CACHE_TIMEOUT = 3600
+
+
+def get_stats_version_key(user_id):
+    """
+    Return the cache key of the statistics version token of a user.
+    """
+    return f'taskmaster:stats-version:{user_id}'
+
+
+def get_stats_version(user_id):
+    """
+    Return the statistics version token of a user, creating a new one if it was dropped or evicted.
+
+    A token is never reused, so a fragment cached under an older token can never be read again.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        str: The version token.
+    """
+    key = get_stats_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Another request may create the token concurrently, keep the first one
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_stats_version(user_ids):
+    """
+    Invalidate the cached statistics of users after their counters changed, once the transaction commits.
+
+    Dropping the tokens after the commit ensures a dashboard rendered from the data before the commit is
+    never cached under the token read after it. A cache error is logged rather than raised, as the write
+    it follows has already committed.
+
+    Args:
+        user_ids (iterable): The IDs of the users.
+
+    Returns:
+        None
+    """
+    keys = [get_stats_version_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys), robust=True)
+
+
+def get_task_state(task):
+    """
+    Return the state of a task that is counted.
+
+    Args:
+        task (Task): The task, saved or not.
+
+    Returns:
+        tuple or None: The owner ID, task type and completion status, or None if the task is not counted.
+    """
+    if task is None or task.pk is None or task.task_type not in COUNTER_FIELDS:
+        return None
+    return (task.user_id, task.task_type, task.completed)
+
+
+def apply_task_change(old_state, new_state):
+    """
+    Apply the change of a task to the counters of its owner. Call it after the write, in the same transaction.
+
+    Args:
+        old_state (tuple or None): The counted state before the write, None for a new task.
+        new_state (tuple or None): The counted state after the write, None for a deleted task.
+
+    Returns:
+        None
+    """
+    deltas = {}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        user_id, task_type, completed = state
+        total_field, completed_field = COUNTER_FIELDS[task_type]
+        user_deltas = deltas.setdefault(user_id, {})
+        user_deltas[total_field] = user_deltas.get(total_field, 0) + sign
+        if completed:
+            user_deltas[completed_field] = user_deltas.get(completed_field, 0) + sign
+
+    for user_id, user_deltas in deltas.items():
+        changes = {field: F(field) + delta for field,
+                   delta in user_deltas.items() if delta}
+        if not changes:
+            continue
+        # Counters not created yet are rebuilt from the tasks, which already include the write
+        if not TaskCounter.objects.filter(user_id=user_id).update(**changes):
+            rebuild_counters([user_id])
+    bump_stats_version(deltas)
+
+
+def reset_completed_counters(task_type, user_ids):
+    """
+    Set the completed counter of a task type to zero after the tasks of the users were reset.
+
+    Args:
+        task_type (str): The type of task (daily, weekly, or monthly).
+        user_ids (iterable): The IDs of the users whose tasks were reset.
+
+    Returns:
+        int: The number of counter rows updated.
+    """
+    bump_stats_version(user_ids)
+    return TaskCounter.objects.filter(user_id__in=user_ids).update(
+        **{COUNTER_FIELDS[task_type][1]: 0})
+
+
+def count_tasks(user_ids=None):
+    """
+    Count the tasks of users per task type with a single conditional aggregate query.
+
+    Args:
+        user_ids (iterable, optional): The IDs of the users to count. Defaults to every user with tasks.
+
+    Returns:
+        dict: A mapping of user ID to a mapping of counter field to count.
+    """
+    tasks = Task.objects.order_by()
+    if user_ids is not None:
+        tasks = tasks.filter(user_id__in=user_ids)
+    aggregates = {}
+    for task_type, (total_field, completed_field) in COUNTER_FIELDS.items():
+        aggregates[total_field] = Count('pk', filter=Q(task_type=task_type))
+        aggregates[completed_field] = Count(
+            'pk', filter=Q(task_type=task_type, completed=True))
+    return {row.pop('user_id'): row for row in tasks.values('user_id').annotate(**aggregates)}
+
+
+def rebuild_counters(user_ids=None):
+    """
+    Recompute the counters of users from the tasks table.
+
+    Args:
+        user_ids (iterable, optional): The IDs of the users to rebuild. Defaults to every user.
+
+    Returns:
+        int: The number of counter rows written.
+    """
+    # Count every user in one pass rather than filtering on a list of every user ID
+    counts = count_tasks(user_ids)
+    if user_ids is None:
+        user_ids = User.objects.values_list('pk', flat=True)
+    user_ids = list(user_ids)
+    fields = [field for pair in COUNTER_FIELDS.values() for field in pair]
+
+    # Upsert the counters, users without tasks get zeros
+    TaskCounter.objects.bulk_create(
+        [TaskCounter(user_id=user_id, **counts.get(user_id, {})) for user_id in user_ids],
+        update_conflicts=True, unique_fields=['user'], update_fields=fields, batch_size=1000)
+    bump_stats_version(user_ids)
+    return len(user_ids)
+
+
+def get_counters(user):
+    """
+    Return the counters of a user with a primary key lookup, rebuilding them if they do not exist yet.
+
+    Args:
+        user (User): The user.
+
+    Returns:
+        TaskCounter: The counters of the user.
+    """
+    counters = TaskCounter.objects.filter(pk=user.pk).first()
+    if counters is None:
+        rebuild_counters([user.pk])
+        counters = TaskCounter.objects.get(pk=user.pk)
+    return counters
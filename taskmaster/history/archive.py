@@ -0,0 +1,176 @@
+"""
+This module moves old task history out of the database into compressed segment files on local disk.
+
+Every archive run appends to a new segment file. The history rows of a user and task type are written in date
+order as JSON lines, compressed with zlib in blocks of a bounded number of rows, and every block is recorded
+in TaskHistoryArchiveBlock with its offset, length and date range. The block is written and synced to disk
+before its rows are deleted in the same transaction as the index row, so an interrupted run leaves at most an
+unreferenced block at the end of a segment and never loses a row.
+
+Segments written to the archive directory are indexed by their name, so the directory can move along with the
+TASK_HISTORY_ARCHIVE_DIR setting; segments written anywhere else are indexed by their absolute path, so readers
+find them without knowing the directory of the run.
+
+Readers look the blocks of a user up in the index, memory-map the segment and only decompress the blocks
+overlapping the requested dates. Carried-forward rows are kept in the database, like in the compaction.
+"""
+import datetime
+import json
+import mmap
+import os
+import zlib
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import *
+
+
+# Maximum number of history rows per compressed block
+ARCHIVE_BLOCK_ROWS = 1000
+
+# History fields written to the segment files, besides the date and the text
+ARCHIVED_FIELDS = ('task_id', 'task_type', 'execution_day', 'execution_weekday',
+                   'execution_date', 'completed')
+
+
+def get_archive_dir():
+    """
+    Return the directory of the segment files.
+    """
+    return settings.TASK_HISTORY_ARCHIVE_DIR
+
+
+def get_segment_path(directory, name):
+    """
+    Return the path of a new segment file as stored in TaskHistoryArchiveBlock.
+
+    Args:
+        directory (str): The directory the segment file is written to.
+        name (str): The name of the segment file.
+
+    Returns:
+        str: The name of the segment in the archive directory, otherwise its absolute path.
+    """
+    if os.path.realpath(directory) == os.path.realpath(get_archive_dir()):
+        return name
+    return os.path.abspath(os.path.join(directory, name))
+
+
+def serialize_history(row):
+    """
+    Return a history row as one JSON line.
+
+    Args:
+        row (TaskHistory): The history row, with its snapshot.
+
+    Returns:
+        bytes: The JSON line, ending with a newline.
+    """
+    title, description = row.get_text()
+    data = {field: getattr(row, field) for field in ARCHIVED_FIELDS}
+    data.update(
+        date=row.date.isoformat(), title=title, description=description,
+        execution_time=row.execution_time.isoformat() if row.execution_time else None)
+    return json.dumps(data, separators=(',', ':')).encode() + b'\n'
+
+
+def deserialize_history(line):
+    """
+    Return an unsaved history row from a JSON line written by serialize_history.
+
+    Args:
+        line (bytes): The JSON line.
+
+    Returns:
+        TaskHistory: The history row, never saved.
+    """
+    data = json.loads(line)
+    data['date'] = datetime.date.fromisoformat(data['date'])
+    if data['execution_time']:
+        data['execution_time'] = datetime.time.fromisoformat(data['execution_time'])
+    return TaskHistory(**data)
+
+
+def archive_history(before, directory=None, block_rows=ARCHIVE_BLOCK_ROWS):
+    """
+    Move the task history before a date into a new segment file.
+
+    Args:
+        before (datetime.date): The first date kept in the database.
+        directory (str, optional): The directory of the segment files. Defaults to TASK_HISTORY_ARCHIVE_DIR.
+        block_rows (int, optional): The maximum number of rows per block. Defaults to 1000.
+
+    Returns:
+        int: The number of history rows archived.
+    """
+    directory = directory or get_archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    history = TaskHistory.objects.filter(date__lt=before, carry_forward=False)
+    user_ids = list(history.order_by('user_id').values_list('user_id', flat=True).distinct())
+    if not user_ids:
+        return 0
+
+    segment = get_segment_path(
+        directory, f'history-{before:%Y%m%d}-{timezone.now():%Y%m%d%H%M%S}-{os.getpid()}.seg')
+    archived = 0
+    # An absolute segment path is kept as is by the join
+    with open(os.path.join(directory, segment), 'ab') as segment_file:
+        for user_id in user_ids:
+            for task_type, _ in TaskHistory.DATE_TYPE_CHOICES:
+                while True:
+                    with transaction.atomic():
+                        rows = list(history.filter(user_id=user_id, task_type=task_type).select_related(
+                            'snapshot').order_by('date', 'pk')[:block_rows])
+                        if not rows:
+                            break
+                        block = zlib.compress(b''.join(serialize_history(row) for row in rows))
+                        # The block is on disk before its rows are deleted
+                        offset = segment_file.tell()
+                        segment_file.write(block)
+                        segment_file.flush()
+                        os.fsync(segment_file.fileno())
+                        TaskHistoryArchiveBlock.objects.create(
+                            user_id=user_id, task_type=task_type, segment=segment, offset=offset,
+                            length=len(block), first_date=rows[0].date, last_date=rows[-1].date, rows=len(rows))
+                        TaskHistory.objects.filter(pk__in=[row.pk for row in rows]).delete()
+                    archived += len(rows)
+    return archived
+
+
+def read_archived_history(user, task_type, since=None, until=None, directory=None):
+    """
+    Read the archived history of a user and task type.
+
+    Args:
+        user (User): The user.
+        task_type (str): The type of task (daily, weekly, or monthly).
+        since (datetime.date, optional): The first date (inclusive). Defaults to the oldest.
+        until (datetime.date, optional): The last date (inclusive). Defaults to the newest.
+        directory (str, optional): The directory of the segments indexed by name. Defaults to
+            TASK_HISTORY_ARCHIVE_DIR. Segments indexed by their absolute path are read from that path.
+
+    Returns:
+        generator: Unsaved TaskHistory rows in date order.
+    """
+    directory = directory or get_archive_dir()
+    blocks = TaskHistoryArchiveBlock.objects.filter(user=user, task_type=task_type)
+    if since is not None:
+        blocks = blocks.filter(last_date__gte=since)
+    if until is not None:
+        blocks = blocks.filter(first_date__lte=until)
+
+    # Segments stay mapped while their blocks are read
+    maps = {}
+    try:
+        for block in blocks.order_by('first_date', 'pk'):
+            if block.segment not in maps:
+                with open(os.path.join(directory, block.segment), 'rb') as segment_file:
+                    maps[block.segment] = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = zlib.decompress(maps[block.segment][block.offset:block.offset + block.length])
+            for line in data.splitlines():
+                row = deserialize_history(line)
+                if (since is None or row.date >= since) and (until is None or row.date <= until):
+                    yield row
+    finally:
+        for segment_map in maps.values():
+            segment_map.close()
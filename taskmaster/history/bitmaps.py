@@ -0,0 +1,204 @@
+"""
+This module stores the completion history of every task as two bitmaps per year.
+
+TaskCompletionBitmap keeps one bit per day of the year in a "scheduled" bitmap, set when the task was archived
+by a reset, and in a "completed" bitmap, set when it was archived as completed. The day of a bit is the date
+given to the task history of the reset, i.e. the start of the period for weekly and monthly tasks. A year of a
+task is two 46 byte values instead of up to 366 history rows, and streaks and completion rates are computed
+with bitwise operations on integers instead of scanning rows.
+"""
+import datetime
+from ..models import *
+
+
+# Number of bytes of a bitmap, one bit per day of a leap year
+BITMAP_BYTES = 46
+
+# Number of bitmap rows written per insert or update
+BITMAP_BATCH_SIZE = 1000
+
+
+def get_day_bit(day):
+    """
+    Return the bit index of a date within the bitmaps of its year.
+
+    Args:
+        day (datetime.date): The date.
+
+    Returns:
+        int: The day of the year minus one.
+    """
+    return day.timetuple().tm_yday - 1
+
+
+def to_int(bitmap):
+    """
+    Return the bits of a stored bitmap as an integer, the first day of the year being the lowest bit.
+    """
+    return int.from_bytes(bytes(bitmap or b''), 'little')
+
+
+def to_bytes(bits):
+    """
+    Return the integer bits of a bitmap as stored bytes.
+    """
+    return bits.to_bytes(BITMAP_BYTES, 'little')
+
+
+def get_range_mask(first_bit, last_bit):
+    """
+    Return a mask with the bits from first_bit to last_bit (inclusive) set.
+    """
+    if last_bit < first_bit:
+        return 0
+    return ((1 << (last_bit - first_bit + 1)) - 1) << first_bit
+
+
+def record_tasks(tasks, periods):
+    """
+    Set the bits of tasks about to be reset in their bitmaps, creating the bitmaps that do not exist yet.
+
+    The tasks are read in keyset-paginated batches, so a large batch of users never loads all of their tasks.
+
+    Args:
+        tasks (QuerySet): The tasks being archived, before their completion status is reset.
+        periods (dict): A mapping of task type to the date given to the task history being written.
+
+    Returns:
+        int: The number of tasks recorded.
+    """
+    last_pk = 0
+    recorded = 0
+    while True:
+        rows = list(tasks.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', 'user_id', 'task_type', 'completed')[:BITMAP_BATCH_SIZE])
+        if not rows:
+            break
+        _record_batch(rows, periods)
+        recorded += len(rows)
+        last_pk = rows[-1][0]
+    return recorded
+
+
+def _record_batch(rows, periods):
+    """
+    Set the bits of one batch of (pk, user_id, task_type, completed) task rows in their bitmaps.
+    """
+    # Fetch the existing bitmaps of the tasks for every year concerned in one query per year
+    by_year = {}
+    for pk, user_id, task_type, completed in rows:
+        by_year.setdefault(periods[task_type].year, []).append((pk, user_id, task_type, completed))
+
+    for year, year_rows in by_year.items():
+        existing = {bitmap.task_id: bitmap for bitmap in TaskCompletionBitmap.objects.filter(
+            year=year, task_id__in=[row[0] for row in year_rows])}
+        created = []
+        for pk, user_id, task_type, completed in year_rows:
+            bit = 1 << get_day_bit(periods[task_type])
+            bitmap = existing.get(pk)
+            if bitmap is None:
+                bitmap = TaskCompletionBitmap(task_id=pk, user_id=user_id, year=year,
+                                              scheduled=to_bytes(0), completed=to_bytes(0))
+                created.append(bitmap)
+            bitmap.scheduled = to_bytes(to_int(bitmap.scheduled) | bit)
+            if completed:
+                bitmap.completed = to_bytes(to_int(bitmap.completed) | bit)
+        TaskCompletionBitmap.objects.bulk_create(created, batch_size=BITMAP_BATCH_SIZE)
+        TaskCompletionBitmap.objects.bulk_update(list(existing.values()), ['scheduled', 'completed'],
+                                                 batch_size=BITMAP_BATCH_SIZE)
+
+
+def get_bits(task, since, until):
+    """
+    Return the scheduled and completed bits of a task between two dates, year by year.
+
+    Args:
+        task (Task): The task.
+        since (datetime.date): The first date (inclusive).
+        until (datetime.date): The last date (inclusive).
+
+    Returns:
+        list: (year, scheduled bits, completed bits) tuples, masked to the date range, oldest year first.
+    """
+    bitmaps = {bitmap.year: bitmap for bitmap in TaskCompletionBitmap.objects.filter(
+        task=task, year__gte=since.year, year__lte=until.year)}
+    bits = []
+    for year in range(since.year, until.year + 1):
+        bitmap = bitmaps.get(year)
+        if bitmap is None:
+            continue
+        first_bit = get_day_bit(since) if year == since.year else 0
+        last_bit = get_day_bit(until) if year == until.year else BITMAP_BYTES * 8 - 1
+        mask = get_range_mask(first_bit, last_bit)
+        bits.append((year, to_int(bitmap.scheduled) & mask, to_int(bitmap.completed) & mask))
+    return bits
+
+
+def get_completion_rate(task, since, until):
+    """
+    Return the share of the resets of a task between two dates where it was completed.
+
+    Args:
+        task (Task): The task.
+        since (datetime.date): The first date (inclusive).
+        until (datetime.date): The last date (inclusive).
+
+    Returns:
+        tuple: The number of completed and scheduled days.
+    """
+    completed = scheduled = 0
+    for _, scheduled_bits, completed_bits in get_bits(task, since, until):
+        scheduled += bin(scheduled_bits).count('1')
+        completed += bin(completed_bits & scheduled_bits).count('1')
+    return completed, scheduled
+
+
+def get_streak(task, until):
+    """
+    Return the number of consecutive resets of a task up to a date where it was completed.
+
+    Days without a reset of the task (e.g. the other days of a weekly task) do not break the streak.
+
+    Args:
+        task (Task): The task.
+        until (datetime.date): The last date (inclusive).
+
+    Returns:
+        int: The length of the current streak.
+    """
+    streak = 0
+    first_year = TaskCompletionBitmap.objects.filter(task=task).order_by('year').values_list(
+        'year', flat=True).first()
+    if first_year is None or first_year > until.year:
+        return 0
+    # Walk the years backwards, stopping at the first scheduled day that was missed
+    for year, scheduled_bits, completed_bits in reversed(get_bits(task, datetime.date(first_year, 1, 1), until)):
+        missed = scheduled_bits & ~completed_bits
+        if missed:
+            # Only the scheduled days above the most recent missed one count
+            return streak + bin(scheduled_bits >> missed.bit_length()).count('1')
+        streak += bin(scheduled_bits).count('1')
+    return streak
+
+
+def get_heatmap(task, year):
+    """
+    Return the completion of a task for every day of a year.
+
+    Args:
+        task (Task): The task.
+        year (int): The year.
+
+    Returns:
+        dict: A mapping of every date the task was reset to whether it was completed.
+    """
+    heatmap = {}
+    for _, scheduled_bits, completed_bits in get_bits(task, datetime.date(year, 1, 1), datetime.date(year, 12, 31)):
+        day = datetime.date(year, 1, 1)
+        while scheduled_bits:
+            if scheduled_bits & 1:
+                heatmap[day] = bool(completed_bits & 1)
+            scheduled_bits >>= 1
+            completed_bits >>= 1
+            day += datetime.timedelta(days=1)
+    return heatmap
@@ -0,0 +1,103 @@
+"""
+This module writes and reads the carry-forward task history.
+
+In the "changes" history store a reset only writes a TaskHistory row for a task whose archived state differs
+from its latest carried-forward row: its completion, its text snapshot, its task type or its execution fields.
+Such a row is marked carry_forward and stands for every later period of its task type until the next row of
+the same task, until the task was deleted (carried_until), or else until the user's last reset. Readers rebuild
+the period-by-period view with expand_history, so the write volume follows what users change, not the number
+of tasks times the number of periods.
+"""
+import heapq
+from django.db.models import Exists, OuterRef, Q, Subquery
+from ..models import *
+from ..timezones import get_next_period_start
+
+
+# Execution fields compared and copied into the task history for each task type
+STATE_FIELDS = {
+    'daily': ('execution_time',),
+    'weekly': ('execution_day', 'execution_time'),
+    'monthly': ('execution_date', 'execution_time'),
+}
+
+
+def get_changed_tasks(tasks):
+    """
+    Filter tasks down to those whose state differs from their latest carried-forward history row.
+
+    Args:
+        tasks (QuerySet): The tasks being archived, with a snapshot.
+
+    Returns:
+        QuerySet: The tasks that need a new history row, including tasks without any history yet.
+    """
+    latest = TaskHistory.objects.filter(task=OuterRef('pk')).order_by('-date', '-pk').values('pk')[:1]
+    tasks = tasks.annotate(latest_history=Subquery(latest))
+    # The latest row of the task is a carried-forward row with the same state
+    unchanged = Q()
+    for task_type, fields in STATE_FIELDS.items():
+        unchanged |= Q(task_type=task_type) & Q(Exists(TaskHistory.objects.filter(
+            pk=OuterRef('latest_history'), carry_forward=True, task_type=task_type,
+            completed=OuterRef('completed'), snapshot=OuterRef('snapshot'),
+            **{field: OuterRef(field) for field in fields})))
+    return tasks.exclude(unchanged)
+
+
+def get_last_resets(user):
+    """
+    Return the date of the last reset of every task type of a user, i.e. the latest history date.
+
+    Args:
+        user (User): The user.
+
+    Returns:
+        dict: A mapping of task type to the date of its last reset, or None if it was never reset.
+    """
+    profile = UserProfile.objects.filter(user=user).first()
+    return {task_type: getattr(profile, f'last_{task_type}_reset', None)
+            for task_type, _ in Task.TASK_TYPE_CHOICES}
+
+
+def expand_history(rows, last_resets):
+    """
+    Rebuild the period-by-period history from history rows, carrying forward the carried rows.
+
+    Rows written for every period are returned as they are. A carried-forward row is repeated for every
+    following period of its task type until the next row of the same task, the date it was closed at, or the
+    last reset of the task type.
+
+    Args:
+        rows (iterable): The history rows of a user, ordered by date.
+        last_resets (dict): A mapping of task type to the date of the user's last reset.
+
+    Returns:
+        generator: (date, row) pairs in date order.
+    """
+    heap = []
+    # Order of the latest row of every task, rows of earlier orders are superseded from its date on
+    latest = {}
+
+    def drain(before):
+        while heap and (before is None or heap[0][0] < before):
+            day, order, row, until = heapq.heappop(heap)
+            if row.task_id is not None and latest.get(row.task_id) != order:
+                continue
+            yield day, row
+            following = get_next_period_start(row.task_type, day)
+            if following <= until:
+                heapq.heappush(heap, (following, order, row, until))
+
+    for order, row in enumerate(rows):
+        # Emit everything carried up to the day before the row, it may supersede a row of its task
+        yield from drain(row.date)
+        if row.task_id is not None:
+            latest[row.task_id] = order
+        until = row.date
+        if row.carry_forward:
+            if row.carried_until is not None:
+                until = row.carried_until
+            elif row.task_id is not None:
+                until = max(row.date, last_resets.get(row.task_type) or row.date)
+        heapq.heappush(heap, (row.date, order, row, until))
+    yield from drain(None)
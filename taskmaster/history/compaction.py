@@ -0,0 +1,106 @@
+"""
+This module compacts old day-level task history into per-user, per-task, per-month summaries.
+
+History rows older than the retention age are read in primary key order in small chunks. Every chunk is
+folded into the matching TaskHistorySummary rows and deleted in the same short transaction, so a run can be
+interrupted at any point and re-run without counting a history row twice. Only whole months are compacted,
+so a month is never split between detailed rows and a summary.
+"""
+import datetime
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from ..models import *
+
+
+# Default age in days after which the history is compacted
+DEFAULT_COMPACT_AFTER_DAYS = 90
+
+# Number of history rows compacted and deleted per transaction
+DEFAULT_COMPACT_BATCH_SIZE = 1000
+
+# History columns identifying the task a row belongs to
+SUMMARY_KEY_FIELDS = ('user_id', 'task_type', 'title', 'description',
+                      'execution_day', 'execution_time', 'execution_date')
+TEXT_FREE_KEY_FIELDS = tuple(field for field in SUMMARY_KEY_FIELDS
+                             if field not in ('title', 'description'))
+
+
+def get_compaction_cutoff(today, days=DEFAULT_COMPACT_AFTER_DAYS):
+    """
+    Return the first date that is kept at day level.
+
+    Args:
+        today (datetime.date): The current date.
+        days (int, optional): The retention age in days. Defaults to 90.
+
+    Returns:
+        datetime.date: The 1st day of the month containing the date the given number of days ago.
+    """
+    return (today - datetime.timedelta(days=days)).replace(day=1)
+
+
+def compact_history(before, batch_size=DEFAULT_COMPACT_BATCH_SIZE):
+    """
+    Fold the task history before a date into monthly summaries and delete the original rows.
+
+    Args:
+        before (datetime.date): The first date to keep at day level, usually the 1st of a month.
+        batch_size (int, optional): The number of history rows compacted per transaction. Defaults to 1000.
+
+    Returns:
+        int: The number of history rows compacted.
+    """
+    compacted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            # Keyset pagination on the primary key, only the columns needed for the summaries,
+            # the text is read from the snapshot when the row has one. Carried-forward rows stand for
+            # an open-ended range of periods and are already compact, so they are kept as they are
+            rows = list(TaskHistory.objects.filter(
+                date__lt=before, pk__gt=last_pk, carry_forward=False).order_by('pk').annotate(
+                text_title=Coalesce('snapshot__title', 'title'),
+                text_description=Coalesce('snapshot__description', 'description'),
+            ).values('pk', 'completed', 'date', 'text_title', 'text_description',
+                     *TEXT_FREE_KEY_FIELDS)[:batch_size])
+            if not rows:
+                break
+            for row in rows:
+                row['title'] = row.pop('text_title')
+                row['description'] = row.pop('text_description')
+
+            # Group the chunk per task and month
+            groups = {}
+            for row in rows:
+                key = (*(row[field] for field in SUMMARY_KEY_FIELDS), row['date'].replace(day=1))
+                groups.setdefault(key, []).append(row)
+
+            for key, group in groups.items():
+                _merge_summary(key, group)
+
+            TaskHistory.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+        compacted += len(rows)
+        last_pk = rows[-1]['pk']
+    return compacted
+
+
+def _merge_summary(key, rows):
+    """
+    Add the history rows of one task and month to its summary, creating the summary if needed.
+    """
+    lookup = dict(zip((*SUMMARY_KEY_FIELDS, 'month'), key))
+    completed = sum(1 for row in rows if row['completed'])
+    first_date = min(row['date'] for row in rows)
+    last_date = max(row['date'] for row in rows)
+
+    summary = TaskHistorySummary.objects.select_for_update().filter(**lookup).first()
+    if summary is None:
+        TaskHistorySummary.objects.create(
+            **lookup, first_date=first_date, last_date=last_date,
+            days_completed=completed, days_missed=len(rows) - completed)
+        return
+    summary.first_date = min(summary.first_date, first_date)
+    summary.last_date = max(summary.last_date, last_date)
+    summary.days_completed += completed
+    summary.days_missed += len(rows) - completed
+    summary.save()
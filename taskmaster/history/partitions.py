@@ -0,0 +1,325 @@
+"""
+This module manages the monthly range partitions of the task history table on PostgreSQL.
+
+The task history table is partitioned by range on its date column, one partition per month named after the
+table and the month, e.g. taskmaster_taskhistory_p202407. Queries filtered by date only touch the partitions
+of the matching months, and retention detaches or drops whole partitions instead of deleting rows.
+
+A DEFAULT partition catches the rows of the months without a partition of their own, so a reset never fails
+when the partitions were not created ahead of time. Creating the partition of such a month later moves its
+rows out of the DEFAULT partition.
+
+PostgreSQL requires the primary key of a partitioned table to contain the partition key, so the converted
+table has a (id, date) primary key and keeps allocating IDs from its own sequence. The indexes and foreign
+keys keep the names Django gave them, so later migrations still find them.
+"""
+import datetime
+import re
+from django.db import connection, transaction
+from ..models import TaskHistory
+
+
+# Suffix of the monthly partitions, followed by the year and the month
+PARTITION_SUFFIX = '_p'
+
+# Suffix of the DEFAULT partition, never taken for a month by parse_partition_name
+DEFAULT_PARTITION_SUFFIX = '_pdefault'
+
+
+def get_history_table():
+    """
+    Return the name of the task history table.
+
+    Returns:
+        str: The database table of TaskHistory.
+    """
+    return TaskHistory._meta.db_table
+
+
+def get_month_start(day):
+    """
+    Return the 1st day of the month of a date.
+
+    Args:
+        day (datetime.date): Any date.
+
+    Returns:
+        datetime.date: The 1st day of its month.
+    """
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    """
+    Move the 1st day of a month forwards or backwards by a number of months.
+
+    Args:
+        month (datetime.date): The 1st day of a month.
+        count (int): The number of months to move, negative to move backwards.
+
+    Returns:
+        datetime.date: The 1st day of the resulting month.
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month, table=None):
+    """
+    Return the name of the partition holding a month.
+
+    Args:
+        month (datetime.date): The 1st day of the month.
+        table (str, optional): The partitioned table. Defaults to the task history table.
+
+    Returns:
+        str: The partition name, e.g. taskmaster_taskhistory_p202407.
+    """
+    return f'{table or get_history_table()}{PARTITION_SUFFIX}{month:%Y%m}'
+
+
+def parse_partition_name(name, table=None):
+    """
+    Return the month held by a partition, from its name.
+
+    Args:
+        name (str): The partition name.
+        table (str, optional): The partitioned table. Defaults to the task history table.
+
+    Returns:
+        datetime.date or None: The 1st day of the month, or None if the name is not a monthly partition.
+    """
+    match = re.fullmatch(re.escape(f'{table or get_history_table()}{PARTITION_SUFFIX}') +
+                         r'(\d{4})(\d{2})', name)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return None
+    return datetime.date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def get_months(start, end):
+    """
+    List the months between two months, both included.
+
+    Args:
+        start (datetime.date): The 1st day of the first month.
+        end (datetime.date): The 1st day of the last month.
+
+    Returns:
+        list: The 1st day of every month from start to end.
+    """
+    months = []
+    while start <= end:
+        months.append(start)
+        start = add_months(start, 1)
+    return months
+
+
+def get_expired_partitions(names, cutoff, table=None):
+    """
+    Select the partitions holding only dates before a cutoff.
+
+    Args:
+        names (iterable): The partition names.
+        cutoff (datetime.date): The first date to keep.
+        table (str, optional): The partitioned table. Defaults to the task history table.
+
+    Returns:
+        list: The names of the monthly partitions whose whole month is before the cutoff, oldest first.
+    """
+    expired = []
+    for name in names:
+        month = parse_partition_name(name, table)
+        # The month is expired when the next month starts on or before the cutoff
+        if month is not None and add_months(month, 1) <= cutoff:
+            expired.append((month, name))
+    return [name for _, name in sorted(expired)]
+
+
+def is_partitioned():
+    """
+    Check whether the task history table is partitioned.
+
+    Returns:
+        bool: True if the table is a partitioned PostgreSQL table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass(%s)", [get_history_table()])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions():
+    """
+    List the partitions attached to the task history table.
+
+    Returns:
+        list: The partition names, in no particular order.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)", [get_history_table()])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_default_partition_name(table=None):
+    """
+    Return the name of the DEFAULT partition.
+
+    Args:
+        table (str, optional): The partitioned table. Defaults to the task history table.
+
+    Returns:
+        str: The partition name, e.g. taskmaster_taskhistory_pdefault.
+    """
+    return f'{table or get_history_table()}{DEFAULT_PARTITION_SUFFIX}'
+
+
+def create_default_partition():
+    """
+    Create the DEFAULT partition if it does not exist yet.
+
+    Returns:
+        str: The partition name.
+    """
+    qn = connection.ops.quote_name
+    name = get_default_partition_name()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(get_history_table())} DEFAULT')
+    return name
+
+
+def create_partition(month):
+    """
+    Create the partition of a month if it does not exist yet.
+
+    Rows of the month already written to the DEFAULT partition are moved into the new partition, as
+    PostgreSQL refuses a partition overlapping rows of the DEFAULT partition.
+
+    Args:
+        month (datetime.date): The 1st day of the month.
+
+    Returns:
+        str: The partition name.
+    """
+    qn = connection.ops.quote_name
+    table = get_history_table()
+    name = get_partition_name(month)
+    default = get_default_partition_name()
+    bounds = [month, add_months(month, 1)]
+    create_sql = (f'CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(table)} '
+                  f"FOR VALUES FROM ('{bounds[0].isoformat()}') TO ('{bounds[1].isoformat()}')")
+    date_column = qn(TaskHistory._meta.get_field('date').column)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL', [name, default])
+        exists, has_default = cursor.fetchone()
+        moved = False
+        if not exists and has_default:
+            cursor.execute(
+                f'SELECT EXISTS (SELECT 1 FROM {qn(default)} WHERE {date_column} >= %s AND {date_column} < %s)',
+                bounds)
+            moved = cursor.fetchone()[0]
+        if not moved:
+            cursor.execute(create_sql)
+            return name
+
+        # Take the DEFAULT partition out while the rows of the month move to their partition
+        cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(default)}')
+        cursor.execute(create_sql)
+        cursor.execute(
+            f'INSERT INTO {qn(table)} SELECT * FROM {qn(default)} '
+            f'WHERE {date_column} >= %s AND {date_column} < %s', bounds)
+        cursor.execute(
+            f'DELETE FROM {qn(default)} WHERE {date_column} >= %s AND {date_column} < %s', bounds)
+        cursor.execute(f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(default)} DEFAULT')
+    return name
+
+
+def expire_partition(name, drop=False):
+    """
+    Detach an expired partition from the task history table, and optionally drop it.
+
+    Args:
+        name (str): The partition name.
+        drop (bool, optional): Drop the detached table instead of keeping it. Defaults to False.
+
+    Returns:
+        None
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'ALTER TABLE {qn(get_history_table())} DETACH PARTITION {qn(name)}')
+        if drop:
+            cursor.execute(f'DROP TABLE {qn(name)}')
+
+
+def convert_to_partitioned():
+    """
+    Convert the plain task history table into a table partitioned by month on its date column.
+
+    The existing rows are copied into monthly partitions and the old table is dropped, in one transaction.
+    The primary key, indexes and foreign keys are created once the rows are copied and the old table is
+    gone. The indexes and foreign keys are read from the catalog of the old table and recreated with the
+    same names and definitions, so they match whatever the migrations created.
+
+    Returns:
+        int: The number of partitions created for the existing rows.
+    """
+    qn = connection.ops.quote_name
+    table = get_history_table()
+    legacy = f'{table}_legacy'
+    sequence = f'{table}_part_id_seq'
+    date_column = TaskHistory._meta.get_field('date').column
+    id_column = TaskHistory._meta.pk.column
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Indexes other than the primary key, written against the table name, which the new table takes over
+        cursor.execute(
+            'SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i '
+            'WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary', [table])
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [table])
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ({qn(date_column)})')
+        # IDs keep counting from the old table
+        cursor.execute(f'CREATE SEQUENCE {qn(sequence)}')
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} ALTER COLUMN {qn(id_column)} SET DEFAULT nextval(%s)', [sequence])
+        cursor.execute(f'ALTER SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.{qn(id_column)}')
+        cursor.execute(
+            f'SELECT setval(%s, COALESCE((SELECT MAX({qn(id_column)}) FROM {qn(legacy)}), 0) + 1, false)',
+            [sequence])
+
+        # Create one partition per month holding rows and the DEFAULT partition, then move the rows
+        cursor.execute(f'SELECT MIN({qn(date_column)}), MAX({qn(date_column)}) FROM {qn(legacy)}')
+        first, last = cursor.fetchone()
+        months = get_months(get_month_start(first), get_month_start(last)) if first else []
+        for month in months:
+            create_partition(month)
+        create_default_partition()
+        cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}')
+        cursor.execute(f'DROP TABLE {qn(legacy)}')
+
+        # The primary key of a partitioned table has to contain the partition key
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(f"{table}_pkey")} '
+            f'PRIMARY KEY ({qn(id_column)}, {qn(date_column)})')
+        # Indexes on the parent table are created on every partition. Their names are free again now that the
+        # old table is dropped
+        for definition in indexes:
+            cursor.execute(definition)
+        # Foreign keys are not copied by LIKE
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+    return len(months)
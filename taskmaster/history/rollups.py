@@ -0,0 +1,100 @@
+"""
+This module maintains the per-user, per-period completion rollup of the tasks.
+
+The resets already select exactly the tasks archived for every user and period, so they count them with one
+grouped query and upsert one TaskCompletionRollup row per user, task type and period in the same transaction
+as the task history. Existing history is rolled up by backfill_rollups, from the same period-by-period history
+as the exports: the archived and database rows merged by date, with the carried-forward rows expanded.
+"""
+import heapq
+from itertools import groupby
+from django.db.models import Count, Q
+from ..models import *
+from .archive import read_archived_history
+from .carry import expand_history, get_last_resets
+
+
+# Number of rollup rows upserted per insert
+ROLLUP_BATCH_SIZE = 1000
+
+
+def _upsert_rollups(rollups):
+    """
+    Insert rollup rows, replacing the counts of rows that already exist.
+    """
+    return TaskCompletionRollup.objects.bulk_create(
+        rollups, batch_size=ROLLUP_BATCH_SIZE, update_conflicts=True,
+        unique_fields=['user', 'task_type', 'date'], update_fields=['completed', 'total'])
+
+
+def rollup_tasks(tasks, periods):
+    """
+    Roll up the completion of tasks about to be reset, per user and task type.
+
+    Args:
+        tasks (QuerySet): The tasks being archived, before their completion status is reset.
+        periods (dict): A mapping of task type to the date given to the task history being written.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    rows = tasks.order_by().values('user_id', 'task_type').annotate(
+        total=Count('pk'), done=Count('pk', filter=Q(completed=True)))
+    rollups = [TaskCompletionRollup(user_id=row['user_id'], task_type=row['task_type'],
+                                    date=periods[row['task_type']], completed=row['done'],
+                                    total=row['total'])
+               for row in rows]
+    _upsert_rollups(rollups)
+    return len(rollups)
+
+
+def iter_user_rollups(user_id):
+    """
+    Count the completion of every period of the history of a user, archived rows and carried rows included.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        generator: Unsaved TaskCompletionRollup rows, one per task type and period.
+    """
+    last_resets = get_last_resets(user_id)
+    for task_type, _ in TaskHistory.DATE_TYPE_CHOICES:
+        rows = TaskHistory.objects.filter(user_id=user_id, task_type=task_type).only(
+            'task_id', 'task_type', 'date', 'completed', 'carry_forward', 'carried_until').order_by(
+            'date', 'pk').iterator(chunk_size=ROLLUP_BATCH_SIZE)
+        history = heapq.merge(read_archived_history(user_id, task_type), rows, key=lambda row: row.date)
+        for date, period in groupby(expand_history(history, last_resets), key=lambda pair: pair[0]):
+            completed = [row.completed for _, row in period]
+            yield TaskCompletionRollup(user_id=user_id, task_type=task_type, date=date,
+                                       completed=sum(completed), total=len(completed))
+
+
+def backfill_rollups(user_ids=None):
+    """
+    Build the rollup of the existing task history.
+
+    Args:
+        user_ids (iterable, optional): The IDs of the users to roll up. Defaults to every user.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    if user_ids is None:
+        # Users with database history or archived history
+        user_ids = TaskHistory.objects.order_by().values('user_id').union(
+            TaskHistoryArchiveBlock.objects.order_by().values('user_id'))
+        user_ids = sorted(row['user_id'] for row in user_ids)
+
+    written = 0
+    batch = []
+    for rollup in (rollup for user_id in user_ids for rollup in iter_user_rollups(user_id)):
+        batch.append(rollup)
+        if len(batch) == ROLLUP_BATCH_SIZE:
+            _upsert_rollups(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        _upsert_rollups(batch)
+        written += len(batch)
+    return written
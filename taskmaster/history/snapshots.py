@@ -0,0 +1,89 @@
+"""
+This module deduplicates the title and description copied into the task history.
+
+Every distinct title and description is stored once in TaskSnapshot, identified by its content hash. Tasks
+reference the snapshot of their current text and the resets copy that reference into the history instead of
+the text, so a task that is never edited shares a single snapshot across all of its history rows.
+"""
+from django.db import transaction
+from ..models import *
+
+
+# Number of rows given a snapshot per transaction
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+def get_snapshots(texts):
+    """
+    Return the snapshots of titles and descriptions, creating the missing ones in bulk.
+
+    Args:
+        texts (iterable): (title, description) pairs.
+
+    Returns:
+        dict: A mapping of (title, description) to the ID of its snapshot.
+    """
+    hashes = {text: TaskSnapshot.get_content_hash(*text) for text in set(texts)}
+    existing = dict(TaskSnapshot.objects.filter(
+        content_hash__in=hashes.values()).values_list('content_hash', 'pk'))
+    missing = [TaskSnapshot(content_hash=content_hash, title=title, description=description)
+               for (title, description), content_hash in hashes.items() if content_hash not in existing]
+    if missing:
+        # Another writer may create the same snapshot concurrently, so read the IDs back
+        TaskSnapshot.objects.bulk_create(missing, ignore_conflicts=True)
+        existing = dict(TaskSnapshot.objects.filter(
+            content_hash__in=hashes.values()).values_list('content_hash', 'pk'))
+    return {text: existing[content_hash] for text, content_hash in hashes.items()}
+
+
+def assign_task_snapshots(tasks, batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Give a snapshot to the tasks that do not have one, e.g. tasks written before snapshots or with bulk_create.
+
+    Args:
+        tasks (QuerySet): The tasks to check.
+        batch_size (int, optional): The number of tasks updated per transaction. Defaults to 1000.
+
+    Returns:
+        int: The number of tasks updated.
+    """
+    return _assign_snapshots(tasks.filter(snapshot__isnull=True), {}, batch_size)
+
+
+def dedupe_history(batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Move the title and description of the history rows without snapshot into snapshots.
+
+    Args:
+        batch_size (int, optional): The number of history rows updated per transaction. Defaults to 1000.
+
+    Returns:
+        int: The number of history rows updated.
+    """
+    return _assign_snapshots(TaskHistory.objects.filter(snapshot__isnull=True),
+                             {'title': '', 'description': ''}, batch_size)
+
+
+def _assign_snapshots(rows, cleared, batch_size):
+    """
+    Point rows at the snapshot of their text in keyset-paginated batches, clearing the given fields.
+    """
+    model = rows.model
+    last_pk = 0
+    updated = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', 'title', 'description')[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            snapshots = get_snapshots((title, description) for _, title, description in batch)
+            # One update per distinct snapshot of the batch
+            pks_by_snapshot = {}
+            for pk, title, description in batch:
+                pks_by_snapshot.setdefault(snapshots[(title, description)], []).append(pk)
+            for snapshot_id, pks in pks_by_snapshot.items():
+                model.objects.filter(pk__in=pks).update(snapshot_id=snapshot_id, **cleared)
+        updated += len(batch)
+        last_pk = batch[-1][0]
+    return updated
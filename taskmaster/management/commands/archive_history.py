@@ -0,0 +1,48 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from ...history.archive import archive_history, get_archive_dir, ARCHIVE_BLOCK_ROWS
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = ('Move the task history before a date out of the database into compressed segment files, '
+            'indexed per user and task type')
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the archive command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--before', required=True,
+            help='Archive the history before this date, as YYYY-MM-DD.')
+        parser.add_argument(
+            '--directory',
+            help='Directory of the segment files (default: the TASK_HISTORY_ARCHIVE_DIR setting). '
+                 'Segments written elsewhere are indexed by their absolute path.')
+        parser.add_argument(
+            '--block-rows', type=int, default=ARCHIVE_BLOCK_ROWS,
+            help=f'Maximum number of history rows per compressed block (default: {ARCHIVE_BLOCK_ROWS}).')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the archive command.
+
+        The history of every user and task type is written block by block to a new segment file, and every
+        block is deleted from the database in the same transaction as its index row.
+        """
+        try:
+            before = datetime.date.fromisoformat(kwargs['before'])
+        except ValueError:
+            raise CommandError(f'Invalid date: {kwargs["before"]}. Use the YYYY-MM-DD format.')
+        if kwargs['block_rows'] < 1:
+            raise CommandError('The number of rows per block must be positive.')
+
+        directory = kwargs['directory'] or get_archive_dir()
+        archived = archive_history(before, directory, kwargs['block_rows'])
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS(
+            f'{archived} history rows before {before:%d-%m-%Y} archived to {directory}.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from ...history.rollups import backfill_rollups
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = 'Build the completion rollup of the existing task history'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the backfill command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='ID of a user to roll up, can be repeated (default: every user).')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the backfill command.
+
+        The history of every user is read like the exports, archived rows and carried-forward rows included,
+        and counted per task type and period. The rollup rows are upserted, so running it again only rewrites
+        the same counts.
+        """
+        written = backfill_rollups(kwargs['user_ids'])
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS(
+            f'{written} completion rollup rows written.'))
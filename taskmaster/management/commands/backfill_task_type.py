@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from ...models import Task, TaskHistory, WEEKDAYS
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = ('Fill Task.task_type from the daily, weekly and monthly flags, and the weekday number of tasks '
+            'and task history from their execution day, in small batches, safe on a live table')
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the backfill command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows updated per transaction (default: 1000).')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the backfill command.
+
+        Rows missing a derived column are walked in primary key order. Every batch is updated in its own short
+        transaction, so the tables are never locked for long and the command can be interrupted and re-run.
+        """
+        updated = 0
+        for model in (Task, TaskHistory):
+            updated += self.backfill(model, kwargs['batch_size'])
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS(
+            f'Task type and weekday filled for {updated} rows.'))
+
+    def backfill(self, model, batch_size):
+        """
+        Fill the derived columns of one model batch by batch.
+
+        Args:
+            model (Model): Task or TaskHistory.
+            batch_size (int): The number of rows updated per transaction.
+
+        Returns:
+            int: The number of rows updated.
+        """
+        missing = Q(execution_weekday__isnull=True, execution_day__isnull=False)
+        if model is Task:
+            missing |= Q(task_type__isnull=True)
+
+        last_pk = 0
+        updated = 0
+        while True:
+            # Keyset pagination on the primary key, only rows still missing a derived column
+            pks = list(model.objects.filter(missing, pk__gt=last_pk).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                if model is Task:
+                    for task_type, _ in Task.TASK_TYPE_CHOICES:
+                        model.objects.filter(
+                            pk__in=pks, task_type__isnull=True, **{task_type: True}).update(task_type=task_type)
+                for number, day in enumerate(WEEKDAYS, start=1):
+                    model.objects.filter(
+                        pk__in=pks, execution_weekday__isnull=True, execution_day=day).update(
+                        execution_weekday=number)
+            updated += len(pks)
+            last_pk = pks[-1]
+        return updated
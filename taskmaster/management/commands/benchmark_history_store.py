@@ -0,0 +1,130 @@
+import datetime
+import random
+import time
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from ...models import *  # Import models for database operations
+from ...history.bitmaps import get_completion_rate, get_streak, get_day_bit, to_bytes
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to compare the storage and query time of the two history stores.
+    This command seeds the completion history of daily tasks both as TaskHistory rows and as
+    TaskCompletionBitmap rows, then times a streak and a completion rate query over each store.
+    Run it against a development database.
+    """
+
+    help = 'Compare the streak and completion rate queries over history rows and completion bitmaps'
+
+    # Username of the seeded user, used to clean it up afterwards
+    username = 'benchmark_history_store'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the benchmark.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument('--tasks', type=int, default=20,
+                            help='Number of daily tasks to seed (default: 20).')
+        parser.add_argument('--days', type=int, default=730,
+                            help='Number of days of history to seed per task (default: 730).')
+
+    def handle(self, *args, **options):
+        """
+        Handle method for the benchmark command.
+        Seeds the history, times the queries over both stores and removes the seeded data.
+
+        Args:
+            *args: Positional arguments.
+            **options: Keyword arguments.
+
+        Returns:
+            None
+        """
+        until = datetime.date.today()
+        since = until - datetime.timedelta(days=options['days'] - 1)
+        tasks = self._seed(options['tasks'], since, until)
+        try:
+            start = time.perf_counter()
+            for task in tasks:
+                self._row_streak(task, until)
+                self._row_completion_rate(task, since, until)
+            rows_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for task in tasks:
+                get_streak(task, until)
+                get_completion_rate(task, since, until)
+            bitmaps_elapsed = time.perf_counter() - start
+
+            self.stdout.write(
+                f'store=rows rows={TaskHistory.objects.filter(user__username=self.username).count()} '
+                f'seconds={rows_elapsed:.3f}')
+            self.stdout.write(
+                f'store=bitmaps rows={TaskCompletionBitmap.objects.filter(user__username=self.username).count()} '
+                f'seconds={bitmaps_elapsed:.3f} speedup={rows_elapsed / bitmaps_elapsed:.2f}')
+        finally:
+            # Remove the seeded user, its tasks, history and bitmaps
+            User.objects.filter(username=self.username).delete()
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS('History store benchmark finished'))
+
+    def _seed(self, num_tasks, since, until):
+        """
+        Seed a user with daily tasks completed on random days, in both history stores.
+        """
+        user = User.objects.create(username=self.username, password=make_password(None))
+        tasks = [Task.objects.create(user=user, title=f'Task {index}', description='',
+                                     execution_time='08:00', daily=True)
+                 for index in range(num_tasks)]
+
+        history = []
+        bitmaps = {}
+        for task in tasks:
+            day = since
+            while day <= until:
+                completed = random.random() < 0.8
+                history.append(TaskHistory(user=user, snapshot_id=task.snapshot_id, task_type='daily',
+                                           execution_time=task.execution_time, completed=completed, date=day))
+                scheduled_bits, completed_bits = bitmaps.get((task.pk, day.year), (0, 0))
+                bit = 1 << get_day_bit(day)
+                bitmaps[(task.pk, day.year)] = (scheduled_bits | bit,
+                                                completed_bits | bit if completed else completed_bits)
+                day += datetime.timedelta(days=1)
+        TaskHistory.objects.bulk_create(history, batch_size=5000)
+        TaskCompletionBitmap.objects.bulk_create([
+            TaskCompletionBitmap(task_id=task_id, user=user, year=year,
+                                 scheduled=to_bytes(scheduled_bits), completed=to_bytes(completed_bits))
+            for (task_id, year), (scheduled_bits, completed_bits) in bitmaps.items()])
+        return tasks
+
+    def _row_history(self, task):
+        """
+        Return the history rows of a task, matched on the snapshot of its text.
+        """
+        return TaskHistory.objects.filter(user_id=task.user_id, snapshot_id=task.snapshot_id,
+                                          task_type=task.task_type)
+
+    def _row_streak(self, task, until):
+        """
+        Compute the current streak of a task by scanning its history rows, newest first.
+        """
+        streak = 0
+        for completed in self._row_history(task).filter(date__lte=until).order_by(
+                '-date').values_list('completed', flat=True).iterator():
+            if not completed:
+                break
+            streak += 1
+        return streak
+
+    def _row_completion_rate(self, task, since, until):
+        """
+        Compute the completion rate of a task by counting its history rows.
+        """
+        rows = self._row_history(task).filter(date__gte=since, date__lte=until)
+        return rows.filter(completed=True).count(), rows.count()
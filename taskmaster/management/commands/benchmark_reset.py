@@ -0,0 +1,133 @@
+import datetime
+import random
+import time
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+# Import functions for generating random data
+from ...seeders.database_seeder import randomword, randomSentence
+from ...models import *  # Import models for database operations
+from ...resets.resets import (reset_tasks, ResetReport, DEFAULT_BATCH_SIZE, ARCHIVE_MODES, DEFAULT_ARCHIVE_MODE,
+                              NEXT_RESET_FIELDS)
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to benchmark the task reset over seeded data.
+    This command seeds users and tasks, runs the reset with an increasing number of worker processes
+    and prints the duration and speedup of each run. Run it against a development database.
+    """
+
+    help = 'Benchmark the task reset over seeded data with an increasing number of worker processes'
+
+    # Prefix of the usernames of the seeded users, used to clean them up afterwards
+    username_prefix = 'benchmark_reset_'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the benchmark.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Number of users to seed (default: 1000).')
+        parser.add_argument('--tasks-per-user', type=int, default=20,
+                            help='Number of tasks to seed per user (default: 20).')
+        parser.add_argument('--workers', default='1,2,4',
+                            help='Comma-separated worker counts to benchmark (default: 1,2,4).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Number of users reset per transaction (default: {DEFAULT_BATCH_SIZE}).')
+        parser.add_argument('--archive-mode', choices=ARCHIVE_MODES, default=DEFAULT_ARCHIVE_MODE,
+                            help=f'Archive mode of the reset (default: {DEFAULT_ARCHIVE_MODE}).')
+        parser.add_argument('--timezone', default='Asia/Jakarta',
+                            help='Timezone of the seeded users (default: Asia/Jakarta).')
+
+    def handle(self, *args, **options):
+        """
+        Handle method for the benchmark command.
+        Seeds the data, times one reset per worker count and removes the seeded data.
+
+        Args:
+            *args: Positional arguments.
+            **options: Keyword arguments.
+
+        Returns:
+            None
+        """
+        worker_counts = [int(workers) for workers in options['workers'].split(',')]
+
+        self._seed(options['users'], options['tasks_per_user'], options['timezone'])
+        try:
+            baseline = None
+            for workers in worker_counts:
+                # Make every seeded user overdue again with completed tasks and no history
+                self._rewind()
+
+                report = ResetReport()
+                start = time.perf_counter()
+                reset_tasks(batch_size=options['batch_size'], workers=workers,
+                            archive_mode=options['archive_mode'], report=report)
+                elapsed = time.perf_counter() - start
+
+                baseline = baseline or elapsed
+                # The number of users reset shows every run did the same work
+                self.stdout.write(
+                    f'workers={workers} users={report.counters["users_reset"]} seconds={elapsed:.3f} '
+                    f'users_per_second={options["users"] / elapsed:.1f} speedup={baseline / elapsed:.2f}')
+        finally:
+            # Remove the seeded users, their profiles, tasks and history
+            User.objects.filter(username__startswith=self.username_prefix).delete()
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS('Reset benchmark finished'))
+
+    def _seed(self, num_users, tasks_per_user, zone):
+        """
+        Seed users, profiles and tasks with bulk inserts.
+        """
+        User.objects.bulk_create([
+            User(username=f'{self.username_prefix}{index}', password=make_password(None))
+            for index in range(num_users)
+        ])
+        user_ids = list(User.objects.filter(
+            username__startswith=self.username_prefix).values_list('id', flat=True))
+
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=user_id, timezone=zone) for user_id in user_ids])
+
+        # Spread the tasks evenly over the task types
+        descriptions = [randomSentence() for _ in range(10)]
+        Task.objects.bulk_create([
+            Task(
+                user_id=user_id,
+                title=randomword(),
+                description=random.choice(descriptions),
+                execution_time=f'{random.randint(0, 23):02d}:{random.randint(0, 59):02d}',
+                daily=index % 3 == 0,
+                weekly=index % 3 == 1,
+                monthly=index % 3 == 2,
+                # bulk_create skips save(), so the task type and weekday are set explicitly
+                task_type=('daily', 'weekly', 'monthly')[index % 3],
+                execution_day=WEEKDAYS[index % 7] if index % 3 == 1 else None,
+                execution_weekday=index % 7 + 1 if index % 3 == 1 else None,
+                execution_date=random.randint(1, 31) if index % 3 == 2 else None,
+            )
+            for user_id in user_ids for index in range(tasks_per_user)
+        ], batch_size=5000)
+
+    def _rewind(self):
+        """
+        Make every seeded user overdue for all task types again.
+        """
+        long_ago = datetime.date(2000, 1, 1)
+        # Clear the scheduled resets too, or the scheduler query finds no zone due after the first run
+        UserProfile.objects.filter(user__username__startswith=self.username_prefix).update(
+            last_daily_reset=long_ago, last_weekly_reset=long_ago, last_monthly_reset=long_ago,
+            **{field: None for field in NEXT_RESET_FIELDS.values()})
+        Task.objects.filter(user__username__startswith=self.username_prefix).update(
+            completed=True)
+        TaskHistory.objects.filter(
+            user__username__startswith=self.username_prefix).delete()
+        TaskCompletionRollup.objects.filter(
+            user__username__startswith=self.username_prefix).delete()
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ...history.compaction import (compact_history, get_compaction_cutoff, DEFAULT_COMPACT_AFTER_DAYS,
+                                   DEFAULT_COMPACT_BATCH_SIZE)
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = 'Compact the task history older than a retention age into per-user, per-task monthly summaries'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the compaction command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--older-than-days', type=int, default=DEFAULT_COMPACT_AFTER_DAYS,
+            help='Compact the whole months older than this many days '
+                 f'(default: {DEFAULT_COMPACT_AFTER_DAYS}).')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_COMPACT_BATCH_SIZE,
+            help='Number of history rows compacted and deleted per transaction '
+                 f'(default: {DEFAULT_COMPACT_BATCH_SIZE}).')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the compaction command.
+
+        The history before the 1st of the month containing the retention cutoff is folded into monthly
+        summaries, chunk by chunk, and the original rows are deleted in the same transaction as their summary.
+        """
+        if kwargs['older_than_days'] < 0 or kwargs['batch_size'] < 1:
+            raise CommandError(
+                'The retention age cannot be negative and the batch size must be positive.')
+
+        before = get_compaction_cutoff(
+            timezone.now().date(), kwargs['older_than_days'])
+        compacted = compact_history(before, kwargs['batch_size'])
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS(
+            f'{compacted} history rows before {before:%d-%m-%Y} compacted into monthly summaries.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from ...history.snapshots import assign_task_snapshots, dedupe_history, SNAPSHOT_BATCH_SIZE
+from ...models import Task
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = 'Move the title and description of existing tasks and task history into deduplicated snapshots'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the dedupe command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--batch-size', type=int, default=SNAPSHOT_BATCH_SIZE,
+            help=f'Number of rows updated per transaction (default: {SNAPSHOT_BATCH_SIZE}).')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the dedupe command.
+
+        Tasks and history rows without snapshot are walked in primary key order. Every batch creates the
+        missing snapshots and points its rows at them in one short transaction, clearing the copied text of
+        the history rows, so the command can be interrupted and re-run.
+        """
+        tasks = assign_task_snapshots(Task.objects.all(), kwargs['batch_size'])
+        history = dedupe_history(kwargs['batch_size'])
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshots assigned to {tasks} tasks and {history} history rows.'))
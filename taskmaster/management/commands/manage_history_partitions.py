@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from ...history.partitions import (add_months, convert_to_partitioned, create_default_partition, create_partition,
+                                   expire_partition, get_expired_partitions, get_month_start, get_months,
+                                   is_partitioned, list_partitions)
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = 'Create upcoming monthly partitions of the task history and detach or drop expired ones (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the partition command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Convert the plain task history table into a partitioned table first (one-time, locks the table).')
+        parser.add_argument(
+            '--ahead', type=int, default=3,
+            help='Number of months after the current one to create partitions for (default: 3).')
+        parser.add_argument(
+            '--retention-months', type=int,
+            help='Detach the partitions of the months older than this many months (default: keep everything).')
+        parser.add_argument(
+            '--drop', action='store_true',
+            help='Drop the expired partitions instead of only detaching them.')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the partition command.
+
+        Meant to run daily or weekly from cron, so the partitions of the coming months always exist before
+        the resets write history into them. Expired months are removed by detaching their partition, a
+        metadata operation, instead of deleting their rows.
+        """
+        if connection.vendor != 'postgresql':
+            raise CommandError('Task history partitions require PostgreSQL.')
+
+        if not is_partitioned():
+            if not kwargs['convert']:
+                raise CommandError(
+                    'The task history table is not partitioned yet, run with --convert first.')
+            converted = convert_to_partitioned()
+            self.stdout.write(
+                f'Task history converted into {converted} monthly partitions.')
+
+        # Rows of months without a partition go to the DEFAULT partition instead of failing
+        create_default_partition()
+
+        # Create the partitions of the current month and the months ahead
+        current = get_month_start(timezone.now().date())
+        for month in get_months(current, add_months(current, kwargs['ahead'])):
+            create_partition(month)
+
+        # Detach or drop the partitions of the expired months
+        expired = []
+        if kwargs['retention_months'] is not None:
+            cutoff = add_months(current, -kwargs['retention_months'])
+            expired = get_expired_partitions(list_partitions(), cutoff)
+            for name in expired:
+                expire_partition(name, drop=kwargs['drop'])
+
+        # Print a success message to the console
+        action = 'dropped' if kwargs['drop'] else 'detached'
+        self.stdout.write(self.style.SUCCESS(
+            f'Task history partitions ready until {add_months(current, kwargs["ahead"]):%Y-%m}, '
+            f'{len(expired)} expired partitions {action}.'))
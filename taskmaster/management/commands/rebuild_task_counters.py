@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from ...counters.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = 'Recompute the per-user task counters from the tasks table to repair any drift'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the rebuild command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='ID of a user to rebuild, can be repeated (default: every user).')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the rebuild command.
+
+        The counters are counted with a single conditional aggregate over the tasks and upserted.
+        """
+        rebuilt = rebuild_counters(kwargs['user_ids'])
+
+        # Print a success message to the console
+        self.stdout.write(self.style.SUCCESS(
+            f'Task counters rebuilt for {rebuilt} users.'))
@@ -0,0 +1,88 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from ...resets.resets import reset_tasks, ResetReport, TASK_TYPES, DEFAULT_BATCH_SIZE, ARCHIVE_MODES, DEFAULT_ARCHIVE_MODE
+from ...resets.resets import HISTORY_STORES, DEFAULT_HISTORY_STORE
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = 'Reset completed daily, weekly and monthly tasks for all users in a single pass based on user timezone'
+
+    # Task types reset when --types is not given
+    default_task_types = TASK_TYPES
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the reset command.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--types', default=','.join(self.default_task_types),
+            help=f'Comma-separated task types to reset (default: {",".join(self.default_task_types)}).')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help=f'Number of users archived and reset per transaction (default: {DEFAULT_BATCH_SIZE}).')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes sharing the users, each with its own database connection (default: 1).')
+        parser.add_argument(
+            '--archive-mode', choices=ARCHIVE_MODES, default=DEFAULT_ARCHIVE_MODE,
+            help='Stream task rows through Python, or copy them into the history with INSERT ... SELECT '
+                 f'without leaving the database (default: {DEFAULT_ARCHIVE_MODE}).')
+        parser.add_argument(
+            '--history-store', choices=HISTORY_STORES, default=DEFAULT_HISTORY_STORE,
+            help='Archive every task as a history row, only the tasks whose state changed as carried-forward '
+                 'history rows, every task as a bit in its yearly completion bitmap, or rows and bitmaps '
+                 f'(default: {DEFAULT_HISTORY_STORE}).')
+        parser.add_argument(
+            '--report', metavar='PATH',
+            help='Write a JSON report of the run (timezones, users, rows, phase durations, peak memory) '
+                 'to PATH, or to stdout with "-".')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Compute the report without archiving or resetting anything.')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the task reset command.
+
+        The timezones of all user profiles are scanned once. For each timezone the current day, week and month
+        are computed once, the due task types are decided per user from the reset watermarks, and the archive
+        and update statements of every due task type are issued together. With --workers, the users are
+        partitioned by user ID across a pool of processes.
+        """
+        # Parse and validate the requested task types
+        task_types = [task_type.strip().lower()
+                      for task_type in kwargs['types'].split(',') if task_type.strip()]
+        invalid = [task_type for task_type in task_types if task_type not in TASK_TYPES]
+        if invalid or not task_types:
+            raise CommandError(
+                f'Invalid task types: {", ".join(invalid)}. Choose from: {", ".join(TASK_TYPES)}.')
+
+        # Archive and reset every due task type in a single pass
+        report = ResetReport(kwargs['dry_run'])
+        reset_tasks(task_types, batch_size=kwargs['batch_size'], workers=kwargs['workers'],
+                    archive_mode=kwargs['archive_mode'], report=report, dry_run=kwargs['dry_run'],
+                    history_store=kwargs['history_store'])
+        report_json = json.dumps(
+            {'task_types': task_types, **report.as_dict()})
+
+        # The JSON report replaces the success message when written to stdout
+        if kwargs['report'] == '-':
+            self.stdout.write(report_json)
+            return
+        if kwargs['report']:
+            with open(kwargs['report'], 'w') as report_file:
+                report_file.write(report_json + '\n')
+
+        # Print a success message to the console, e.g. "Daily and weekly tasks reset successfully."
+        names = ', '.join(task_types[:-1]) + \
+            ' and ' + task_types[-1] if len(task_types) > 1 else task_types[0]
+        if kwargs['dry_run']:
+            self.stdout.write(
+                f'{names.capitalize()} tasks would reset {report.counters["users_reset"]} users (dry run).')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{names.capitalize()} tasks reset successfully.'))
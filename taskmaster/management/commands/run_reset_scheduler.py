@@ -0,0 +1,70 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from ...resets.resets import (ResetScheduler, ARCHIVE_MODES, DEFAULT_ARCHIVE_MODE, DEFAULT_BATCH_SIZE,
+                              DEFAULT_HISTORY_STORE, HISTORY_STORES)
+
+
+class Command(BaseCommand):
+    # Provide a brief description of the command's purpose
+    help = 'Run a long-lived scheduler that resets tasks at the next local midnight, Monday or 1st of the month of each timezone'
+
+    def add_arguments(self, parser):
+        """
+        Add the command line arguments of the scheduler.
+
+        Args:
+            parser (ArgumentParser): The argument parser of the command.
+        """
+        parser.add_argument(
+            '--refresh-interval', type=int, default=60,
+            help='Maximum number of seconds to sleep before reloading the timezones in use (default: 60).')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help=f'Number of users archived and reset per transaction (default: {DEFAULT_BATCH_SIZE}).')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes sharing the users of each reset (default: 1).')
+        parser.add_argument(
+            '--archive-mode', choices=ARCHIVE_MODES, default=DEFAULT_ARCHIVE_MODE,
+            help=f'Archive mode of the resets, as for reset_tasks (default: {DEFAULT_ARCHIVE_MODE}).')
+        parser.add_argument(
+            '--history-store', choices=HISTORY_STORES, default=DEFAULT_HISTORY_STORE,
+            help=f'History store of the resets, as for reset_tasks (default: {DEFAULT_HISTORY_STORE}).')
+
+    def handle(self, *args, **options):
+        """
+        Handle the reset scheduler command.
+
+        The scheduler keeps a heap of the next reset boundary of every timezone in use and sleeps until the
+        nearest one, then runs the daily, weekly or monthly reset only for the affected timezones.
+        The timezones in use are reloaded at least every refresh interval, so profiles moved to a new
+        timezone through set_timezone are scheduled without restarting the command. Every reload first
+        catches up the profiles already overdue, e.g. after the scheduler was stopped across a boundary.
+        """
+        refresh_interval = options['refresh_interval']
+        scheduler = ResetScheduler(batch_size=options['batch_size'], workers=options['workers'],
+                                   archive_mode=options['archive_mode'], history_store=options['history_store'])
+
+        self.stdout.write('Reset scheduler started.')
+        try:
+            while True:
+                # Drop database connections that went stale while sleeping
+                close_old_connections()
+
+                # Pick up new timezones, then reset every timezone whose boundary has passed
+                now = timezone.now()
+                for zone in scheduler.refresh(now):
+                    self.stdout.write(self.style.SUCCESS(f'Overdue tasks caught up for {zone}.'))
+                for zone, task_type in scheduler.run_pending(now):
+                    self.stdout.write(self.style.SUCCESS(
+                        f'{task_type.capitalize()} tasks reset successfully for {zone}.'))
+
+                # Sleep until the nearest boundary, but never longer than the refresh interval
+                wait = scheduler.seconds_until_next(timezone.now())
+                time.sleep(refresh_interval if wait is None else min(
+                    wait, refresh_interval))
+        except KeyboardInterrupt:
+            # Stop gracefully on Ctrl+C
+            self.stdout.write('Reset scheduler stopped.')
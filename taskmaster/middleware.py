@@ -1,5 +1,6 @@
 from django.utils import timezone
 from .models import UserProfile
+from .timezones import DEFAULT_TIMEZONE, get_timezone, is_valid_timezone
 
 
 class TimezoneMiddleware:
@@ -42,11 +43,13 @@ class TimezoneMiddleware:
             userprofile, _ = UserProfile.objects.get_or_create(
                 user=request.user)
 
-            # Get the timezone from the user's profile.
+            # Get the timezone from the user's profile, falling back to UTC for invalid names.
             user_timezone = userprofile.timezone
+            if not is_valid_timezone(user_timezone):
+                user_timezone = DEFAULT_TIMEZONE
 
-            # Activate the user's timezone for the current request.
-            timezone.activate(user_timezone)
+            # Activate the cached timezone object for the current request.
+            timezone.activate(get_timezone(user_timezone))
 
         # Pass the request to the next middleware or view function and get the response.
         response = self.get_response(request)
@@ -4,12 +4,75 @@ Models for the TaskMaster application.
 This module defines the database models used in the TaskMaster application, including tasks, user profiles, and task history.
 """
 
+import datetime
+import hashlib
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+# Days of the week in sort order, stored as 1 (Monday) to 7 (Sunday)
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday',
+            'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# Order of the task lists of every task type, shared by the task pages and the API
+TASK_LIST_ORDERING = {
+    'daily': ('completed', 'execution_time'),
+    'weekly': ('completed', 'execution_weekday', 'execution_time'),
+    'monthly': ('completed', 'execution_date', 'execution_time'),
+}
+
+
+def get_weekday_number(day):
+    """Returns the number of a day name from 1 (Monday) to 7 (Sunday), or None for an unknown day."""
+    if day and day.capitalize() in WEEKDAYS:
+        return WEEKDAYS.index(day.capitalize()) + 1
+    return None
+
+
+class TaskSnapshot(models.Model):
+    """
+    Represents one distinct version of the title and description of a task, stored once.
+
+    Attributes:
+        content_hash (CharField): The SHA-256 of the title and description, unique.
+        title (CharField): The title of the task.
+        description (TextField): A detailed description of the task.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+
+    def __str__(self):
+        """Returns the string representation of the snapshot, which is its title."""
+        return self.title
+
+    @staticmethod
+    def get_content_hash(title, description):
+        """Returns the SHA-256 hex digest identifying a title and description."""
+        return hashlib.sha256(f'{title}\0{description}'.encode()).hexdigest()
+
+    @classmethod
+    def get_for(cls, title, description):
+        """Returns the snapshot of a title and description, creating it if it does not exist yet."""
+        snapshot, _ = cls.objects.get_or_create(
+            content_hash=cls.get_content_hash(title, description),
+            defaults={'title': title, 'description': description})
+        return snapshot
+
+
+class TaskQuerySet(models.QuerySet):
+    """
+    QuerySet of tasks closing the carried-forward history of the tasks deleted in bulk, like Task.delete.
+    """
+
+    def delete(self):
+        """Closes the carried-forward history of the tasks before deleting them."""
+        TaskHistory.close_carried(self.values_list('pk', flat=True))
+        return super().delete()
+
+
 class Task(models.Model):
     """
     Represents a task created by a user.
@@ -26,7 +89,19 @@ class Task(models.Model):
         execution_day (CharField): The day of the week for task execution (if applicable).
         execution_time (TimeField): The time of day for task execution (if applicable).
         execution_date (PositiveIntegerField): The date of the month for task execution (if applicable).
+        task_type (CharField): The type of task (daily, weekly, or monthly), derived from the flags on save
+            and indexed together with the user and completion status for the dashboard and API queries.
+        execution_weekday (PositiveSmallIntegerField): The execution day as a number from 1 (Monday) to
+            7 (Sunday), derived from execution_day on save and used to sort the weekly tasks.
+        snapshot (ForeignKey): The snapshot of the current title and description, set on save and
+            referenced by the task history.
     """
+    TASK_TYPE_CHOICES = (
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    )
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
     description = models.TextField()
@@ -39,11 +114,74 @@ class Task(models.Model):
     execution_time = models.TimeField(null=True, blank=True)
     execution_date = models.PositiveIntegerField(null=True, blank=True, validators=[
                                                  MinValueValidator(1), MaxValueValidator(31)])
+    # Nullable so the column can be added and backfilled on a live table
+    task_type = models.CharField(
+        max_length=10, choices=TASK_TYPE_CHOICES, null=True, blank=True, editable=False)
+    execution_weekday = models.PositiveSmallIntegerField(
+        null=True, blank=True, editable=False)
+    snapshot = models.ForeignKey(
+        TaskSnapshot, on_delete=models.PROTECT, null=True, blank=True, editable=False)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Dashboard counts and the task lists, ordered by execution time
+            models.Index(fields=['user', 'task_type', 'completed', 'execution_time'],
+                         name='task_user_type_done_time_idx'),
+            # Weekly task list, ordered by weekday and execution time
+            models.Index(fields=['user', 'task_type', 'completed', 'execution_weekday', 'execution_time'],
+                         name='task_user_type_done_wday_idx'),
+            # Remaining tasks of a user
+            models.Index(fields=['user', 'task_type', 'execution_time'],
+                         name='task_user_type_todo_idx', condition=models.Q(completed=False)),
+        ]
 
     def __str__(self):
         """Returns the string representation of the task, which is its title."""
         return self.title
 
+    def get_task_type(self):
+        """Returns the task type matching the daily, weekly or monthly flag, or None if no flag is set."""
+        for task_type, _ in self.TASK_TYPE_CHOICES:
+            if getattr(self, task_type):
+                return task_type
+        return None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remembers the text the task was loaded with, deferred fields being left out."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_text = (instance.__dict__.get('title'), instance.__dict__.get('description'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Keeps the task type, weekday and snapshot in sync with the flags, execution day and text before saving."""
+        self.task_type = self.get_task_type()
+        self.execution_weekday = get_weekday_number(self.execution_day)
+        update_fields = kwargs.get('update_fields')
+        # The snapshot is only looked up again when the text changed since the task was loaded, or is missing
+        text = (self.title, self.description)
+        if (update_fields is None or {'title', 'description'} & set(update_fields)) and (
+                self.snapshot_id is None or text != getattr(self, '_loaded_text', None)):
+            self.snapshot = TaskSnapshot.get_for(self.title, self.description)
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'daily', 'weekly', 'monthly'} & update_fields:
+                update_fields.add('task_type')
+            if 'execution_day' in update_fields:
+                update_fields.add('execution_weekday')
+            if {'title', 'description'} & update_fields:
+                update_fields.add('snapshot')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        self._loaded_text = text
+
+    def delete(self, *args, **kwargs):
+        """Closes the carried-forward history of the task before deleting it."""
+        TaskHistory.close_carried([self.pk])
+        return super().delete(*args, **kwargs)
+
 
 class UserProfile(models.Model):
     """
@@ -51,10 +189,27 @@ class UserProfile(models.Model):
 
     Attributes:
         user (OneToOneField): The user associated with this profile.
-        timezone (CharField): The timezone of the user.
+        timezone (CharField): The timezone of the user, indexed so the reset jobs can list
+            the distinct timezones in use without scanning every profile.
+        last_daily_reset (DateField): The day of the last daily reset of the user's tasks.
+        last_weekly_reset (DateField): The Monday of the week of the last weekly reset.
+        last_monthly_reset (DateField): The 1st day of the month of the last monthly reset.
+        next_daily_reset_at (DateTimeField): The UTC instant of the next daily reset, indexed so
+            the reset jobs only look at the profiles that are due.
+        next_weekly_reset_at (DateTimeField): The UTC instant of the next weekly reset.
+        next_monthly_reset_at (DateTimeField): The UTC instant of the next monthly reset.
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    timezone = models.CharField(max_length=50, default='UTC')
+    timezone = models.CharField(max_length=50, default='UTC', db_index=True)
+    last_daily_reset = models.DateField(null=True, blank=True)
+    last_weekly_reset = models.DateField(null=True, blank=True)
+    last_monthly_reset = models.DateField(null=True, blank=True)
+    next_daily_reset_at = models.DateTimeField(
+        null=True, blank=True, db_index=True)
+    next_weekly_reset_at = models.DateTimeField(
+        null=True, blank=True, db_index=True)
+    next_monthly_reset_at = models.DateTimeField(
+        null=True, blank=True, db_index=True)
 
 
 class TaskHistory(models.Model):
@@ -72,16 +227,20 @@ class TaskHistory(models.Model):
         completed (BooleanField): Indicates whether the task was completed.
         task_type (CharField): The type of task (daily, weekly, or monthly).
         date (DateField): The date the task was completed.
+        execution_weekday (PositiveSmallIntegerField): The execution day as a number from 1 (Monday) to
+            7 (Sunday), derived from execution_day.
+        snapshot (ForeignKey): The deduplicated title and description of the task. Rows written by the
+            resets only hold the snapshot and leave title and description empty.
+        task (ForeignKey): The task the row was archived from, if it still exists.
+        carry_forward (BooleanField): Indicates the row also stands for the following periods of its task
+            type, until the next row of the same task.
+        carried_until (DateField): The last period a carried-forward row stands for, set when its task is deleted.
     """
-    DATE_TYPE_CHOICES = (
-        ('daily', 'Daily'),
-        ('weekly', 'Weekly'),
-        ('monthly', 'Monthly'),
-    )
+    DATE_TYPE_CHOICES = Task.TASK_TYPE_CHOICES
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    title = models.CharField(max_length=255)
-    description = models.TextField()
+    title = models.CharField(max_length=255, blank=True, default='')
+    description = models.TextField(blank=True, default='')
     execution_day = models.CharField(max_length=9, blank=True, null=True)
     execution_time = models.TimeField(null=True, blank=True)
     execution_date = models.PositiveIntegerField(null=True, blank=True, validators=[
@@ -89,7 +248,239 @@ class TaskHistory(models.Model):
     completed = models.BooleanField(default=False)
     task_type = models.CharField(max_length=10, choices=DATE_TYPE_CHOICES)
     date = models.DateField()
+    execution_weekday = models.PositiveSmallIntegerField(
+        null=True, blank=True, editable=False)
+    snapshot = models.ForeignKey(
+        TaskSnapshot, on_delete=models.PROTECT, null=True, blank=True)
+    # Indexed together with the date below
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    carry_forward = models.BooleanField(default=False)
+    carried_until = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Latest history row of a task, looked up by the carry-forward resets
+            models.Index(fields=['task', 'date'], name='history_task_date_idx'),
+            # History of a user and task type over a date range, read by the exports
+            models.Index(fields=['user', 'task_type', 'date'], name='history_user_type_date_idx'),
+            # Carried-forward rows from before the range of an export
+            models.Index(fields=['user', 'task_type', 'date'], name='history_carried_idx',
+                         condition=models.Q(carry_forward=True)),
+        ]
 
     def __str__(self):
         """Returns the string representation of the task history, which includes the date and title."""
-        return f"{self.date} - {self.title}"
+        return f"{self.date} - {self.get_text()[0]}"
+
+    def get_text(self):
+        """Returns the title and description of the history row, from its snapshot when it has one."""
+        if self.snapshot_id:
+            return self.snapshot.title, self.snapshot.description
+        return self.title, self.description
+
+    def save(self, *args, **kwargs):
+        """Keeps the weekday in sync with the execution day before saving."""
+        self.execution_weekday = get_weekday_number(self.execution_day)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def close_carried(cls, task_ids):
+        """
+        Closes the open carried-forward history of tasks about to be deleted.
+
+        Once a task is deleted its rows lose their task reference, so a row can no longer be superseded by
+        the next row of the task when the history is expanded. Every open row is closed the day before the
+        next row of its task instead, and the latest one at the owner's last reset of its task type.
+        """
+        rows = list(cls.objects.filter(task_id__in=task_ids).order_by('task_id', 'date', 'pk').only(
+            'pk', 'user_id', 'task_id', 'task_type', 'date', 'carry_forward', 'carried_until'))
+        if not any(row.carry_forward and row.carried_until is None for row in rows):
+            return 0
+        profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(
+            user_id__in={row.user_id for row in rows})}
+
+        closed = []
+        for row, successor in zip(rows, rows[1:] + [None]):
+            if not row.carry_forward or row.carried_until is not None:
+                continue
+            if successor is not None and successor.task_id == row.task_id:
+                row.carried_until = max(row.date, successor.date - datetime.timedelta(days=1))
+            else:
+                last_reset = getattr(profiles.get(row.user_id), f'last_{row.task_type}_reset', None)
+                row.carried_until = max(row.date, last_reset or row.date)
+            closed.append(row)
+        cls.objects.bulk_update(closed, ['carried_until'], batch_size=1000)
+        return len(closed)
+
+
+class TaskHistorySummary(models.Model):
+    """
+    Represents one month of the task history of a task, compacted into a single row.
+
+    Attributes:
+        user (ForeignKey): The user who owns the task.
+        task_type (CharField): The type of task (daily, weekly, or monthly).
+        title (CharField): The title of the task.
+        description (TextField): A detailed description of the task.
+        execution_day (CharField): The day of the week the task was executed (if applicable).
+        execution_time (TimeField): The time of day the task was executed (if applicable).
+        execution_date (PositiveIntegerField): The date of the month the task was executed (if applicable).
+        month (DateField): The 1st day of the summarized month.
+        first_date (DateField): The earliest history date of the month.
+        last_date (DateField): The latest history date of the month.
+        days_completed (PositiveIntegerField): The number of history rows of the month marked completed.
+        days_missed (PositiveIntegerField): The number of history rows of the month not completed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    task_type = models.CharField(
+        max_length=10, choices=TaskHistory.DATE_TYPE_CHOICES)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    execution_day = models.CharField(max_length=9, blank=True, null=True)
+    execution_time = models.TimeField(null=True, blank=True)
+    execution_date = models.PositiveIntegerField(null=True, blank=True, validators=[
+                                                 MinValueValidator(1), MaxValueValidator(31)])
+    month = models.DateField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+    days_completed = models.PositiveIntegerField(default=0)
+    days_missed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'task_type', 'month'],
+                         name='summary_user_type_month_idx'),
+        ]
+
+    def __str__(self):
+        """Returns the string representation of the summary, which includes the month and title."""
+        return f"{self.month:%Y-%m} - {self.title}"
+
+
+class TaskCounter(models.Model):
+    """
+    Represents the number of tasks of a user, kept up to date by every write to the user's tasks.
+
+    Attributes:
+        user (OneToOneField): The user the counters belong to, also the primary key.
+        daily_total (PositiveIntegerField): The number of daily tasks.
+        daily_completed (PositiveIntegerField): The number of completed daily tasks.
+        weekly_total (PositiveIntegerField): The number of weekly tasks.
+        weekly_completed (PositiveIntegerField): The number of completed weekly tasks.
+        monthly_total (PositiveIntegerField): The number of monthly tasks.
+        monthly_completed (PositiveIntegerField): The number of completed monthly tasks.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True)
+    daily_total = models.PositiveIntegerField(default=0)
+    daily_completed = models.PositiveIntegerField(default=0)
+    weekly_total = models.PositiveIntegerField(default=0)
+    weekly_completed = models.PositiveIntegerField(default=0)
+    monthly_total = models.PositiveIntegerField(default=0)
+    monthly_completed = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """Returns the string representation of the counters, which is the username."""
+        return f"{self.user} counters"
+
+
+class TaskCompletionRollup(models.Model):
+    """
+    Represents the completion of the tasks of one type of a user over one reset period.
+
+    Written by the task resets in the same transaction as the task history, so completion rates over any
+    range are read from one row per period instead of the history rows.
+
+    Attributes:
+        user (ForeignKey): The user who owns the tasks.
+        task_type (CharField): The type of task (daily, weekly, or monthly).
+        date (DateField): The date of the task history rows of the period.
+        completed (PositiveIntegerField): The number of tasks completed in the period.
+        total (PositiveIntegerField): The number of tasks of the period.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    task_type = models.CharField(
+        max_length=10, choices=TaskHistory.DATE_TYPE_CHOICES)
+    date = models.DateField()
+    completed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'task_type', 'date'],
+                                    name='rollup_user_type_date_uniq'),
+        ]
+
+    def __str__(self):
+        """Returns the string representation of the rollup, which includes the date and completion."""
+        return f"{self.date} - {self.task_type} {self.completed}/{self.total}"
+
+
+class TaskCompletionBitmap(models.Model):
+    """
+    Represents the completion of a task over one year as two bitmaps of one bit per day of the year.
+
+    Bit N (least significant bit first) stands for day N + 1 of the year, so a year fits in 46 bytes.
+    Like the task history, the bitmaps outlive their task: deleting it only clears the task reference.
+
+    Attributes:
+        task (ForeignKey): The task the bitmaps belong to, null once the task is deleted.
+        user (ForeignKey): The user who owns the task.
+        year (PositiveSmallIntegerField): The year of the bitmaps.
+        scheduled (BinaryField): The days the task was archived by a reset.
+        completed (BinaryField): The days the task was archived as completed.
+    """
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    scheduled = models.BinaryField(default=bytes)
+    completed = models.BinaryField(default=bytes)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'year'],
+                                    name='bitmap_task_year_uniq'),
+        ]
+
+    def __str__(self):
+        """Returns the string representation of the bitmaps, which includes the year and task."""
+        return f"{self.year} - {self.task_id}"
+
+
+class TaskHistoryArchiveBlock(models.Model):
+    """
+    Represents one compressed block of archived task history in a segment file.
+
+    A block holds the history rows of one user and task type, in date order, as zlib-compressed JSON lines.
+
+    Attributes:
+        user (ForeignKey): The user who owns the archived history.
+        task_type (CharField): The type of task (daily, weekly, or monthly).
+        segment (CharField): The name of the segment file in the archive directory, or its absolute path when
+            it was written to another directory.
+        offset (BigIntegerField): The position of the block in the segment file.
+        length (PositiveIntegerField): The compressed size of the block in bytes.
+        first_date (DateField): The earliest history date of the block.
+        last_date (DateField): The latest history date of the block.
+        rows (PositiveIntegerField): The number of history rows in the block.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    task_type = models.CharField(
+        max_length=10, choices=TaskHistory.DATE_TYPE_CHOICES)
+    segment = models.CharField(max_length=1024)
+    offset = models.BigIntegerField()
+    length = models.PositiveIntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+    rows = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # Blocks of a user and task type, in date order
+            models.Index(fields=['user', 'task_type', 'first_date'],
+                         name='archive_user_type_date_idx'),
+        ]
+
+    def __str__(self):
+        """Returns the string representation of the block, which includes the segment and the date range."""
+        return f"{self.segment} - {self.first_date} - {self.last_date}"
@@ -0,0 +1,720 @@
+"""
+This module contains the reset engine used by the task reset management commands.
+
+Instead of looping over every UserProfile, profiles are grouped by timezone. For each timezone the engine
+works out once per run which reset period (day, week or month) has started locally, and then archives and
+resets every user of that timezone whose watermark is behind that period with a few set-based queries.
+
+Every profile stores the start of the last period it was reset for, per task type. A user is only reset
+while the watermark is behind the current period and the watermark is advanced in the same transaction,
+so a period is never archived twice and a late or skipped run is caught up by the next one. Every profile also
+stores the UTC instant of its next reset per task type, indexed, so a run only has to look at the timezones
+holding a profile whose next reset has passed; at steady state that is an index range scan returning nothing.
+
+All task types are handled in a single pass: the timezones are scanned once, the due task types are decided
+per user from the watermarks, and the archive and update statements of every due task type are issued together.
+
+Large runs can be split across worker processes. Users are partitioned by user ID modulo the number of workers,
+every worker opens its own database connection, and overdue profiles are locked with SKIP LOCKED so that two
+workers or two hosts never archive the same user.
+"""
+
+import datetime
+import heapq
+import logging
+import operator
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import reduce
+from itertools import islice
+import django
+from django.db import connection, connections, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce, Mod
+from django.utils import timezone
+import pytz
+from ..models import *
+from ..counters.counters import reset_completed_counters
+from ..history.bitmaps import record_tasks
+from ..history.carry import get_changed_tasks
+from ..history.rollups import rollup_tasks
+from ..history.snapshots import assign_task_snapshots
+from ..timezones import (get_boundaries, get_local_date, get_midnight, get_next_boundary,
+                         get_next_period_start, get_period_start)
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - resource is not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Supported task types, matching Task.task_type and TaskHistory.task_type
+TASK_TYPES = ('daily', 'weekly', 'monthly')
+
+# Execution fields copied into the task history for each task type, the bulk inserts skip
+# TaskHistory.save() so the weekday number is copied along with the day name
+HISTORY_FIELDS = {
+    'daily': ('execution_time',),
+    'weekly': ('execution_day', 'execution_weekday', 'execution_time'),
+    'monthly': ('execution_date', 'execution_time'),
+}
+
+# UserProfile field holding the reset watermark of each task type
+WATERMARK_FIELDS = {
+    'daily': 'last_daily_reset',
+    'weekly': 'last_weekly_reset',
+    'monthly': 'last_monthly_reset',
+}
+
+# UserProfile field holding the next reset instant of each task type
+NEXT_RESET_FIELDS = {
+    'daily': 'next_daily_reset_at',
+    'weekly': 'next_weekly_reset_at',
+    'monthly': 'next_monthly_reset_at',
+}
+
+# Number of users archived and reset per transaction
+DEFAULT_BATCH_SIZE = 500
+
+# Seconds before the scheduler retries a failed reset, doubled after every further failure up to the maximum
+SCHEDULER_RETRY_DELAY = 60
+SCHEDULER_MAX_RETRY_DELAY = 3600
+
+# Number of task history rows written per insert
+ARCHIVE_BATCH_SIZE = 1000
+
+# Archive modes: stream task rows through Python, or copy them with INSERT ... SELECT in the database
+ARCHIVE_MODES = ('stream', 'insert-select')
+DEFAULT_ARCHIVE_MODE = 'stream'
+
+# History stores: one history row per task and period, a carried-forward row per change of a task,
+# a completion bitmap per task and year, or rows and bitmaps
+HISTORY_STORES = ('rows', 'changes', 'bitmaps', 'both')
+DEFAULT_HISTORY_STORE = 'rows'
+
+# Task columns read when archiving
+ARCHIVE_COLUMNS = ('id', 'user_id', 'snapshot_id', 'completed', 'task_type',
+                   'execution_day', 'execution_weekday', 'execution_time', 'execution_date')
+
+
+class ResetReport:
+    """
+    Timing and volume report of a reset run.
+
+    The counters and per-phase durations are filled in by the reset engine, merged across worker
+    processes, and serialized with as_dict() so they can be written as JSON.
+    """
+
+    # Counters reported for every run
+    COUNTERS = ('zones_scanned', 'zones_matched', 'profiles_scanned', 'profiles_initialized',
+                'users_reset', 'history_rows_written', 'tasks_updated')
+
+    def __init__(self, dry_run=False):
+        # Whether the numbers were computed without writing
+        self.dry_run = dry_run
+        # Volume counters of the run
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        # Seconds spent in each phase of the run
+        self.phases = {}
+        # Peak resident memory of the worker processes, in kilobytes
+        self.peak_memory_kb = 0
+
+    def add(self, **counts):
+        """
+        Increase the given counters.
+        """
+        for name, value in counts.items():
+            self.counters[name] += value
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure the time spent in a phase, accumulating over repeated calls.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(
+                name, 0) + time.perf_counter() - start
+
+    def merge(self, other):
+        """
+        Add the counters, phase durations and peak memory of another report, e.g. of a worker process.
+        """
+        self.add(**other.counters)
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0) + seconds
+        self.peak_memory_kb = max(self.peak_memory_kb, other.peak_memory_kb)
+
+    def as_dict(self):
+        """
+        Return the report as a JSON-serializable dictionary.
+        """
+        self.peak_memory_kb = max(self.peak_memory_kb, get_peak_memory_kb())
+        return {
+            'dry_run': self.dry_run,
+            **self.counters,
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'peak_memory_kb': self.peak_memory_kb,
+        }
+
+
+def get_peak_memory_kb():
+    """
+    Return the peak resident memory of the current process in kilobytes, or 0 if it is unknown.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def get_zone_periods(task_types=TASK_TYPES, now=None, due_only=False):
+    """
+    Find the current reset period of the given task types in every timezone in use.
+
+    Args:
+        task_types (iterable, optional): The task types to compute periods for. Defaults to all.
+        now (datetime.datetime, optional): The current UTC time. Defaults to timezone.now().
+        due_only (bool, optional): Only return the timezones holding at least one profile whose next
+            reset of one of the task types has passed or was never scheduled. Defaults to False.
+
+    Returns:
+        dict: A mapping of timezone name to a mapping of task type to the first day of its current period.
+    """
+    now = now or timezone.now()
+    periods = {}
+
+    profiles = UserProfile.objects.order_by()
+    if due_only:
+        # Index range scans on the next reset columns
+        profiles = profiles.filter(reduce(operator.or_, [
+            Q(**{f'{NEXT_RESET_FIELDS[task_type]}__lte': now}) |
+            Q(**{f'{NEXT_RESET_FIELDS[task_type]}__isnull': True})
+            for task_type in task_types]))
+
+    # Only the distinct timezones are converted, not every profile, and each one only once
+    zones = profiles.values_list('timezone', flat=True).distinct()
+    for zone in zones:
+        try:
+            local_date = get_local_date(zone, now)
+        except pytz.UnknownTimeZoneError:
+            # Skip profiles holding an invalid timezone instead of aborting the whole run
+            continue
+        periods[zone] = {task_type: get_period_start(
+            task_type, local_date) for task_type in task_types}
+
+    return periods
+
+
+def schedule_profile_resets(profile, now=None):
+    """
+    Recompute the next reset instants of a profile, e.g. after its timezone changed.
+
+    A profile already behind the current period of its timezone is scheduled immediately so the next
+    run catches it up; otherwise it is scheduled at the next local boundary. The profile is not saved.
+
+    Args:
+        profile (UserProfile): The profile to schedule.
+        now (datetime.datetime, optional): The current UTC time. Defaults to timezone.now().
+
+    Returns:
+        None
+    """
+    now = now or timezone.now()
+    try:
+        local_date = get_local_date(profile.timezone, now)
+    except pytz.UnknownTimeZoneError:
+        # Leave an invalid timezone unscheduled, the reset jobs skip it anyway
+        return
+    boundaries = get_boundaries(profile.timezone, local_date)
+    for task_type in TASK_TYPES:
+        watermark = getattr(profile, WATERMARK_FIELDS[task_type])
+        if watermark is not None and watermark < get_period_start(task_type, local_date):
+            next_reset = now
+        else:
+            next_reset = boundaries[task_type][1]
+        setattr(profile, NEXT_RESET_FIELDS[task_type], next_reset)
+
+
+def archive_tasks(due_users, periods, archive_mode=DEFAULT_ARCHIVE_MODE, report=None, dry_run=False,
+                  history_store=DEFAULT_HISTORY_STORE):
+    """
+    Archive and reset the tasks of a batch of users for every due task type at once.
+
+    In stream mode the tasks are read from a server-side cursor with only the archived columns, and the
+    history is written in fixed-size inserts, so memory stays flat however many tasks a user has.
+    In insert-select mode the rows are copied by the database itself and never leave it.
+    Both modes write the same history rows.
+
+    Args:
+        due_users (dict): A mapping of task type to the IDs of the users due for that task type.
+        periods (dict): A mapping of task type to the first day of the period being started,
+            used as history date.
+        archive_mode (str, optional): Either 'stream' or 'insert-select'. Defaults to 'stream'.
+        report (ResetReport, optional): The report receiving the timings and volumes.
+        dry_run (bool, optional): Only count the rows that would be written. Defaults to False.
+        history_store (str, optional): Either 'rows', 'changes', 'bitmaps' or 'both'. Defaults to 'rows'.
+
+    Returns:
+        int: The number of history rows written.
+    """
+    report = report or ResetReport(dry_run)
+
+    # A single filter matching the tasks of every due task type and user
+    tasks = Task.objects.filter(reduce(operator.or_, [
+        Q(user_id__in=user_ids, task_type=task_type) for task_type, user_ids in due_users.items()]))
+
+    with report.phase('archive'):
+        if history_store == 'bitmaps':
+            # Only the bitmaps are written, no history row
+            written = 0
+        elif dry_run:
+            written = (get_changed_tasks(tasks) if history_store == 'changes' else tasks).count()
+        else:
+            # The history references the snapshot of the task text, tasks written without one get it first
+            assign_task_snapshots(tasks)
+            if history_store == 'changes':
+                # Only the tasks whose state changed, few enough to always stream them
+                written = _stream_history(get_changed_tasks(tasks), periods, carry_forward=True)
+            elif archive_mode == 'insert-select':
+                written = _insert_select_history(due_users, periods)
+            else:
+                written = _stream_history(tasks, periods)
+
+    with report.phase('bitmaps'):
+        if history_store in ('bitmaps', 'both') and not dry_run:
+            # Set the bit of the period in the completion bitmap of every task
+            record_tasks(tasks, periods)
+
+    with report.phase('rollup'):
+        if not dry_run:
+            # Roll up the completion of the period before it is reset
+            rollup_tasks(tasks, periods)
+
+    with report.phase('update'):
+        if dry_run:
+            updated = tasks.filter(completed=True).count()
+        else:
+            # Reset the completion status of the tasks in a single update
+            updated = tasks.filter(completed=True).update(completed=False)
+            # Every task of a due type is now incomplete, so are the completed counters
+            for task_type, user_ids in due_users.items():
+                reset_completed_counters(task_type, user_ids)
+
+    report.add(history_rows_written=written, tasks_updated=updated)
+    return written
+
+
+def _stream_history(tasks, periods, carry_forward=False):
+    """
+    Write the task history of the tasks by streaming them through Python in fixed-size batches.
+    """
+    # Stream only the columns needed for the history
+    rows = tasks.order_by().values(*ARCHIVE_COLUMNS).iterator(
+        chunk_size=ARCHIVE_BATCH_SIZE)
+
+    written = 0
+    while True:
+        batch = list(islice(rows, ARCHIVE_BATCH_SIZE))
+        if not batch:
+            break
+        # Save one batch of tasks to the task history in a single insert
+        TaskHistory.objects.bulk_create(
+            [_history_from_row(row, periods, carry_forward) for row in batch])
+        written += len(batch)
+    return written
+
+
+def _insert_select_history(due_users, periods):
+    """
+    Write the task history of the users with one INSERT ... SELECT per task type.
+    """
+    qn = connection.ops.quote_name
+
+    def column(model, name):
+        # Quoted database column of a model field
+        return qn(model._meta.get_field(name).column)
+
+    written = 0
+    with connection.cursor() as cursor:
+        for task_type, user_ids in due_users.items():
+            fields = ('user', 'snapshot', *HISTORY_FIELDS[task_type], 'completed')
+            constants = ('title', 'description', 'task_type', 'date', 'carry_forward')
+            sql = (
+                f'INSERT INTO {qn(TaskHistory._meta.db_table)} '
+                f'({column(TaskHistory, "task")}, '
+                f'{", ".join(column(TaskHistory, name) for name in (*fields, *constants))}) '
+                f'SELECT {column(Task, "id")}, {", ".join(column(Task, name) for name in fields)}, '
+                f'%s, %s, %s, %s, %s '
+                f'FROM {qn(Task._meta.db_table)} '
+                f'WHERE {column(Task, "task_type")} = %s '
+                f'AND {column(Task, "user")} IN ({", ".join(["%s"] * len(user_ids))})'
+            )
+            cursor.execute(sql, [
+                '', '', task_type, connection.ops.adapt_datefield_value(periods[task_type]), False,
+                task_type, *user_ids])
+            written += cursor.rowcount
+    return written
+
+
+def _history_from_row(row, periods, carry_forward=False):
+    """
+    Build the task history of a task row read by archive_tasks.
+    """
+    task_type = row['task_type']
+    return TaskHistory(
+        user_id=row['user_id'],  # Associate the history with the task owner
+        task_id=row['id'],  # Reference the archived task
+        snapshot_id=row['snapshot_id'],  # Reference the task title and description
+        # Save the execution fields relevant for the task type
+        **{field: row[field] for field in HISTORY_FIELDS[task_type]},
+        completed=row['completed'],  # Save the task completion status
+        task_type=task_type,  # Mark the task type
+        date=periods[task_type],  # Save the date the period started
+        carry_forward=carry_forward  # Mark rows standing for the following periods too
+    )
+
+
+def reset_zone(zone, periods, batch_size=DEFAULT_BATCH_SIZE, shard=None, archive_mode=DEFAULT_ARCHIVE_MODE,
+               report=None, dry_run=False, history_store=DEFAULT_HISTORY_STORE):
+    """
+    Archive and reset the tasks of every overdue user in a timezone, for all given task types at once.
+
+    Profiles without a watermark are new and only get their watermark set to the current period.
+    Overdue users are processed in batches, each batch in its own transaction that also advances
+    the watermarks, so running the reset again for the same period does nothing.
+
+    Args:
+        zone (str): The timezone name shared by the users to reset.
+        periods (dict): A mapping of task type to the first day of its current period in the timezone.
+        batch_size (int, optional): The number of users reset per transaction.
+        shard (tuple, optional): A (index, count) pair restricting the reset to the users whose
+            ID modulo count equals index. Defaults to all users.
+        archive_mode (str, optional): Either 'stream' or 'insert-select'. Defaults to 'stream'.
+        report (ResetReport, optional): The report receiving the timings and volumes.
+        dry_run (bool, optional): Only count the users and rows that would be reset. Defaults to False.
+        history_store (str, optional): Either 'rows', 'changes', 'bitmaps' or 'both'. Defaults to 'rows'.
+
+    Returns:
+        int: The number of users that were reset.
+    """
+    report = report or ResetReport(dry_run)
+    fields = {task_type: WATERMARK_FIELDS[task_type] for task_type in periods}
+    # Next reset instant of every task type, at the local midnight starting the following period
+    next_resets = {task_type: get_midnight(zone, get_next_period_start(task_type, period))
+                   for task_type, period in periods.items()}
+    profiles = UserProfile.objects.filter(timezone=zone)
+    if shard:
+        # Only the users of this worker's partition
+        index, count = shard
+        profiles = profiles.alias(shard=Mod('user_id', Value(count))).filter(shard=index)
+
+    # Start the missing watermarks of new profiles at the current period in a single update
+    missing = profiles.filter(reduce(operator.or_, [
+        Q(**{f'{field}__isnull': True}) for field in fields.values()]))
+    with report.phase('initialize'):
+        if dry_run:
+            initialized = missing.count()
+        else:
+            initialized = missing.update(**{field: Coalesce(field, Value(periods[task_type]))
+                                            for task_type, field in fields.items()})
+    report.add(profiles_initialized=initialized)
+
+    # Profiles whose watermark is behind the current period for at least one task type
+    overdue = profiles.filter(reduce(operator.or_, [
+        Q(**{f'{field}__lt': periods[task_type]}) for task_type, field in fields.items()]))
+    if not dry_run:
+        # Lock each batch of overdue profiles so concurrent runs cannot archive the same period,
+        # profiles already locked by another worker or host are left to that worker
+        overdue = overdue.select_for_update(skip_locked=True)
+
+    with report.phase('select'):
+        # Every profile of the timezone (and shard) is examined by the overdue query, reset or not
+        report.add(profiles_scanned=profiles.count())
+
+    reset_users = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            with report.phase('select'):
+                rows = list(overdue.filter(pk__gt=last_pk).order_by('pk').values_list(
+                    'pk', 'user_id', *fields.values())[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            # Decide in one pass which task types are due for each user
+            due_users = {task_type: [] for task_type in fields}
+            for _, user_id, *watermarks in rows:
+                for task_type, watermark in zip(fields, watermarks):
+                    if watermark < periods[task_type]:
+                        due_users[task_type].append(user_id)
+            due_users = {task_type: user_ids for task_type,
+                         user_ids in due_users.items() if user_ids}
+
+            archive_tasks(due_users, periods, archive_mode, report, dry_run, history_store)
+
+            # Advance the watermarks and next reset instants in the same transaction as the archive
+            with report.phase('watermark'):
+                if not dry_run:
+                    for task_type, user_ids in due_users.items():
+                        profiles.filter(user_id__in=user_ids).update(**{
+                            fields[task_type]: periods[task_type],
+                            NEXT_RESET_FIELDS[task_type]: next_resets[task_type],
+                        })
+        reset_users += len(rows)
+
+    # Schedule the next reset of the profiles that are up to date but were due or never scheduled
+    with report.phase('watermark'):
+        if not dry_run:
+            for task_type, field in fields.items():
+                next_field = NEXT_RESET_FIELDS[task_type]
+                profiles.filter(
+                    Q(**{f'{next_field}__isnull': True}) | Q(
+                        **{f'{next_field}__lt': next_resets[task_type]}),
+                    **{f'{field}__gte': periods[task_type]},
+                ).update(**{next_field: next_resets[task_type]})
+
+    report.add(users_reset=reset_users)
+    return reset_users
+
+
+def reset_tasks(task_types=TASK_TYPES, now=None, batch_size=DEFAULT_BATCH_SIZE, workers=1,
+                archive_mode=DEFAULT_ARCHIVE_MODE, report=None, dry_run=False,
+                history_store=DEFAULT_HISTORY_STORE):
+    """
+    Reset the tasks of the given task types for every user whose current period has not been reset yet.
+
+    Args:
+        task_types (iterable, optional): The task types to reset. Defaults to all.
+        now (datetime.datetime, optional): The current UTC time. Defaults to timezone.now().
+        batch_size (int, optional): The number of users reset per transaction.
+        workers (int, optional): The number of worker processes sharing the users. Defaults to 1.
+        archive_mode (str, optional): Either 'stream' or 'insert-select'. Defaults to 'stream'.
+        report (ResetReport, optional): The report receiving the timings and volumes of the run.
+        dry_run (bool, optional): Compute the report without writing anything. Defaults to False.
+        history_store (str, optional): Either 'rows', 'changes', 'bitmaps' or 'both'. Defaults to 'rows'.
+
+    Returns:
+        list: The names of the timezones where at least one user was reset.
+    """
+    report = report or ResetReport(dry_run)
+
+    with report.phase('total'):
+        with report.phase('zones'):
+            zone_periods = get_zone_periods(task_types, now, due_only=True)
+        report.add(zones_scanned=len(zone_periods))
+        reset_zones = reset_zone_periods(zone_periods, batch_size, workers, archive_mode, report, dry_run,
+                                         history_store)
+
+    report.add(zones_matched=len(reset_zones))
+    return reset_zones
+
+
+def reset_zone_periods(zone_periods, batch_size=DEFAULT_BATCH_SIZE, workers=1, archive_mode=DEFAULT_ARCHIVE_MODE,
+                       report=None, dry_run=False, history_store=DEFAULT_HISTORY_STORE):
+    """
+    Reset the overdue users of timezones, in this process or sharded across worker processes.
+
+    Args:
+        zone_periods (dict): A mapping of timezone name to a mapping of task type to the first day of its period.
+        batch_size (int, optional): The number of users reset per transaction.
+        workers (int, optional): The number of worker processes sharing the users. Defaults to 1.
+        archive_mode (str, optional): Either 'stream' or 'insert-select'. Defaults to 'stream'.
+        report (ResetReport, optional): The report receiving the timings and volumes of the run.
+        dry_run (bool, optional): Compute the report without writing anything. Defaults to False.
+        history_store (str, optional): Either 'rows', 'changes', 'bitmaps' or 'both'. Defaults to 'rows'.
+
+    Returns:
+        list: The names of the timezones where at least one user was reset.
+    """
+    report = report or ResetReport(dry_run)
+    # SQLite only allows a single writer, so workers would only wait on each other
+    if workers <= 1 or connection.vendor == 'sqlite':
+        return [zone for zone, periods in zone_periods.items() if reset_zone(
+            zone, periods, batch_size, None, archive_mode, report, dry_run, history_store)]
+
+    # Close the connections of this process so the forked workers never share a socket
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        matched = set()
+        for shard_zones, shard_report in executor.map(_reset_shard, [
+                (zone_periods, batch_size, (index, workers), archive_mode, dry_run, history_store)
+                for index in range(workers)]):
+            matched |= shard_zones
+            report.merge(shard_report)
+    # Keep the order of the timezones
+    return [zone for zone in zone_periods if zone in matched]
+
+
+def _reset_shard(args):
+    """
+    Reset one partition of the users in a worker process.
+
+    Args:
+        args (tuple): The timezone periods, the batch size, the (index, count) shard of the worker,
+            the archive mode, the dry run flag and the history store.
+
+    Returns:
+        tuple: The names of the timezones where at least one user of the partition was reset,
+            and the report of the worker.
+    """
+    zone_periods, batch_size, shard, archive_mode, dry_run, history_store = args
+    report = ResetReport(dry_run)
+    try:
+        zones = {zone for zone, periods in zone_periods.items()
+                 if reset_zone(zone, periods, batch_size, shard, archive_mode, report, dry_run,
+                                                  history_store)}
+        report.peak_memory_kb = get_peak_memory_kb()
+        return zones, report
+    finally:
+        # Release the worker's own database connection
+        connections.close_all()
+
+
+class ResetScheduler:
+    """
+    Priority queue of upcoming reset boundaries, one entry per timezone and task type.
+
+    The heap holds (instant, timezone, task_type) tuples ordered by the UTC instant of the next
+    local midnight, Monday or 1st of the month. The scheduler only has to look at the head of the
+    heap to know how long it can sleep, and only the timezones at the head are reset.
+    Timezones are reloaded from the user profiles on every refresh, so a timezone changed through
+    set_timezone is picked up on the next refresh. Every refresh also catches up the profiles that are
+    already overdue, e.g. after the scheduler was down across a boundary or a profile moved to a timezone
+    past its boundary. A reset that fails is logged and pushed back onto the heap with an exponential
+    backoff, so one failing timezone neither stops the scheduler nor is lost.
+    """
+
+    def __init__(self, task_types=TASK_TYPES, batch_size=DEFAULT_BATCH_SIZE, workers=1,
+                 archive_mode=DEFAULT_ARCHIVE_MODE, history_store=DEFAULT_HISTORY_STORE):
+        # Task types managed by the scheduler
+        self.task_types = tuple(task_types)
+        # Options of the resets run by the scheduler
+        self.batch_size = batch_size
+        self.workers = workers
+        self.archive_mode = archive_mode
+        self.history_store = history_store
+        # Heap of (instant, timezone, task_type) entries
+        self.heap = []
+        # Timezones currently used by at least one profile
+        self.zones = set()
+        # (timezone, task_type) pairs that already have an entry in the heap
+        self.scheduled = set()
+        # Number of consecutive failed resets of (timezone, task_type) pairs being retried
+        self.failures = {}
+
+    def refresh(self, now):
+        """
+        Catch up the overdue profiles, reload the timezones in use and schedule the ones not in the heap yet.
+
+        Args:
+            now (datetime.datetime): The current UTC time.
+
+        Returns:
+            list: The timezones where overdue profiles were caught up.
+        """
+        caught_up = self.catch_up(now)
+        self.zones = set(UserProfile.objects.order_by().values_list(
+            'timezone', flat=True).distinct())
+        for zone in self.zones:
+            for task_type in self.task_types:
+                if (zone, task_type) not in self.scheduled:
+                    self._push(task_type, zone, now)
+        return caught_up
+
+    def catch_up(self, now):
+        """
+        Reset the profiles whose next reset has passed or was never scheduled, through their scheduled instants.
+
+        Args:
+            now (datetime.datetime): The current UTC time.
+
+        Returns:
+            list: The timezones where at least one profile was reset.
+        """
+        try:
+            return reset_zone_periods(get_zone_periods(self.task_types, now, due_only=True), self.batch_size,
+                                      self.workers, self.archive_mode, history_store=self.history_store)
+        except Exception:
+            # The next refresh tries again
+            logger.exception('Catching up the overdue resets failed.')
+            connection.close_if_unusable_or_obsolete()
+            return []
+
+    def run_pending(self, now):
+        """
+        Reset every timezone whose boundary is at or before now and schedule its next boundary.
+
+        Failed resets are retried after a delay instead of scheduling the next boundary.
+
+        Args:
+            now (datetime.datetime): The current UTC time.
+
+        Returns:
+            list: The (timezone, task_type) pairs that were reset.
+        """
+        done = []
+        while self.heap and self.heap[0][0] <= now:
+            instant, zone, task_type = heapq.heappop(self.heap)
+            self.scheduled.discard((zone, task_type))
+
+            # Timezones no longer used by any profile are dropped from the heap
+            if zone not in self.zones:
+                continue
+
+            # Run the reset for the affected timezone only, the boundary is the start of the new period.
+            # A retry runs after the boundary, so its period is the one containing the retry instant
+            period = get_period_start(task_type, get_local_date(zone, instant))
+            try:
+                reset_zone_periods({zone: {task_type: period}}, self.batch_size, self.workers, self.archive_mode,
+                                   history_store=self.history_store)
+            except Exception:
+                failures = self.failures.get((zone, task_type), 0) + 1
+                self.failures[(zone, task_type)] = failures
+                delay = min(SCHEDULER_RETRY_DELAY * 2 ** (failures - 1), SCHEDULER_MAX_RETRY_DELAY)
+                logger.exception('%s reset failed for %s (attempt %d), retrying in %d seconds.',
+                                 task_type.capitalize(), zone, failures, delay)
+                # Drop a connection left unusable by the failure, it is reopened on the next query
+                connection.close_if_unusable_or_obsolete()
+                heapq.heappush(self.heap, (now + datetime.timedelta(seconds=delay), zone, task_type))
+                self.scheduled.add((zone, task_type))
+                continue
+            self.failures.pop((zone, task_type), None)
+            done.append((zone, task_type))
+
+            # Schedule the following boundary
+            self._push(task_type, zone, instant)
+        return done
+
+    def seconds_until_next(self, now):
+        """
+        Return the number of seconds until the nearest boundary, or None if the heap is empty.
+
+        Args:
+            now (datetime.datetime): The current UTC time.
+
+        Returns:
+            float or None: Seconds until the head of the heap is due.
+        """
+        if not self.heap:
+            return None
+        return max((self.heap[0][0] - now).total_seconds(), 0)
+
+    def _push(self, task_type, zone, now):
+        """
+        Push the next boundary after now of a timezone and task type onto the heap.
+        """
+        try:
+            instant = get_next_boundary(task_type, zone, now)
+        except pytz.UnknownTimeZoneError:
+            # Invalid timezones are never scheduled
+            return
+        heapq.heappush(self.heap, (instant, zone, task_type))
+        self.scheduled.add((zone, task_type))
@@ -91,3 +91,29 @@ class TaskSerializer(serializers.ModelSerializer):
                 {'monthlytask': 'Invalid field for monthly task.'})
 
         return data
+
+
+class TaskCompletionRollupSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the TaskCompletionRollup model.
+
+    Adds the completion rate of the period, between 0 and 1.
+    """
+    rate = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TaskCompletionRollup
+        fields = ['date', 'task_type', 'completed', 'total', 'rate']
+        read_only_fields = fields
+
+    def get_rate(self, rollup):
+        """
+        Compute the completion rate of the period.
+
+        Args:
+            rollup (TaskCompletionRollup): The rollup row.
+
+        Returns:
+            float: The completed tasks divided by the tasks of the period, 0 for a period without tasks.
+        """
+        return rollup.completed / rollup.total if rollup.total else 0.0
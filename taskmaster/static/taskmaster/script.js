@@ -443,6 +443,41 @@ function updateNumberColumn(dataTable) {
   });
 }
 
+/**
+ * Build the DataTables ajax option of a task table initialized from the tasks embedded in the page.
+ *
+ * The first load reads the tasks serialized by the view with json_script, so the table is drawn without
+ * a request. Later refreshes through dataTable.ajax.reload() fetch the tasks from the API; a refresh that
+ * fails shows a message and keeps the rows already drawn.
+ *
+ * @param {string} scriptId - The ID of the json_script element holding the initial tasks.
+ * @param {string} url - The API endpoint returning the tasks on refresh.
+ * @returns {function} The ajax function to pass to DataTable().
+ */
+function embeddedTasksAjax(scriptId, url) {
+  const script = document.getElementById(scriptId);
+  let initialTasks = script ? JSON.parse(script.textContent) : null;
+  return function (data, callback) {
+    if (initialTasks !== null) {
+      // Use the embedded tasks only once
+      const tasks = initialTasks;
+      initialTasks = null;
+      callback({ data: tasks });
+      return;
+    }
+    $.getJSON(url, function (tasks) {
+      callback({ data: tasks });
+    }).fail(function (xhr) {
+      // Handle error response
+      if (xhr.status == 401 || xhr.status == 403) {
+        showToast("You are not authenticated. Please login first.", "error", 3000);
+      } else {
+        showToast("The tasks could not be loaded.", "error", 3000);
+      }
+    });
+  };
+}
+
 /**
  * Reloads the DataTable with the saved page number.
  *
@@ -5,15 +5,40 @@ It includes tests for user registration, login, task management, and exporting t
 
 from django.test import TestCase, Client, RequestFactory
 from django.urls import reverse
+from django.utils import timezone
 import datetime
+import json
+import os
+import re
 from parameterized import parameterized
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework.exceptions import ErrorDetail
+from rest_framework_simplejwt.tokens import RefreshToken
 from openpyxl import load_workbook
-from io import BytesIO
+from io import BytesIO, StringIO
+import tempfile
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction, IntegrityError
+from django.test.utils import CaptureQueriesContext
 from .models import *
-from .views import export_task_to_excel
+from .views import export_task_to_excel, iter_history
+from .resets.resets import get_zone_periods, archive_tasks, reset_tasks, reset_zone, get_next_boundary, ResetScheduler
+from .timezones import canonicalize_timezone, get_boundaries, get_timezone
+from .history.partitions import (convert_to_partitioned, get_default_partition_name, get_expired_partitions,
+                                 get_history_table, get_months, get_partition_name, is_partitioned, list_partitions,
+                                 parse_partition_name)
+from .history.compaction import compact_history, get_compaction_cutoff
+from .counters.counters import get_counters
+from .history.snapshots import get_snapshots
+from .history.bitmaps import get_completion_rate, get_day_bit, get_heatmap, get_streak, to_int
+from .history.carry import expand_history, get_last_resets
+from .history.archive import archive_history, read_archived_history
+from .history.rollups import backfill_rollups
 
 # Create your tests here.
 
@@ -1208,3 +1233,1410 @@ class ExportTaskToExcelTestCase(TestCase):
         self.assertEqual(monthly_sheet.cell(
             row=2, column=5).value, 'Completed')
         self.assertEqual(monthly_sheet.cell(row=3, column=5).value, 'yes')
+
+    def test_streaming_export_matches(self):
+        """
+        Test that the streaming export produces the same cells, styles, merges and widths as the default one.
+        """
+        for day in range(1, 4):
+            TaskHistory.objects.create(user=self.user, task_type='daily', date=f'2023-07-0{day}',
+                                       title='Daily Task with a rather long title', description='daily',
+                                       execution_time='08:00', completed=day == 2)
+        TaskHistorySummary.objects.create(
+            user=self.user, task_type='daily', title='Old', description='old', execution_time='08:00',
+            month=datetime.date(2023, 1, 1), first_date=datetime.date(2023, 1, 1),
+            last_date=datetime.date(2023, 1, 31), days_completed=20, days_missed=11)
+        self.client.login(username='testuser', password='testpassword')
+
+        default = load_workbook(BytesIO(self.client.get(reverse('export')).content))
+        response = self.client.get(reverse('export'), {'mode': 'stream'})
+        self.assertEqual(response['Content-Type'],
+                         'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        streamed = load_workbook(BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual(streamed.sheetnames, default.sheetnames)
+        for name in default.sheetnames:
+            expected, actual = default[name], streamed[name]
+            self.assertEqual(list(actual.values), list(expected.values))
+            self.assertEqual([str(cells) for cells in actual.merged_cells.ranges],
+                             [str(cells) for cells in expected.merged_cells.ranges])
+            for letter in 'ABCDE':
+                self.assertEqual(actual.column_dimensions[letter].width,
+                                 expected.column_dimensions[letter].width)
+            for expected_row, actual_row in zip(expected.iter_rows(), actual.iter_rows()):
+                for expected_cell, actual_cell in zip(expected_row, actual_row):
+                    self.assertEqual(actual_cell.font.b, expected_cell.font.b)
+                    self.assertEqual(actual_cell.fill.fgColor.rgb, expected_cell.fill.fgColor.rgb)
+                    self.assertEqual(actual_cell.border.left.style, expected_cell.border.left.style)
+
+
+class ResetTasksTestCase(TestCase):
+    def setUp(self):
+        # Watermarks of users that were last reset on Friday 30 June 2023
+        watermarks = {
+            'last_daily_reset': datetime.date(2023, 6, 30),
+            'last_weekly_reset': datetime.date(2023, 6, 26),
+            'last_monthly_reset': datetime.date(2023, 6, 1),
+        }
+
+        # Create one user in UTC and one user in Asia/Jakarta (UTC+7)
+        self.utc_user = User.objects.create_user(
+            username='utcuser', password='testpassword')
+        UserProfile.objects.create(
+            user=self.utc_user, timezone='UTC', **watermarks)
+        self.jakarta_user = User.objects.create_user(
+            username='jakartauser', password='testpassword')
+        UserProfile.objects.create(
+            user=self.jakarta_user, timezone='Asia/Jakarta', **watermarks)
+
+        # Give each user one completed task of every type
+        for user in (self.utc_user, self.jakarta_user):
+            Task.objects.create(user=user, title='Daily', description='daily',
+                                daily=True, completed=True, execution_time='08:00')
+            Task.objects.create(user=user, title='Weekly', description='weekly', weekly=True,
+                                completed=True, execution_day='Monday', execution_time='08:00')
+            Task.objects.create(user=user, title='Monthly', description='monthly', monthly=True,
+                                completed=True, execution_date=1, execution_time='08:00')
+
+    def test_get_zone_periods(self):
+        """
+        Test that the current period of every timezone starts on the local day, Monday or 1st of the month.
+        """
+        # Friday 30 June 2023 20:00 UTC is Saturday 1 July 03:00 in Asia/Jakarta
+        now = datetime.datetime(2023, 6, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(get_zone_periods(now=now), {
+            'UTC': {
+                'daily': datetime.date(2023, 6, 30),
+                'weekly': datetime.date(2023, 6, 26),
+                'monthly': datetime.date(2023, 6, 1),
+            },
+            'Asia/Jakarta': {
+                'daily': datetime.date(2023, 7, 1),
+                'weekly': datetime.date(2023, 6, 26),
+                'monthly': datetime.date(2023, 7, 1),
+            },
+        })
+        self.assertEqual(get_zone_periods(['weekly'], now)['UTC'], {
+                         'weekly': datetime.date(2023, 6, 26)})
+
+    def test_reset_tasks(self):
+        """
+        Test that overdue users are archived and reset once, and users in other timezones are untouched.
+        """
+        # Three hours after midnight in Asia/Jakarta, the reset is caught up late
+        now = datetime.datetime(2023, 6, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(reset_tasks(['weekly'], now), [])
+        self.assertEqual(reset_tasks(now=now), ['Asia/Jakarta'])
+
+        # Check the history written for the Jakarta user
+        history = TaskHistory.objects.filter(user=self.jakarta_user)
+        self.assertEqual(history.count(), 2)
+        monthly = history.get(task_type='monthly')
+        self.assertEqual(monthly.date, datetime.date(2023, 7, 1))
+        self.assertEqual(monthly.execution_date, 1)
+        self.assertTrue(monthly.completed)
+        self.assertFalse(TaskHistory.objects.filter(
+            user=self.utc_user).exists())
+
+        # Check the completion status of the tasks and the watermarks
+        self.assertFalse(Task.objects.get(
+            user=self.jakarta_user, daily=True).completed)
+        self.assertTrue(Task.objects.get(
+            user=self.jakarta_user, weekly=True).completed)
+        self.assertTrue(Task.objects.get(
+            user=self.utc_user, daily=True).completed)
+        profile = UserProfile.objects.get(user=self.jakarta_user)
+        self.assertEqual(profile.last_daily_reset, datetime.date(2023, 7, 1))
+        self.assertEqual(profile.last_weekly_reset, datetime.date(2023, 6, 26))
+        self.assertEqual(profile.last_monthly_reset, datetime.date(2023, 7, 1))
+
+        # Running again for the same period never archives it twice
+        Task.objects.filter(user=self.jakarta_user).update(completed=True)
+        self.assertEqual(reset_tasks(now=now), [])
+        self.assertEqual(TaskHistory.objects.filter(
+            user=self.jakarta_user).count(), 2)
+
+    def test_reset_tasks_all_types(self):
+        """
+        Test that all task types are reset in a single pass on a Monday that is also the 1st.
+        """
+        # Monday 1 January 2024 00:00 UTC
+        now = datetime.datetime(2024, 1, 1, 0, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(sorted(reset_tasks(now=now)), ['Asia/Jakarta', 'UTC'])
+        self.assertEqual(sorted(TaskHistory.objects.filter(user=self.utc_user).values_list(
+            'task_type', flat=True)), ['daily', 'monthly', 'weekly'])
+        self.assertFalse(Task.objects.filter(completed=True).exists())
+
+    def test_archive_tasks_batches(self):
+        """
+        Test that the history is written in fixed-size batches.
+        """
+        for index in range(4):
+            Task.objects.create(user=self.utc_user, title=f'Daily {index}', description='daily',
+                                daily=True, completed=True, execution_time='08:00')
+        periods = {'daily': datetime.date(2023, 7, 1)}
+        with mock.patch('taskmaster.resets.resets.ARCHIVE_BATCH_SIZE', 2):
+            self.assertEqual(archive_tasks({'daily': [self.utc_user.id]}, periods), 5)
+        self.assertEqual(TaskHistory.objects.filter(
+            user=self.utc_user, task_type='daily', date=periods['daily']).count(), 5)
+        self.assertFalse(Task.objects.filter(
+            user=self.utc_user, daily=True, completed=True).exists())
+
+    def test_archive_tasks_insert_select(self):
+        """
+        Test that the insert-select archive mode writes the same history as the stream mode.
+        """
+        columns = ('user', 'snapshot', 'title', 'description', 'execution_day', 'execution_weekday',
+                   'execution_time', 'execution_date', 'completed', 'task_type', 'date')
+        due_users = {task_type: [self.utc_user.id, self.jakarta_user.id]
+                     for task_type in ('daily', 'weekly', 'monthly')}
+        periods = {'daily': datetime.date(2024, 1, 1), 'weekly': datetime.date(
+            2024, 1, 1), 'monthly': datetime.date(2024, 1, 1)}
+
+        self.assertEqual(archive_tasks(due_users, periods, 'stream'), 6)
+        streamed = sorted(TaskHistory.objects.values_list(*columns))
+        # The weekday number is copied for the weekly rows
+        self.assertFalse(TaskHistory.objects.filter(task_type='weekly', execution_weekday__isnull=True).exists())
+        TaskHistory.objects.all().delete()
+        Task.objects.update(completed=True)
+
+        self.assertEqual(archive_tasks(due_users, periods, 'insert-select'), 6)
+        self.assertEqual(sorted(TaskHistory.objects.values_list(*columns)), streamed)
+        self.assertFalse(Task.objects.filter(completed=True).exists())
+
+    def test_benchmark_reset_rewinds_schedule(self):
+        """
+        Test that every run of the reset benchmark resets all the seeded users again.
+        """
+        out = StringIO()
+        call_command('benchmark_reset', '--users', '3', '--tasks-per-user', '3', '--workers', '1,1',
+                     '--timezone', 'UTC', stdout=out)
+        users = [int(re.search(r' users=(\d+) ', line).group(1))
+                 for line in out.getvalue().splitlines() if line.startswith('workers=')]
+        # The users of the fixture are only due in the first run, the seeded users in every run
+        self.assertEqual(len(users), 2)
+        self.assertGreaterEqual(users[0], 3)
+        self.assertEqual(users[1], 3)
+        self.assertFalse(User.objects.filter(username__startswith='benchmark_reset_').exists())
+
+    def test_reset_zone_shard(self):
+        """
+        Test that a sharded reset only touches the users of its partition.
+        """
+        periods = {'daily': datetime.date(2023, 7, 1)}
+        index = self.utc_user.id % 2
+        self.assertEqual(reset_zone('UTC', periods, shard=(1 - index, 2)), 0)
+        self.assertEqual(reset_zone('UTC', periods, shard=(index, 2)), 1)
+        self.assertEqual(TaskHistory.objects.filter(user=self.utc_user).count(), 1)
+
+    def test_reset_tasks_command(self):
+        """
+        Test the reset_tasks command and its aliases.
+        """
+        out = StringIO()
+        call_command('reset_tasks', types='daily,weekly', stdout=out)
+        self.assertIn('Daily and weekly tasks reset successfully.', out.getvalue())
+        call_command('reset_monthly_tasks', stdout=out)
+        self.assertIn('Monthly tasks reset successfully.', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('reset_tasks', types='yearly')
+
+    def test_reset_tasks_command_report(self):
+        """
+        Test the JSON report of the reset_tasks command, with and without dry run.
+        """
+        UserProfile.objects.update(last_daily_reset=datetime.date(2000, 1, 1))
+        # A profile already up to date is examined but not reset
+        UserProfile.objects.create(user=User.objects.create_user(username='uptodate', password='testpassword'),
+                                   timezone='UTC', last_daily_reset=datetime.date(2100, 1, 1))
+
+        # A dry run reports the same numbers without writing anything
+        out = StringIO()
+        call_command('reset_tasks', types='daily', report='-', dry_run=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertTrue(report['dry_run'])
+        self.assertEqual(report['task_types'], ['daily'])
+        self.assertEqual(report['zones_scanned'], 2)
+        self.assertEqual(report['zones_matched'], 2)
+        self.assertEqual(report['profiles_scanned'], 3)
+        self.assertEqual(report['users_reset'], 2)
+        self.assertEqual(report['history_rows_written'], 2)
+        self.assertEqual(report['tasks_updated'], 2)
+        self.assertIn('archive', report['phases'])
+        self.assertGreater(report['peak_memory_kb'], 0)
+        self.assertFalse(TaskHistory.objects.exists())
+
+        out = StringIO()
+        call_command('reset_tasks', types='daily', report='-', stdout=out)
+        self.assertEqual({key: value for key, value in json.loads(out.getvalue()).items()
+                          if key not in ('dry_run', 'phases', 'peak_memory_kb')},
+                         {key: value for key, value in report.items()
+                          if key not in ('dry_run', 'phases', 'peak_memory_kb')})
+        self.assertEqual(TaskHistory.objects.count(), 2)
+
+    def test_reset_tasks_new_profile(self):
+        """
+        Test that a profile without watermark is only initialized, not archived.
+        """
+        user = User.objects.create_user(
+            username='newuser', password='testpassword')
+        UserProfile.objects.create(user=user, timezone='UTC')
+        Task.objects.create(user=user, title='Daily', description='daily',
+                            daily=True, completed=True, execution_time='08:00')
+
+        now = datetime.datetime(2023, 6, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        reset_tasks(['daily'], now)
+        self.assertFalse(TaskHistory.objects.filter(user=user).exists())
+        self.assertEqual(UserProfile.objects.get(
+            user=user).last_daily_reset, datetime.date(2023, 6, 30))
+
+    def test_reset_tasks_next_reset_at(self):
+        """
+        Test that a reset schedules the next reset and that a second run finds no due timezone.
+        """
+        now = datetime.datetime(2023, 6, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(reset_tasks(now=now), ['Asia/Jakarta'])
+
+        # Asia/Jakarta was reset for Saturday 1 July, next daily reset at local midnight of Sunday
+        profile = UserProfile.objects.get(user=self.jakarta_user)
+        self.assertEqual(profile.next_daily_reset_at,
+                         datetime.datetime(2023, 7, 1, 17, 0, tzinfo=datetime.timezone.utc))
+        self.assertEqual(profile.next_weekly_reset_at,
+                         datetime.datetime(2023, 7, 2, 17, 0, tzinfo=datetime.timezone.utc))
+        # UTC was already up to date and is only scheduled
+        profile = UserProfile.objects.get(user=self.utc_user)
+        self.assertEqual(profile.next_monthly_reset_at,
+                         datetime.datetime(2023, 7, 1, 0, 0, tzinfo=datetime.timezone.utc))
+
+        self.assertEqual(get_zone_periods(now=now, due_only=True), {})
+        self.assertEqual(reset_tasks(now=now), [])
+
+    def test_set_timezone_schedules_resets(self):
+        """
+        Test that changing the timezone moves the next resets to the boundaries of the new timezone.
+        """
+        self.client.login(username='utcuser', password='testpassword')
+        now = datetime.datetime(2023, 6, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = self.client.post(reverse('set_timezone'), json.dumps(
+                {'timeZone': 'Asia/Jakarta'}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        # Already Saturday 1 July in Asia/Jakarta, so the daily and monthly resets are due now
+        profile = UserProfile.objects.get(user=self.utc_user)
+        self.assertEqual(profile.next_daily_reset_at, now)
+        self.assertEqual(profile.next_monthly_reset_at, now)
+        self.assertEqual(profile.next_weekly_reset_at,
+                         datetime.datetime(2023, 7, 2, 17, 0, tzinfo=datetime.timezone.utc))
+
+    def test_get_next_boundary(self):
+        """
+        Test the next local midnight, Monday and 1st of the month of a timezone in UTC.
+        """
+        # Wednesday 31 January 2024 12:00 UTC
+        now = datetime.datetime(2024, 1, 31, 12, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(get_next_boundary('daily', 'Asia/Jakarta', now),
+                         datetime.datetime(2024, 1, 31, 17, 0, tzinfo=datetime.timezone.utc))
+        self.assertEqual(get_next_boundary('weekly', 'UTC', now),
+                         datetime.datetime(2024, 2, 5, 0, 0, tzinfo=datetime.timezone.utc))
+        self.assertEqual(get_next_boundary('monthly', 'UTC', now),
+                         datetime.datetime(2024, 2, 1, 0, 0, tzinfo=datetime.timezone.utc))
+
+    def test_reset_scheduler(self):
+        """
+        Test that the scheduler only resets the timezones at the head of the heap and picks up new timezones.
+        """
+        scheduler = ResetScheduler(task_types=['daily'])
+        now = datetime.datetime(2023, 7, 2, 12, 0, tzinfo=datetime.timezone.utc)
+        # The profiles were never scheduled, so the first refresh catches them up
+        self.assertEqual(sorted(scheduler.refresh(now)), ['Asia/Jakarta', 'UTC'])
+        self.assertEqual(scheduler.refresh(now), [])
+        self.assertEqual(scheduler.seconds_until_next(now), 5 * 3600)
+
+        # Midnight in Asia/Jakarta is 17:00 UTC
+        now = datetime.datetime(2023, 7, 2, 17, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(scheduler.run_pending(now), [('Asia/Jakarta', 'daily')])
+        self.assertTrue(TaskHistory.objects.filter(
+            user=self.jakarta_user, date=datetime.date(2023, 7, 3)).exists())
+        self.assertFalse(TaskHistory.objects.filter(
+            user=self.utc_user, date=datetime.date(2023, 7, 3)).exists())
+
+        # A timezone changed through set_timezone is scheduled on the next refresh
+        UserProfile.objects.filter(user=self.utc_user).update(timezone='Asia/Tokyo')
+        self.assertEqual(scheduler.refresh(now), [])
+        self.assertIn('Asia/Tokyo', scheduler.zones)
+        self.assertNotIn('UTC', scheduler.zones)
+
+        # The stale UTC entry is dropped and midnight in Asia/Tokyo is 15:00 UTC
+        now = datetime.datetime(2023, 7, 3, 15, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(scheduler.run_pending(now), [('Asia/Tokyo', 'daily')])
+        self.assertTrue(TaskHistory.objects.filter(
+            user=self.utc_user, date=datetime.date(2023, 7, 4)).exists())
+
+    def test_reset_scheduler_catches_up_on_refresh(self):
+        """
+        Test that a refresh resets the profiles whose boundary passed while the scheduler was not running.
+        """
+        scheduler = ResetScheduler(task_types=['daily'], history_store='both')
+        now = datetime.datetime(2023, 7, 2, 12, 0, tzinfo=datetime.timezone.utc)
+        scheduler.refresh(now)
+
+        # The scheduler restarts two days later without running the boundaries in between
+        scheduler = ResetScheduler(task_types=['daily'], history_store='both')
+        now = datetime.datetime(2023, 7, 4, 12, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(sorted(scheduler.refresh(now)), ['Asia/Jakarta', 'UTC'])
+        for user in (self.utc_user, self.jakarta_user):
+            profile = UserProfile.objects.get(user=user)
+            self.assertEqual(profile.last_daily_reset, datetime.date(2023, 7, 4))
+            self.assertGreater(profile.next_daily_reset_at, now)
+        self.assertTrue(TaskCompletionBitmap.objects.exists())
+        self.assertEqual(scheduler.run_pending(now), [])
+
+    def test_reset_scheduler_retries_failed_zone(self):
+        """
+        Test that a failing reset is logged and retried with a backoff while the other timezones keep running.
+        """
+        scheduler = ResetScheduler(task_types=['daily'])
+        now = datetime.datetime(2023, 7, 2, 12, 0, tzinfo=datetime.timezone.utc)
+        scheduler.refresh(now)
+        real_reset_zone = reset_zone
+
+        def failing_reset_zone(zone, *args, **kwargs):
+            if zone == 'Asia/Jakarta':
+                raise RuntimeError('database unavailable')
+            return real_reset_zone(zone, *args, **kwargs)
+
+        now = datetime.datetime(2023, 7, 3, 0, 0, tzinfo=datetime.timezone.utc)
+        with mock.patch('taskmaster.resets.resets.reset_zone', side_effect=failing_reset_zone), \
+                self.assertLogs('taskmaster.resets.resets', 'ERROR'):
+            self.assertEqual(scheduler.run_pending(now), [('UTC', 'daily')])
+            # The failed zone is retried after 60 seconds, then after 120 seconds
+            retry = now + datetime.timedelta(seconds=60)
+            self.assertEqual(scheduler.seconds_until_next(now), 60)
+            self.assertEqual(scheduler.run_pending(retry), [])
+            self.assertEqual(scheduler.seconds_until_next(retry), 120)
+
+        retry += datetime.timedelta(seconds=120)
+        self.assertEqual(scheduler.run_pending(retry), [('Asia/Jakarta', 'daily')])
+        self.assertTrue(TaskHistory.objects.filter(
+            user=self.jakarta_user, date=datetime.date(2023, 7, 3)).exists())
+        self.assertEqual(scheduler.failures, {})
+        # The next boundary is scheduled again once the retry succeeded
+        self.assertEqual(sorted(zone for _, zone, _ in scheduler.heap), ['Asia/Jakarta', 'UTC'])
+
+
+class TimezonesTestCase(TestCase):
+    def test_canonicalize_timezone(self):
+        """
+        Test that timezone names are canonicalized and invalid names are rejected.
+        """
+        self.assertEqual(canonicalize_timezone('asia/jakarta '), 'Asia/Jakarta')
+        self.assertEqual(canonicalize_timezone('UTC'), 'UTC')
+        self.assertIsNone(canonicalize_timezone('Mars/Olympus'))
+        self.assertIsNone(canonicalize_timezone(None))
+
+    def test_get_boundaries(self):
+        """
+        Test the UTC boundaries of the day, week and month across a daylight saving transition.
+        """
+        # Sunday 31 March 2024, clocks go forward in Europe/Amsterdam at 02:00
+        boundaries = get_boundaries('Europe/Amsterdam', datetime.date(2024, 3, 31))
+        self.assertEqual(boundaries['daily'], (
+            datetime.datetime(2024, 3, 30, 23, 0, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2024, 3, 31, 22, 0, tzinfo=datetime.timezone.utc)))
+        self.assertEqual(boundaries['weekly'][0], datetime.datetime(
+            2024, 3, 24, 23, 0, tzinfo=datetime.timezone.utc))
+        self.assertEqual(boundaries['monthly'][1], datetime.datetime(
+            2024, 3, 31, 22, 0, tzinfo=datetime.timezone.utc))
+        self.assertIs(get_timezone('Europe/Amsterdam'),
+                      get_timezone('Europe/Amsterdam'))
+
+    def test_set_timezone_invalid(self):
+        """
+        Test that an invalid timezone is rejected and a valid one is stored canonicalized.
+        """
+        user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        response = self.client.post(reverse('set_timezone'), json.dumps(
+            {'timeZone': 'Mars/Olympus'}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UserProfile.objects.get(user=user).timezone, 'UTC')
+
+        response = self.client.post(reverse('set_timezone'), json.dumps(
+            {'timeZone': 'asia/jakarta'}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserProfile.objects.get(
+            user=user).timezone, 'Asia/Jakarta')
+
+
+class TaskTypeTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+
+    def test_task_type_follows_flags(self):
+        """
+        Test that the task type is derived from the daily, weekly and monthly flags on save.
+        """
+        task = Task.objects.create(user=self.user, title='Task', description='task',
+                                   daily=True, execution_time='08:00')
+        self.assertEqual(task.task_type, 'daily')
+
+        task.daily = False
+        task.monthly = True
+        task.execution_date = 1
+        task.save(update_fields=['daily', 'monthly', 'execution_date'])
+        self.assertEqual(Task.objects.get(pk=task.pk).task_type, 'monthly')
+
+    def test_backfill_task_type(self):
+        """
+        Test that the backfill command fills the task type and weekday of tasks written without save().
+        """
+        Task.objects.bulk_create([
+            Task(user=self.user, title='Daily', description='daily', daily=True),
+            Task(user=self.user, title='Weekly', description='weekly',
+                 weekly=True, execution_day='Monday'),
+            Task(user=self.user, title='Monthly', description='monthly',
+                 monthly=True, execution_date=1),
+        ])
+        self.assertEqual(Task.objects.filter(task_type__isnull=True).count(), 3)
+
+        out = StringIO()
+        call_command('backfill_task_type', batch_size=2, stdout=out)
+        self.assertIn('Task type and weekday filled for 3 rows.', out.getvalue())
+        self.assertEqual(sorted(Task.objects.values_list('task_type', flat=True)),
+                         ['daily', 'monthly', 'weekly'])
+        self.assertEqual(Task.objects.get(weekly=True).execution_weekday, 1)
+
+
+class HistoryPartitionsTestCase(TestCase):
+    def test_partition_names(self):
+        """
+        Test that partition names round-trip to their month and other tables are ignored.
+        """
+        name = get_partition_name(datetime.date(2024, 7, 1))
+        self.assertEqual(name, 'taskmaster_taskhistory_p202407')
+        self.assertEqual(parse_partition_name(name), datetime.date(2024, 7, 1))
+        self.assertIsNone(parse_partition_name('taskmaster_taskhistory_p202413'))
+        self.assertIsNone(parse_partition_name('taskmaster_task_p202407'))
+        # The DEFAULT partition never holds a month of its own
+        self.assertEqual(get_default_partition_name(), 'taskmaster_taskhistory_pdefault')
+        self.assertIsNone(parse_partition_name(get_default_partition_name()))
+
+    def test_get_months(self):
+        """
+        Test the months covered across a year boundary.
+        """
+        self.assertEqual(get_months(datetime.date(2023, 11, 1), datetime.date(2024, 2, 1)), [
+            datetime.date(2023, 11, 1), datetime.date(2023, 12, 1),
+            datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)])
+
+    def test_get_expired_partitions(self):
+        """
+        Test that only the partitions whose whole month is before the cutoff expire, oldest first.
+        """
+        names = [get_partition_name(datetime.date(2024, month, 1)) for month in (3, 1, 2)]
+        self.assertEqual(get_expired_partitions(names + ['taskmaster_taskhistory_legacy', get_default_partition_name()],
+                                                datetime.date(2024, 3, 1)),
+                         ['taskmaster_taskhistory_p202401', 'taskmaster_taskhistory_p202402'])
+
+    def test_manage_history_partitions_requires_postgresql(self):
+        """
+        Test that the partition command refuses to run on other databases.
+        """
+        with self.assertRaises(CommandError):
+            call_command('manage_history_partitions')
+
+
+class HistoryCompactionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.factory = RequestFactory()
+
+        # Daily history from 1 to 10 June 2023, completed every other day, and one day in July
+        for day in range(1, 11):
+            TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 6, day),
+                                       title='Daily', description='daily', execution_time='08:00',
+                                       completed=day % 2 == 0)
+        TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 7, 1),
+                                   title='Daily', description='daily', execution_time='08:00', completed=True)
+
+    def test_get_compaction_cutoff(self):
+        """
+        Test that the cutoff is the 1st of the month of the retention age, so only whole months compact.
+        """
+        self.assertEqual(get_compaction_cutoff(datetime.date(2023, 10, 15), 90),
+                         datetime.date(2023, 7, 1))
+
+    def test_compact_history(self):
+        """
+        Test that old history is folded into one summary per task and month and deleted, in chunks.
+        """
+        self.assertEqual(compact_history(datetime.date(2023, 7, 1), batch_size=3), 10)
+
+        summary = TaskHistorySummary.objects.get(user=self.user)
+        self.assertEqual(summary.month, datetime.date(2023, 6, 1))
+        self.assertEqual((summary.first_date, summary.last_date),
+                         (datetime.date(2023, 6, 1), datetime.date(2023, 6, 10)))
+        self.assertEqual((summary.days_completed, summary.days_missed), (5, 5))
+        self.assertEqual(list(TaskHistory.objects.values_list('date', flat=True)),
+                         [datetime.date(2023, 7, 1)])
+
+        # A second run finds nothing left to compact
+        self.assertEqual(compact_history(datetime.date(2023, 7, 1)), 0)
+
+    def test_export_reads_summaries(self):
+        """
+        Test that the export lists the compacted months from the summaries before the detailed history.
+        """
+        call_command('compact_history', older_than_days=0, stdout=StringIO())
+        TaskHistory.objects.create(user=self.user, task_type='daily', date=timezone.now().date(),
+                                   title='Daily', description='daily', execution_time='08:00', completed=True)
+
+        request = self.factory.get('/export/')
+        request.user = self.user
+        workbook = load_workbook(BytesIO(export_task_to_excel(request).content))
+        sheet = workbook['Daily']
+        self.assertEqual(sheet.cell(row=3, column=1).value, '01-06-2023 - 10-06-2023')
+        self.assertEqual(sheet.cell(row=3, column=4).value, '08:00')
+        self.assertEqual(sheet.cell(row=3, column=5).value, '5 of 10')
+        self.assertEqual(sheet.cell(row=4, column=1).value, '01-07-2023 - 01-07-2023')
+        self.assertEqual(sheet.cell(row=5, column=5).value, 'yes')
+
+
+class TaskCounterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username='testuser', password='testpassword')
+
+    def assertCounters(self, **expected):
+        counters = TaskCounter.objects.get(pk=self.user.pk)
+        for field, value in expected.items():
+            self.assertEqual(getattr(counters, field), value, field)
+
+    def test_view_write_paths(self):
+        """
+        Test that adding, completing, editing and deleting a task through the views keeps the counters in sync.
+        """
+        self.client.post(reverse('add_task'), {
+            'title': 'Task', 'description': 'task', 'daily': True, 'execution_time': '08:00'})
+        task = Task.objects.get(user=self.user)
+        self.assertCounters(daily_total=1, daily_completed=0)
+
+        self.client.post(reverse('mark_task_complete', args=[task.id]))
+        self.assertCounters(daily_total=1, daily_completed=1)
+
+        self.client.post(reverse('edit_task', args=[task.id]), {
+            'title': 'Task', 'description': 'task', 'weekly': True, 'completed': True,
+            'execution_day': 'Monday', 'execution_time': '08:00'})
+        self.assertCounters(daily_total=0, daily_completed=0,
+                            weekly_total=1, weekly_completed=1)
+
+        self.client.post(reverse('delete_task', args=[task.id]))
+        self.assertCounters(weekly_total=0, weekly_completed=0)
+
+        # The dashboard reads the counters
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['total_weekly_tasks'], 0)
+
+    def test_api_write_paths(self):
+        """
+        Test that the API create, complete and destroy keep the counters in sync.
+        """
+        response = self.client.post('/api/tasks/', {
+            'user': self.user.id, 'title': 'Task', 'description': 'task', 'monthly': True,
+            'execution_date': 1, 'execution_time': '08:00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertCounters(monthly_total=1, monthly_completed=0)
+
+        task_id = response.data['id']
+        self.client.post(f'/api/tasks/{task_id}/complete/')
+        self.assertCounters(monthly_total=1, monthly_completed=1)
+
+        self.client.delete(f'/api/tasks/{task_id}/')
+        self.assertCounters(monthly_total=0, monthly_completed=0)
+
+    def test_reset_and_rebuild(self):
+        """
+        Test that a reset zeroes the completed counters and the rebuild command repairs drift.
+        """
+        UserProfile.objects.filter(user=self.user).update(
+            last_daily_reset=datetime.date(2000, 1, 1))
+        Task.objects.create(user=self.user, title='Task', description='task',
+                            daily=True, completed=True, execution_time='08:00')
+        self.assertEqual(get_counters(self.user).daily_completed, 1)
+
+        reset_tasks(['daily'])
+        self.assertCounters(daily_total=1, daily_completed=0)
+
+        # Tasks written around the counters are picked up by a rebuild
+        Task.objects.create(user=self.user, title='Other', description='other',
+                            daily=True, execution_time='09:00')
+        out = StringIO()
+        call_command('rebuild_task_counters', stdout=out)
+        self.assertIn('Task counters rebuilt for 1 users.', out.getvalue())
+        self.assertCounters(daily_total=2, daily_completed=0)
+
+
+class WeeklyTaskOrderingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_weekly_order_by_weekday(self):
+        """
+        Test that weekly tasks are ordered by completion, weekday number and time, and filtered by day name.
+        """
+        for title, day, completed in (('Sunday', 'Sunday', False), ('Done', 'Monday', True),
+                                      ('Wednesday', 'Wednesday', False), ('Monday', 'Monday', False)):
+            Task.objects.create(user=self.user, title=title, description=title, weekly=True,
+                                completed=completed, execution_day=day, execution_time='08:00')
+        self.assertEqual(Task.objects.get(title='Sunday').execution_weekday, 7)
+
+        response = self.client.get(f'/api/tasks/?weekly=true&user_id={self.user.id}')
+        self.assertEqual([task['title'] for task in response.data],
+                         ['Monday', 'Wednesday', 'Sunday', 'Done'])
+        self.assertEqual(response.data[0]['execution_day'], 'Monday')
+
+        response = self.client.get(f'/api/tasks/?weekly=true&days=monday&user_id={self.user.id}')
+        self.assertEqual([task['title'] for task in response.data], ['Monday', 'Done'])
+
+
+class CompletionRollupTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        UserProfile.objects.create(user=self.user, timezone='UTC',
+                                   last_daily_reset=datetime.date(2023, 6, 30))
+        Task.objects.create(user=self.user, title='Done', description='done',
+                            daily=True, completed=True, execution_time='08:00')
+        Task.objects.create(user=self.user, title='Missed', description='missed',
+                            daily=True, execution_time='09:00')
+
+    def test_reset_writes_rollup(self):
+        """
+        Test that a reset rolls up the completion of the period with the history date.
+        """
+        now = datetime.datetime(2023, 7, 1, 1, 0, tzinfo=datetime.timezone.utc)
+        reset_tasks(['daily'], now)
+        rollup = TaskCompletionRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.task_type, rollup.date, rollup.completed, rollup.total),
+                         ('daily', datetime.date(2023, 7, 1), 1, 2))
+
+    def test_completion_api(self):
+        """
+        Test the completion series endpoint with its date range and validation.
+        """
+        for day, completed in ((1, 2), (2, 1), (3, 0)):
+            TaskCompletionRollup.objects.create(user=self.user, task_type='daily',
+                                                date=datetime.date(2023, 7, day), completed=completed, total=2)
+
+        other = User.objects.create_user(username='otheruser', password='testpassword')
+        TaskCompletionRollup.objects.create(user=other, task_type='daily',
+                                            date=datetime.date(2023, 7, 2), completed=0, total=1)
+
+        # The series is only served to an authenticated user
+        response = self.client.get('/api/completion/')
+        self.assertIn(response.status_code, (401, 403))
+
+        # The API authenticates with the JWT access token of the user
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        response = self.client.get('/api/completion/?task_type=daily&since=2023-07-02&until=2023-07-03')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['date'], row['rate']) for row in response.data],
+                         [('2023-07-02', 0.5), ('2023-07-03', 0.0)])
+
+        # Another user's rows are never served, whatever the parameters
+        response = self.client.get(f'/api/completion/?user_id={other.id}&since=2023-07-02&until=2023-07-02')
+        self.assertEqual([row['rate'] for row in response.data], [0.5])
+
+        response = self.client.get('/api/completion/?since=yesterday')
+        self.assertEqual(response.status_code, 404)
+
+    def test_backfill_completion_rollup(self):
+        """
+        Test that the backfill command rolls up the existing history per user, task type and date.
+        """
+        for completed in (True, False, False):
+            TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 6, 1),
+                                       title='Task', description='task', execution_time='08:00',
+                                       completed=completed)
+        out = StringIO()
+        call_command('backfill_completion_rollup', stdout=out)
+        self.assertIn('1 completion rollup rows written.', out.getvalue())
+        rollup = TaskCompletionRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.completed, rollup.total), (1, 3))
+
+    def test_backfill_reads_archived_and_carried_history(self):
+        """
+        Test that the backfill counts the archived rows and repeats the carried rows for every period.
+        """
+        task = Task.objects.get(title='Done')
+        TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2020, 1, 1),
+                                   title='Old', description='old', execution_time='08:00', completed=True)
+        # The task was completed on June 28th and unchanged on the resets up to June 30th
+        TaskHistory.objects.create(user=self.user, task=task, task_type='daily', date=datetime.date(2023, 6, 28),
+                                   execution_time='08:00', completed=True, carry_forward=True)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with self.settings(TASK_HISTORY_ARCHIVE_DIR=directory.name):
+            archive_history(datetime.date(2021, 1, 1))
+            self.assertEqual(TaskHistory.objects.count(), 1)
+            self.assertEqual(backfill_rollups(), 4)
+
+        self.assertEqual(list(TaskCompletionRollup.objects.filter(user=self.user).order_by('date').values_list(
+            'date', 'completed', 'total')), [
+            (datetime.date(2020, 1, 1), 1, 1),
+            (datetime.date(2023, 6, 28), 1, 1),
+            (datetime.date(2023, 6, 29), 1, 1),
+            (datetime.date(2023, 6, 30), 1, 1),
+        ])
+
+
+class TaskSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        UserProfile.objects.create(user=self.user, timezone='UTC',
+                                   last_daily_reset=datetime.date(2023, 6, 29))
+        self.task = Task.objects.create(user=self.user, title='Daily', description='daily',
+                                        daily=True, completed=True, execution_time='08:00')
+
+    def test_reset_history_shares_snapshot(self):
+        """
+        Test that the history of an unchanged task references one snapshot instead of copying the text.
+        """
+        reset_tasks(['daily'], datetime.datetime(2023, 6, 30, 1, 0, tzinfo=datetime.timezone.utc))
+        reset_tasks(['daily'], datetime.datetime(2023, 7, 1, 1, 0, tzinfo=datetime.timezone.utc))
+
+        history = TaskHistory.objects.filter(user=self.user)
+        self.assertEqual(history.count(), 2)
+        self.assertEqual(set(history.values_list('snapshot', flat=True)), {self.task.snapshot_id})
+        self.assertEqual(set(history.values_list('title', 'description')), {('', '')})
+        self.assertEqual(history.first().get_text(), ('Daily', 'daily'))
+
+        # Editing the text moves the task to a new snapshot
+        self.task.description = 'edited'
+        self.task.save()
+        self.assertEqual(TaskSnapshot.objects.count(), 2)
+
+    def test_save_only_snapshots_changed_text(self):
+        """
+        Test that saving a task looks its snapshot up again only when the title or description changed.
+        """
+        snapshot_table = TaskSnapshot._meta.db_table
+        task = Task.objects.get(pk=self.task.pk)
+        task.completed = False
+        with CaptureQueriesContext(connection) as queries:
+            task.save()
+        self.assertFalse([query for query in queries.captured_queries if snapshot_table in query['sql']])
+
+        task.title = 'Renamed'
+        task.save()
+        self.assertEqual(Task.objects.get(pk=self.task.pk).snapshot.title, 'Renamed')
+
+        # A task without a snapshot yet gets one on its next save
+        Task.objects.filter(pk=self.task.pk).update(snapshot=None)
+        task = Task.objects.get(pk=self.task.pk)
+        task.save()
+        self.assertEqual((task.snapshot.title, task.snapshot.description), ('Renamed', 'daily'))
+
+    def test_get_snapshots(self):
+        """
+        Test that snapshots are created once per distinct text.
+        """
+        snapshots = get_snapshots([('Daily', 'daily'), ('Other', 'other'), ('Other', 'other')])
+        self.assertEqual(snapshots[('Daily', 'daily')], self.task.snapshot_id)
+        self.assertEqual(TaskSnapshot.objects.count(), 2)
+
+    def test_dedupe_task_history(self):
+        """
+        Test that the dedupe command moves the text of existing history into snapshots.
+        """
+        for day in (1, 2):
+            TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 6, day),
+                                       title='Daily', description='daily', execution_time='08:00')
+        out = StringIO()
+        call_command('dedupe_task_history', stdout=out)
+        self.assertIn('Snapshots assigned to 0 tasks and 2 history rows.', out.getvalue())
+        self.assertEqual(set(TaskHistory.objects.values_list('snapshot', 'title')),
+                         {(self.task.snapshot_id, '')})
+
+
+class CompletionBitmapTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.profile = UserProfile.objects.create(user=self.user, timezone='UTC',
+                                                  last_daily_reset=datetime.date(2023, 12, 30))
+        self.task = Task.objects.create(user=self.user, title='Daily', description='daily',
+                                        daily=True, execution_time='08:00')
+
+    def reset(self, day, completed, history_store='bitmaps'):
+        """
+        Complete the task or not, then run the daily reset starting the given day.
+        """
+        Task.objects.filter(pk=self.task.pk).update(completed=completed)
+        now = datetime.datetime.combine(day, datetime.time(1, 0), tzinfo=datetime.timezone.utc)
+        reset_tasks(['daily'], now, history_store=history_store)
+
+    def test_bitmaps_only_store(self):
+        """
+        Test that the bitmaps store sets the bits of the period and writes no history row.
+        """
+        self.reset(datetime.date(2023, 12, 31), True)
+        self.reset(datetime.date(2024, 1, 1), False)
+        self.reset(datetime.date(2024, 1, 2), True)
+
+        self.assertFalse(TaskHistory.objects.exists())
+        self.assertEqual(TaskCompletionBitmap.objects.filter(task=self.task).count(), 2)
+        self.assertEqual(get_heatmap(self.task, 2024),
+                         {datetime.date(2024, 1, 1): False, datetime.date(2024, 1, 2): True})
+        self.assertEqual(get_completion_rate(self.task, datetime.date(2023, 12, 1), datetime.date(2024, 1, 31)),
+                         (2, 3))
+        self.assertEqual(get_streak(self.task, datetime.date(2024, 1, 2)), 1)
+        self.assertFalse(Task.objects.get(pk=self.task.pk).completed)
+
+    def test_streak_spans_years(self):
+        """
+        Test that a streak continues across the turn of the year and skips days without a reset.
+        """
+        self.reset(datetime.date(2023, 12, 31), True, history_store='both')
+        # No reset on January 1st, e.g. the job did not run
+        self.profile.refresh_from_db()
+        self.reset(datetime.date(2024, 1, 2), True, history_store='both')
+
+        self.assertEqual(TaskHistory.objects.count(), 2)
+        self.assertEqual(get_streak(self.task, datetime.date(2024, 1, 2)), 2)
+        self.assertEqual(get_streak(self.task, datetime.date(2023, 12, 31)), 1)
+        self.assertEqual(get_streak(self.task, datetime.date(2022, 12, 31)), 0)
+
+    def test_bitmaps_recorded_in_batches(self):
+        """
+        Test that the tasks are recorded batch by batch and every batch sets its own bits.
+        """
+        other = Task.objects.create(user=self.user, title='Other', description='other',
+                                    daily=True, execution_time='09:00', completed=True)
+        with mock.patch('taskmaster.history.bitmaps.BITMAP_BATCH_SIZE', 1):
+            self.reset(datetime.date(2023, 12, 31), False)
+
+        self.assertEqual(get_heatmap(self.task, 2023), {datetime.date(2023, 12, 31): False})
+        self.assertEqual(get_heatmap(other, 2023), {datetime.date(2023, 12, 31): True})
+
+    def test_bitmaps_outlive_deleted_task(self):
+        """
+        Test that deleting a task keeps its bitmaps, like its history rows, without the task reference.
+        """
+        self.reset(datetime.date(2023, 12, 31), True)
+        self.task.delete()
+
+        bitmap = TaskCompletionBitmap.objects.get(user=self.user)
+        self.assertIsNone(bitmap.task_id)
+        self.assertEqual(to_int(bitmap.completed), 1 << get_day_bit(datetime.date(2023, 12, 31)))
+
+
+class CarryForwardHistoryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        UserProfile.objects.create(user=self.user, timezone='UTC',
+                                   last_daily_reset=datetime.date(2023, 6, 30))
+        self.task = Task.objects.create(user=self.user, title='Daily', description='daily',
+                                        daily=True, execution_time='08:00')
+
+    def reset(self, day, completed):
+        """
+        Complete the task or not, then run the daily reset starting the given day in the changes store.
+        """
+        Task.objects.filter(pk=self.task.pk).update(completed=completed)
+        now = datetime.datetime.combine(day, datetime.time(1, 0), tzinfo=datetime.timezone.utc)
+        reset_tasks(['daily'], now, history_store='changes')
+
+    def expanded(self):
+        """
+        Return the expanded history of the user as (date, completed) pairs.
+        """
+        rows = TaskHistory.objects.filter(user=self.user).order_by('date', 'pk')
+        return [(day, row.completed) for day, row in expand_history(rows, get_last_resets(self.user))]
+
+    def test_only_changes_are_written(self):
+        """
+        Test that unchanged tasks write no history row and are carried forward on read.
+        """
+        for day, completed in ((1, False), (2, False), (3, True), (4, True), (5, False)):
+            self.reset(datetime.date(2023, 7, day), completed)
+
+        self.assertEqual(list(TaskHistory.objects.order_by('date').values_list('date', 'completed')),
+                         [(datetime.date(2023, 7, 1), False), (datetime.date(2023, 7, 3), True),
+                          (datetime.date(2023, 7, 5), False)])
+        self.assertEqual(self.expanded(), [(datetime.date(2023, 7, day), completed) for day, completed in (
+            (1, False), (2, False), (3, True), (4, True), (5, False))])
+
+        # A new title is a change
+        self.task.refresh_from_db()
+        self.task.title = 'Renamed'
+        self.task.save()
+        self.reset(datetime.date(2023, 7, 6), False)
+        self.assertEqual(TaskHistory.objects.count(), 4)
+
+    def test_deleted_task_stops_carrying(self):
+        """
+        Test that deleting a task closes its carried history at the last reset.
+        """
+        self.reset(datetime.date(2023, 7, 1), True)
+        self.reset(datetime.date(2023, 7, 2), True)
+        self.task.refresh_from_db()
+        self.task.delete()
+        self.reset(datetime.date(2023, 7, 3), True)
+
+        history = TaskHistory.objects.get()
+        self.assertEqual((history.task_id, history.carried_until), (None, datetime.date(2023, 7, 2)))
+        self.assertEqual(self.expanded(), [(datetime.date(2023, 7, 1), True), (datetime.date(2023, 7, 2), True)])
+
+    def test_deleted_task_with_several_changes(self):
+        """
+        Test that deleting a task with several changes closes every row before the next one, bulk deletes too.
+        """
+        days = ((1, False), (2, True), (3, True), (4, False), (5, True))
+        for day, completed in days:
+            self.reset(datetime.date(2023, 7, day), completed)
+        self.assertEqual(TaskHistory.objects.count(), 4)
+        expected = [(datetime.date(2023, 7, day), completed) for day, completed in days]
+        self.assertEqual(self.expanded(), expected)
+
+        Task.objects.filter(pk=self.task.pk).delete()
+        self.assertFalse(TaskHistory.objects.filter(task__isnull=False).exists())
+        self.assertEqual(self.expanded(), expected)
+        self.assertEqual(list(TaskHistory.objects.order_by('date').values_list('carried_until', flat=True)),
+                         [datetime.date(2023, 7, day) for day in (1, 3, 4, 5)])
+
+        # A range starting after the changes only carries the row standing for it
+        history = [(day, row.completed) for day, row in iter_history(
+            self.user, 'daily', get_last_resets(self.user), datetime.date(2023, 7, 3))]
+        self.assertEqual(history, expected[2:])
+
+    def test_export_expands_carried_rows(self):
+        """
+        Test that the Excel export lists every period of a carried-forward row.
+        """
+        self.reset(datetime.date(2023, 7, 1), True)
+        self.reset(datetime.date(2023, 7, 2), True)
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.get(reverse('export'))
+        sheet = load_workbook(BytesIO(response.content))['Daily']
+        dates = [row[0] for row in sheet.iter_rows(values_only=True) if row[4] in ('yes', 'no')]
+        self.assertEqual(dates, ['01-07-2023', '02-07-2023'])
+
+    def test_history_range_reads_carried_rows_separately(self):
+        """
+        Test that a range starting after a carried-forward row carries it in without scanning the older history.
+        """
+        for day, completed in ((1, False), (2, True), (3, True), (4, True), (5, True)):
+            self.reset(datetime.date(2023, 7, day), completed)
+        # Carried row of a task deleted after the reset of 2 July
+        TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 7, 1),
+                                   title='Deleted', execution_time='09:00', carry_forward=True,
+                                   carried_until=datetime.date(2023, 7, 2))
+        last_resets = get_last_resets(self.user)
+        since = datetime.date(2023, 7, 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            history = [(day, row.get_text()[0], row.completed)
+                       for day, row in iter_history(self.user, 'daily', last_resets, since)]
+        self.assertEqual(history, [(datetime.date(2023, 7, 3), 'Daily', True),
+                                   (datetime.date(2023, 7, 4), 'Daily', True),
+                                   (datetime.date(2023, 7, 5), 'Daily', True)])
+        expected = [(day, row.completed) for day, row in iter_history(self.user, 'daily', last_resets)
+                    if day >= since and row.task_id is not None]
+        self.assertEqual([(day, completed) for day, _, completed in history], expected)
+
+        # The range is read with a plain date bound, the carried rows through their own query
+        range_query = [query['sql'] for query in queries.captured_queries if '"date" >=' in query['sql']]
+        self.assertEqual(len(range_query), 1)
+        self.assertNotIn('carry_forward', range_query[0].split('WHERE')[1])
+
+        # The carried row of the deleted task stands until it was closed
+        history = [day for day, row in iter_history(self.user, 'daily', last_resets, datetime.date(2023, 7, 2))
+                   if row.task_id is None]
+        self.assertEqual(history, [datetime.date(2023, 7, 2)])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Table partitioning requires PostgreSQL')
+class HistoryPartitionConversionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.task = Task.objects.create(user=self.user, title='Daily', description='daily',
+                                        daily=True, execution_time='08:00')
+        for day in (datetime.date(2023, 6, 15), datetime.date(2023, 7, 1), datetime.date(2023, 7, 2)):
+            TaskHistory.objects.create(user=self.user, task=self.task, task_type='daily', date=day,
+                                       title='Daily', description='daily', execution_time='08:00')
+
+    def get_schema(self):
+        """
+        Return the index names and the foreign key names and definitions of the task history table.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [get_history_table()])
+            indexes = {row[0] for row in cursor.fetchall()}
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [get_history_table()])
+            foreign_keys = set(cursor.fetchall())
+        return indexes, foreign_keys
+
+    def set_constraints_immediate(self):
+        """
+        Check the deferred foreign keys now, ALTER TABLE refuses a table with pending trigger events.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    def test_convert_table_holding_rows(self):
+        """
+        Test that converting a table holding rows keeps the rows, the indexes, the foreign keys and the IDs.
+        """
+        self.set_constraints_immediate()
+        indexes, foreign_keys = self.get_schema()
+        last_pk = TaskHistory.objects.order_by('-pk').values_list('pk', flat=True).first()
+
+        self.assertEqual(convert_to_partitioned(), 2)
+        self.assertTrue(is_partitioned())
+        self.assertEqual(sorted(list_partitions()), sorted([
+            get_partition_name(datetime.date(2023, 6, 1)), get_partition_name(datetime.date(2023, 7, 1)),
+            get_default_partition_name()]))
+        self.assertEqual(TaskHistory.objects.count(), 3)
+        self.assertEqual(self.get_schema(), (indexes, foreign_keys))
+        self.assertIn(f'{get_history_table()}_pkey', indexes)
+
+        # New rows keep counting IDs from the old table, in a month partition or the DEFAULT partition
+        for day in (datetime.date(2023, 7, 3), datetime.date(2023, 9, 1)):
+            row = TaskHistory.objects.create(user=self.user, task=self.task, task_type='daily', date=day,
+                                             title='Daily', description='daily', execution_time='08:00')
+            self.assertGreater(row.pk, last_pk)
+        self.assertEqual(TaskHistory.objects.filter(task=self.task).count(), 5)
+
+        # The foreign keys are enforced on the partitioned table
+        self.set_constraints_immediate()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TaskHistory.objects.create(user_id=self.user.pk + 1000, task_type='daily',
+                                       date=datetime.date(2023, 7, 4), title='Orphan', description='orphan',
+                                       execution_time='08:00')
+
+
+class HistoryArchiveTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        UserProfile.objects.create(user=self.user, timezone='UTC')
+        for day in range(1, 6):
+            TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2020, 1, day),
+                                       title='Old', description='old', execution_time='08:00',
+                                       completed=day % 2 == 0)
+        TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 1, 1),
+                                   title='Recent', description='recent', execution_time='08:00')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_archive_and_read_back(self):
+        """
+        Test that archived rows leave the database and are read back from the blocks of the user.
+        """
+        archived = archive_history(datetime.date(2021, 1, 1), self.directory.name, block_rows=2)
+        self.assertEqual(archived, 5)
+        self.assertEqual(list(TaskHistory.objects.values_list('title', flat=True)), ['Recent'])
+        self.assertEqual(TaskHistoryArchiveBlock.objects.filter(user=self.user).count(), 3)
+
+        rows = list(read_archived_history(self.user, 'daily', directory=self.directory.name))
+        self.assertEqual([(row.date.day, row.title, row.completed) for row in rows],
+                         [(day, 'Old', day % 2 == 0) for day in range(1, 6)])
+        self.assertEqual(rows[0].execution_time, datetime.time(8, 0))
+
+        rows = read_archived_history(self.user, 'daily', since=datetime.date(2020, 1, 3),
+                                     until=datetime.date(2020, 1, 3), directory=self.directory.name)
+        self.assertEqual([row.date.day for row in rows], [3])
+
+    def test_archive_to_other_directory(self):
+        """
+        Test that segments written outside the archive directory are read back from their absolute path.
+        """
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        with self.settings(TASK_HISTORY_ARCHIVE_DIR=archive_dir.name):
+            out = StringIO()
+            call_command('archive_history', '--before', '2021-01-01', '--directory', self.directory.name, stdout=out)
+            self.assertIn(f'archived to {self.directory.name}', out.getvalue())
+
+            segment = TaskHistoryArchiveBlock.objects.values_list('segment', flat=True).first()
+            self.assertTrue(os.path.isabs(segment))
+            self.assertEqual(os.listdir(archive_dir.name), [])
+            rows = list(read_archived_history(self.user, 'daily'))
+        self.assertEqual([row.date.day for row in rows], [1, 2, 3, 4, 5])
+
+    def test_export_reads_archive(self):
+        """
+        Test that the Excel export includes the archived history before the database history.
+        """
+        with self.settings(TASK_HISTORY_ARCHIVE_DIR=self.directory.name):
+            out = StringIO()
+            call_command('archive_history', '--before', '2021-01-01', stdout=out)
+            self.assertIn('5 history rows before 01-01-2021 archived', out.getvalue())
+
+            self.client.login(username='testuser', password='testpassword')
+            response = self.client.get(reverse('export'))
+        sheet = load_workbook(BytesIO(response.content))['Daily']
+        dates = [row[0] for row in sheet.iter_rows(values_only=True) if row[4] in ('yes', 'no')]
+        self.assertEqual(dates, [f'0{day}-01-2020' for day in range(1, 6)] + ['01-01-2023'])
+
+    def test_invalid_date(self):
+        """
+        Test that the archive command rejects an invalid date.
+        """
+        with self.assertRaises(CommandError):
+            call_command('archive_history', '--before', 'yesterday')
+
+
+class DashboardStatsCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.client.post(reverse('add_task'), {
+            'title': 'Daily', 'description': 'daily', 'execution_time': '08:00', 'daily': True})
+
+    def get_index(self):
+        """
+        Load the dashboard and return the response and the queries on the task and counter tables.
+        """
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        return response, [query['sql'] for query in queries.captured_queries
+                          if 'taskmaster_task' in query['sql']]
+
+    def test_repeat_loads_are_cached(self):
+        """
+        Test that repeat dashboard loads do not query the tasks or counters until a task changes.
+        """
+        response, queries = self.get_index()
+        self.assertContains(response, '1/1 daily tasks to complete')
+        self.assertTrue(queries)
+
+        response, queries = self.get_index()
+        self.assertContains(response, '1/1 daily tasks to complete')
+        self.assertEqual(queries, [])
+
+        # Completing the task bumps the version once the write commits
+        task = Task.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_task_complete', args=[task.pk]))
+        response, queries = self.get_index()
+        self.assertContains(response, 'You Have Completed All Daily Task')
+        self.assertTrue(queries)
+
+    def test_cache_error_does_not_fail_write(self):
+        """
+        Test that a cache error while dropping the version token is logged and the committed write still succeeds.
+        """
+        task = Task.objects.get(user=self.user)
+        with mock.patch('taskmaster.counters.counters.cache.delete_many', side_effect=RuntimeError('cache down')), \
+                self.assertLogs('django', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('mark_task_complete', args=[task.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Task.objects.get(pk=task.pk).completed)
+
+    def test_reset_command_invalidates_shared_cache(self):
+        """
+        Test that the cache is shared across processes and a reset command drops the cached statistics.
+        """
+        self.assertNotIn('LocMemCache', settings.CACHES['default']['BACKEND'])
+        UserProfile.objects.update_or_create(user=self.user, defaults={
+            'timezone': 'UTC', 'last_daily_reset': datetime.date(2000, 1, 1)})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_task_complete', args=[Task.objects.get(user=self.user).pk]))
+        response, _ = self.get_index()
+        self.assertContains(response, 'You Have Completed All Daily Task')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reset_tasks', '--types', 'daily', stdout=StringIO())
+        response, queries = self.get_index()
+        self.assertContains(response, '1/1 daily tasks to complete')
+        self.assertTrue(queries)
+
+
+class HistoryStreamingExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        for day in range(1, 4):
+            TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 7, day),
+                                       title='Daily, "quoted"', description='daily', execution_time='08:00',
+                                       completed=day == 2)
+        TaskHistory.objects.create(user=self.user, task_type='weekly', date=datetime.date(2023, 7, 3),
+                                   title='Weekly', description='weekly', execution_day='Monday',
+                                   execution_time='09:30')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_csv_export(self):
+        """
+        Test that the CSV export streams a header and one line per history row, filtered by task type and dates.
+        """
+        response = self.client.get(reverse('export_csv'), {'task_type': 'daily', 'since': '2023-07-02'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            'date,task_type,title,description,execution_day,execution_time,execution_date,completed,'
+            'last_date,days_completed,days_total',
+            '2023-07-02,daily,"Daily, ""quoted""",daily,,08:00,,true,2023-07-02,1,1',
+            '2023-07-03,daily,"Daily, ""quoted""",daily,,08:00,,false,2023-07-03,0,1',
+        ])
+
+    def test_ndjson_export(self):
+        """
+        Test that the NDJSON export streams one JSON object per history row of every task type.
+        """
+        response = self.client.get(reverse('export_ndjson'), {'until': '2023-07-01'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(record['date'], record['task_type']) for record in records],
+                         [('2023-07-01', 'daily')])
+
+        response = self.client.get(reverse('export_ndjson'), {'task_type': 'weekly'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(records, [{
+            'date': '2023-07-03', 'task_type': 'weekly', 'title': 'Weekly', 'description': 'weekly',
+            'execution_day': 'Monday', 'execution_time': '09:30', 'execution_date': None, 'completed': False,
+            'last_date': '2023-07-03', 'days_completed': 0, 'days_total': 1}])
+
+    def test_export_includes_compacted_months(self):
+        """
+        Test that a compacted month is exported as one record spanning its days, before the detailed history.
+        """
+        for day in range(1, 4):
+            TaskHistory.objects.create(user=self.user, task_type='daily', date=datetime.date(2023, 1, day),
+                                       title='Old', description='old', execution_time='07:00', completed=True)
+        compact_history(datetime.date(2023, 2, 1))
+
+        response = self.client.get(reverse('export_csv'), {'task_type': 'daily', 'until': '2023-07-01'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1:], [
+            '2023-01-01,daily,Old,old,,07:00,,,2023-01-03,3,3',
+            '2023-07-01,daily,"Daily, ""quoted""",daily,,08:00,,false,2023-07-01,0,1',
+        ])
+
+        response = self.client.get(reverse('export_ndjson'), {'task_type': 'daily', 'since': '2023-01-02'})
+        record = json.loads(b''.join(response.streaming_content).splitlines()[0])
+        self.assertEqual((record['date'], record['last_date'], record['completed'], record['days_completed'],
+                          record['days_total']), ('2023-01-01', '2023-01-03', None, 3, 3))
+
+    def test_invalid_filters(self):
+        """
+        Test that invalid filters are rejected with a 400 response.
+        """
+        for params in ({'task_type': 'yearly'}, {'since': 'yesterday'},
+                       {'since': '2023-07-03', 'until': '2023-07-01'}):
+            self.assertEqual(self.client.get(reverse('export_csv'), params).status_code, 400)
+
+
+class HistoryExportCursorTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        UserProfile.objects.create(user=self.user, timezone='UTC',
+                                   last_daily_reset=datetime.date(2023, 6, 30))
+        Task.objects.create(user=self.user, title='Daily', description='daily',
+                            daily=True, execution_time='08:00')
+        self.client.login(username='testuser', password='testpassword')
+
+    def reset(self, day):
+        """
+        Run the daily reset starting the given day.
+        """
+        reset_tasks(['daily'], datetime.datetime.combine(day, datetime.time(1, 0), tzinfo=datetime.timezone.utc))
+
+    def sync(self, **params):
+        """
+        Export the history as NDJSON and return the exported dates and the next cursor.
+        """
+        response = self.client.get(reverse('export_ndjson'), params)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        return [record['date'] for record in records], response['X-Next-Cursor']
+
+    def test_cursor_resumes_after_last_sync(self):
+        """
+        Test that a sync with the cursor of the previous one only returns the history written since.
+        """
+        self.reset(datetime.date(2023, 7, 1))
+        self.reset(datetime.date(2023, 7, 2))
+        dates, cursor = self.sync()
+        self.assertEqual(dates, ['2023-07-01', '2023-07-02'])
+
+        dates, same_cursor = self.sync(cursor=cursor)
+        self.assertEqual(dates, [])
+
+        self.reset(datetime.date(2023, 7, 3))
+        dates, _ = self.sync(cursor=same_cursor)
+        self.assertEqual(dates, ['2023-07-03'])
+
+        # The cursor also applies to the Excel export
+        response = self.client.get(reverse('export'), {'cursor': same_cursor})
+        sheet = load_workbook(BytesIO(response.content))['Daily']
+        self.assertEqual([row[0] for row in sheet.iter_rows(min_row=3, values_only=True)], ['03-07-2023'])
+        self.assertIn('X-Next-Cursor', response)
+
+    def test_cursor_waits_for_history_of_new_task_type(self):
+        """
+        Test that the cursor does not move past a task type that was never reset and has no history.
+        """
+        dates, cursor = self.sync(until='2023-07-31')
+        self.assertEqual(dates, [])
+
+        # The first weekly history is written after the sync, dated before its requested end
+        TaskHistory.objects.create(user=self.user, task_type='weekly', date=datetime.date(2023, 7, 3),
+                                   title='Weekly', description='weekly', execution_day='Monday',
+                                   execution_time='08:00')
+        UserProfile.objects.filter(user=self.user).update(last_weekly_reset=datetime.date(2023, 7, 3))
+        dates, _ = self.sync(cursor=cursor)
+        self.assertEqual(dates, ['2023-07-03'])
+
+    def test_invalid_cursor(self):
+        """
+        Test that a tampered cursor is rejected with a 400 response.
+        """
+        self.assertEqual(self.client.get(reverse('export_csv'), {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export'), {'cursor': 'not-a-cursor'}).status_code, 400)
+
+
+class EmbeddedTaskListTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        for title, execution_time in (('Late', '20:00'), ('Early', '06:00'), ('Done', '04:00')):
+            self.client.post(reverse('add_task'), {
+                'title': title, 'description': title, 'execution_time': execution_time, 'daily': True})
+        Task.objects.filter(title='Done').update(completed=True)
+
+    def test_tasks_embedded_in_list_order(self):
+        """
+        Test that the task page embeds the tasks in the same order and format as the API.
+        """
+        response = self.client.get(reverse('dailytask'))
+        embedded = json.loads(re.search(
+            r'<script id="initial-tasks" type="application/json">(.*?)</script>',
+            response.content.decode(), re.S).group(1))
+        self.assertEqual([task['title'] for task in embedded], ['Early', 'Late', 'Done'])
+
+        api_response = self.client.get('/api/tasks/', {'daily': 'true', 'user_id': self.user.id})
+        self.assertEqual(embedded, api_response.json())
+        # Only the serialized tasks reach the template
+        self.assertNotIn('tasks', response.context)
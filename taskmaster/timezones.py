@@ -0,0 +1,171 @@
+"""
+This module contains the timezone helpers shared by the middleware, the API and the reset jobs.
+
+Zone names are validated and canonicalized before they are stored, so an invalid zone never reaches the
+request or reset hot paths. Zone objects and the UTC instants of the local midnight, week start and month
+start of every zone and local day are cached, so each of them is only built once per process.
+"""
+import datetime
+from functools import lru_cache
+from types import MappingProxyType
+import pytz
+
+
+# Timezone of profiles that never sent one, and fallback for invalid names
+DEFAULT_TIMEZONE = 'UTC'
+
+# Lower-cased zone names mapped to their canonical spelling
+_CANONICAL_ZONES = {name.lower(): name for name in pytz.all_timezones}
+
+
+def canonicalize_timezone(name):
+    """
+    Return the canonical spelling of a timezone name.
+
+    Args:
+        name (str): The timezone name, e.g. as sent by the browser.
+
+    Returns:
+        str or None: The canonical timezone name, or None if the name is not a known timezone.
+    """
+    if not isinstance(name, str):
+        return None
+    return _CANONICAL_ZONES.get(name.strip().lower())
+
+
+def is_valid_timezone(name):
+    """
+    Check whether a timezone name is a known timezone.
+
+    Args:
+        name (str): The timezone name.
+
+    Returns:
+        bool: True if the name is a known timezone, False otherwise.
+    """
+    return canonicalize_timezone(name) is not None
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """
+    Return the cached timezone object of a timezone name.
+
+    Args:
+        name (str): The timezone name.
+
+    Returns:
+        pytz.tzinfo.BaseTzInfo: The timezone object.
+
+    Raises:
+        pytz.UnknownTimeZoneError: If the name is not a known timezone.
+    """
+    return pytz.timezone(name)
+
+
+def get_local_date(name, now):
+    """
+    Return the local date of an instant in a timezone.
+
+    Args:
+        name (str): The timezone name.
+        now (datetime.datetime): An aware datetime.
+
+    Returns:
+        datetime.date: The date in the timezone.
+    """
+    return now.astimezone(get_timezone(name)).date()
+
+
+def get_period_start(task_type, local_date):
+    """
+    Return the first day of the reset period that contains a local date.
+
+    Args:
+        task_type (str): The type of task (daily, weekly, or monthly).
+        local_date (datetime.date): A date in the user's timezone.
+
+    Returns:
+        datetime.date: The day itself, the Monday of its week or the 1st of its month.
+    """
+    # Weekly periods start on Monday
+    if task_type == 'weekly':
+        return local_date - datetime.timedelta(days=local_date.weekday())
+    # Monthly periods start on the 1st day of the month
+    if task_type == 'monthly':
+        return local_date.replace(day=1)
+    return local_date
+
+
+def get_next_period_start(task_type, local_date):
+    """
+    Return the first day of the reset period following the one that contains a local date.
+
+    Args:
+        task_type (str): The type of task (daily, weekly, or monthly).
+        local_date (datetime.date): A date in the user's timezone.
+
+    Returns:
+        datetime.date: The next day, the next Monday or the 1st of the next month.
+    """
+    if task_type == 'weekly':
+        # Next Monday, always at least one day ahead
+        return local_date + datetime.timedelta(days=7 - local_date.weekday())
+    if task_type == 'monthly':
+        # 1st day of the next month
+        return (local_date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    # Next day
+    return local_date + datetime.timedelta(days=1)
+
+
+@lru_cache(maxsize=4096)
+def get_midnight(name, day):
+    """
+    Return the UTC instant of local midnight of a day in a timezone.
+
+    Args:
+        name (str): The timezone name.
+        day (datetime.date): The local day.
+
+    Returns:
+        datetime.datetime: The local midnight of the day, in UTC.
+    """
+    # Localize the midnight so daylight saving transitions are respected
+    midnight = get_timezone(name).localize(
+        datetime.datetime.combine(day, datetime.time.min))
+    return midnight.astimezone(datetime.timezone.utc)
+
+
+@lru_cache(maxsize=4096)
+def get_boundaries(name, local_date):
+    """
+    Return the UTC boundaries of the day, week and month containing a local date in a timezone.
+
+    Args:
+        name (str): The timezone name.
+        local_date (datetime.date): A date in the timezone.
+
+    Returns:
+        Mapping: A read-only mapping of task type (daily, weekly, or monthly) to a tuple of the UTC
+        instants at which its current period started and its next period starts.
+    """
+    return MappingProxyType({
+        task_type: (get_midnight(name, get_period_start(task_type, local_date)),
+                    get_midnight(name, get_next_period_start(task_type, local_date)))
+        for task_type in ('daily', 'weekly', 'monthly')
+    })
+
+
+def get_next_boundary(task_type, name, now):
+    """
+    Compute the next reset boundary of a task type in a timezone.
+
+    Args:
+        task_type (str): The type of task (daily, weekly, or monthly).
+        name (str): The timezone name.
+        now (datetime.datetime): The current UTC time.
+
+    Returns:
+        datetime.datetime: The next local midnight, Monday or 1st of the month after now, in UTC.
+    """
+    return get_boundaries(name, get_local_date(name, now))[task_type][1]
@@ -31,6 +31,9 @@ schema_view = get_schema_view(
 router = DefaultRouter()
 # Register the TaskViewSet with the router
 router.register(r'tasks', api.TaskViewSet, basename='task')
+# Register the read-only completion rollup with the router
+router.register(r'completion', api.TaskCompletionRollupViewSet,
+                basename='completion')
 
 # Define URL patterns for the app
 urlpatterns = [
@@ -54,6 +57,9 @@ urlpatterns = [
          name='mark_task_complete'),  # Mark a task as complete
     # Export tasks to an Excel file
     path('export/', views.export_task_to_excel, name='export'),
+    # Stream the task history as CSV or newline-delimited JSON
+    path('export/csv/', views.export_history_csv, name='export_csv'),
+    path('export/ndjson/', views.export_history_ndjson, name='export_ndjson'),
 
     # API endpoints
     path('api/', include(router.urls)),  # Include API routes from the router
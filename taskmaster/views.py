@@ -19,18 +19,47 @@ from django.contrib.auth.decorators import login_required
 # Import necessary modules from openpyxl for Excel file generation
 from openpyxl import Workbook  # For creating Excel workbooks
 # For styling Excel cells
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+# For the cells of the write-only worksheets of the streaming export
+from openpyxl.cell import WriteOnlyCell
 # For working with Excel column letters
 from openpyxl.utils import get_column_letter
 
 # Import HttpResponse for sending HTTP responses
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse, HttpResponseBadRequest, StreamingHttpResponse
 
 # Import forms, models, and serializers from the application
 from .forms.forms import *  # Import all forms from the forms module
 from .models import *  # Import all models from the models module
 # Import all serializers from the serializers module
 from .serializers.serializers import *
+# Import the per-user task counters
+from .counters.counters import (get_counters, get_task_state, apply_task_change, get_stats_version,
+                                STATS_CACHE_TIMEOUT)
+# For caching the rendered dashboard statistics
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+# For writing tasks and their counters in a single transaction
+from django.db import transaction
+# Rebuilds the period-by-period history from carried-forward rows
+from .history.carry import expand_history, get_last_resets
+# Reads the history moved to the segment files
+from .history.archive import read_archived_history
+# Aligns the carried-forward rows on the periods of their task type
+from .timezones import get_period_start, get_next_period_start
+# For merging the archived and database history by date
+import heapq
+# For reading ahead the rows of the streaming export
+from itertools import chain, islice
+# For the file the streaming export is written to
+import tempfile
+# For the CSV and NDJSON history exports
+import csv
+import datetime
+import json
+from django.db.models import Max, OuterRef, Q, Subquery
+from django.core import signing
 
 # Define the index view function
 
@@ -50,25 +79,42 @@ def index(request):
     if not request.user.is_authenticated:
         return redirect('auth')
 
+    # Repeat loads read the rendered statistics from the cache until the user's tasks change
+    cache_key = f'taskmaster:stats:{request.user.pk}:{get_stats_version(request.user.pk)}'
+    stats = cache.get(cache_key)
+    if stats is None:
+        stats = render_to_string('taskmaster/index_stats.html', get_dashboard_stats(request.user))
+        cache.set(cache_key, stats, STATS_CACHE_TIMEOUT)
+
+    return render(request, 'taskmaster/index.html', {'stats': mark_safe(stats)})
+
+
+def get_dashboard_stats(user):
+    """
+    Compute the dashboard statistics of a user from the task counters.
+
+    Args:
+        user (User): The user.
+
+    Returns:
+        dict: The completed, total and remaining tasks of every task type, and whether all tasks are completed.
+    """
+    # Read the task counters of the user with a single primary key lookup
+    counters = get_counters(user)
+
     # Get the count of completed and total daily tasks for the user
-    completed_daily_tasks = Task.objects.filter(
-        completed=True, daily=True, user=request.user).count()
-    total_daily_tasks = Task.objects.filter(
-        daily=True, user=request.user).count()
+    completed_daily_tasks = counters.daily_completed
+    total_daily_tasks = counters.daily_total
     remaining_daily_tasks = total_daily_tasks - completed_daily_tasks
 
     # Get the count of completed and total weekly tasks for the user
-    completed_weekly_tasks = Task.objects.filter(
-        completed=True, weekly=True, user=request.user).count()
-    total_weekly_tasks = Task.objects.filter(
-        weekly=True, user=request.user).count()
+    completed_weekly_tasks = counters.weekly_completed
+    total_weekly_tasks = counters.weekly_total
     remaining_weekly_tasks = total_weekly_tasks - completed_weekly_tasks
 
     # Get the count of completed and total monthly tasks for the user
-    completed_monthly_tasks = Task.objects.filter(
-        completed=True, monthly=True, user=request.user).count()
-    total_monthly_tasks = Task.objects.filter(
-        monthly=True, user=request.user).count()
+    completed_monthly_tasks = counters.monthly_completed
+    total_monthly_tasks = counters.monthly_total
     remaining_monthly_tasks = total_monthly_tasks - completed_monthly_tasks
 
     # Check if all tasks have been completed and there are tasks to count
@@ -76,19 +122,18 @@ def index(request):
                                                                                                          total_weekly_tasks + total_monthly_tasks) and (total_daily_tasks + total_weekly_tasks + total_monthly_tasks) != 0
 
     # Pass the task statistics to the template for rendering
-    return render(request, 'taskmaster/index.html',
-                  {
-                      'completed_daily_tasks': completed_daily_tasks,
-                      'total_daily_tasks': total_daily_tasks,
-                      'remaining_daily_tasks': remaining_daily_tasks,
-                      'completed_weekly_tasks': completed_weekly_tasks,
-                      'total_weekly_tasks': total_weekly_tasks,
-                      'remaining_weekly_tasks': remaining_weekly_tasks,
-                      'completed_monthly_tasks': completed_monthly_tasks,
-                      'total_monthly_tasks': total_monthly_tasks,
-                      'remaining_monthly_tasks': remaining_monthly_tasks,
-                      'completed_all_tasks': completed_all_tasks,
-                  })
+    return {
+        'completed_daily_tasks': completed_daily_tasks,
+        'total_daily_tasks': total_daily_tasks,
+        'remaining_daily_tasks': remaining_daily_tasks,
+        'completed_weekly_tasks': completed_weekly_tasks,
+        'total_weekly_tasks': total_weekly_tasks,
+        'remaining_weekly_tasks': remaining_weekly_tasks,
+        'completed_monthly_tasks': completed_monthly_tasks,
+        'total_monthly_tasks': total_monthly_tasks,
+        'remaining_monthly_tasks': remaining_monthly_tasks,
+        'completed_all_tasks': completed_all_tasks,
+    }
 
 # Define the auth_view function
 
@@ -258,17 +303,19 @@ def dailytask(request):
     # Creates an instance of the TaskForm to be used in the template for adding new tasks.
     form = TaskForm()
 
-    # Fetching daily tasks from the database for the current authenticated user, ordered by creation time.
+    # Fetching daily tasks from the database for the current authenticated user, in the order of the task list.
     tasks = Task.objects.filter(
-        daily=True, user=request.user).order_by('created_at')
+        task_type='daily', user=request.user).order_by(*TASK_LIST_ORDERING['daily'])
 
-    # Counting the number of completed tasks and total tasks for displaying statistics on the template.
-    completed_tasks = tasks.filter(completed=True).count()
-    total_tasks = tasks.count()
+    # Reading the number of completed tasks and total tasks from the task counters for the template.
+    counters = get_counters(request.user)
+    completed_tasks = counters.daily_completed
+    total_tasks = counters.daily_total
 
     # Rendering the dailytask.html template with the retrieved tasks, form, and task statistics as context data.
+    # The tasks are serialized once and embedded in the page, so the table needs no API call to be drawn.
     return render(request, 'taskmaster/dailytask.html', {
-        'tasks': tasks,
+        'initial_tasks': TaskSerializer(tasks, many=True).data,
         'completed_tasks': completed_tasks,
         'total_tasks': total_tasks,
         'form': form,
@@ -287,7 +334,7 @@ def weeklytask(request):
 
     Returns:
         HttpResponse: The HTTP response containing the rendered weeklytask.html template
-                      along with the context data (tasks, completed_tasks, total_tasks, form).
+                      along with the context data (initial_tasks, completed_tasks, total_tasks, form).
     """
 
     # Check if the user is authenticated. If not, redirect to the authentication page.
@@ -297,19 +344,19 @@ def weeklytask(request):
     # Initialize an empty form to add new tasks.
     form = TaskForm()
 
-    # Fetch all weekly tasks from the database for the current user, ordered by creation time.
+    # Fetch all weekly tasks from the database for the current user, in the order of the task list.
     tasks = Task.objects.filter(
-        weekly=True, user=request.user).order_by('created_at')
+        task_type='weekly', user=request.user).order_by(*TASK_LIST_ORDERING['weekly'])
 
-    # Count the number of completed weekly tasks.
-    completed_tasks = tasks.filter(completed=True).count()
+    # Read the number of completed and total weekly tasks from the task counters.
+    counters = get_counters(request.user)
+    completed_tasks = counters.weekly_completed
+    total_tasks = counters.weekly_total
 
-    # Count the total number of weekly tasks.
-    total_tasks = tasks.count()
-
-    # Render the weeklytask.html template with the context data (tasks, completed_tasks, total_tasks, form).
+    # Render the weeklytask.html template with the context data (initial_tasks, completed_tasks, total_tasks, form).
+    # The tasks are serialized once and embedded in the page, so the table needs no API call to be drawn.
     return render(request, 'taskmaster/weeklytask.html', {
-        'tasks': tasks,
+        'initial_tasks': TaskSerializer(tasks, many=True).data,
         'completed_tasks': completed_tasks,
         'total_tasks': total_tasks,
         'form': form,
@@ -333,7 +380,8 @@ def monthlytask(request):
         - If the user is not authenticated, it redirects to the 'auth' URL.
 
     Template Context:
-        - 'tasks': QuerySet of monthly tasks filtered by the authenticated user, ordered by 'created_at'.
+        - 'initial_tasks': The serialized monthly tasks of the authenticated user, in the order of the task list,
+          embedded in the page for the first draw of the table.
         - 'completed_tasks': The count of completed monthly tasks.
         - 'total_tasks': The total count of monthly tasks.
         - 'form': An instance of the TaskForm to allow adding new tasks.
@@ -345,18 +393,18 @@ def monthlytask(request):
     # Create an instance of the TaskForm to display on the template.
     form = TaskForm()
 
-    # Fetching monthly tasks from the database for the authenticated user, ordered by 'created_at'.
+    # Fetching monthly tasks from the database for the authenticated user, in the order of the task list.
     tasks = Task.objects.filter(
-        monthly=True, user=request.user).order_by('created_at')
-
-    # Count the number of completed monthly tasks.
-    completed_tasks = tasks.filter(completed=True).count()
+        task_type='monthly', user=request.user).order_by(*TASK_LIST_ORDERING['monthly'])
 
-    # Calculate the total number of monthly tasks.
-    total_tasks = tasks.count()
+    # Read the number of completed and total monthly tasks from the task counters.
+    counters = get_counters(request.user)
+    completed_tasks = counters.monthly_completed
+    total_tasks = counters.monthly_total
 
     # Render the 'monthlytask.html' template with the task data and the TaskForm instance.
-    return render(request, 'taskmaster/monthlytask.html', {'tasks': tasks, 'completed_tasks': completed_tasks, 'total_tasks': total_tasks, 'form': form})
+    # The tasks are serialized once and embedded in the page, so the table needs no API call to be drawn.
+    return render(request, 'taskmaster/monthlytask.html', {'initial_tasks': TaskSerializer(tasks, many=True).data, 'completed_tasks': completed_tasks, 'total_tasks': total_tasks, 'form': form})
 
 
 @login_required
@@ -386,8 +434,10 @@ def add_task(request):
             # Associate the task with the current authenticated user
             task.user = request.user
 
-            # Save the task to the database
-            task.save()
+            # Save the task to the database and count it in the same transaction
+            with transaction.atomic():
+                task.save()
+                apply_task_change(None, get_task_state(task))
 
             # Display a success message using Django's messages framework
             messages.success(
@@ -436,10 +486,14 @@ def edit_task(request, task_id):
     if request.method == 'POST':
         # Get the task object belonging to the current user with the given task_id
         task = Task.objects.get(id=task_id, user=request.user)
+        # Remember the counted state before the form updates the task
+        old_state = get_task_state(task)
         form = TaskForm(request.POST, instance=task)
         if form.is_valid():
-            # Save the updated task information to the database
-            task = form.save()
+            # Save the updated task information and its counters to the database
+            with transaction.atomic():
+                task = form.save()
+                apply_task_change(old_state, get_task_state(task))
             messages.success(
                 request, f'Task <b>{task.title}</b> has been edited')
             # Redirect based on the task's frequency (daily, weekly, monthly)
@@ -481,7 +535,10 @@ def delete_task(request, task_id):
         # Delete the task and display a success message.
         if task:
             task_title = task.title
-            task.delete()
+            old_state = get_task_state(task)
+            with transaction.atomic():
+                task.delete()
+                apply_task_change(old_state, None)
             messages.success(
                 request, f'Task <b>{task_title}</b> has been deleted')
 
@@ -510,9 +567,12 @@ def mark_task_complete(request, task_id):
         # Get the task object or return a 404 error if not found or not owned by the current user.
         task = get_object_or_404(Task, id=task_id, user=request.user)
 
-        # Toggle the 'completed' status of the task.
+        # Toggle the 'completed' status of the task and update its counters.
+        old_state = get_task_state(task)
         task.completed = not task.completed
-        task.save()
+        with transaction.atomic():
+            task.save()
+            apply_task_change(old_state, get_task_state(task))
 
         # Show a success message if the task is completed.
         if task.completed:
@@ -528,10 +588,188 @@ def mark_task_complete(request, task_id):
             return redirect('monthlytask')
 
 
+# Task types exported, one sheet each
+EXPORT_TASK_TYPES = ["Daily", "Weekly", "Monthly"]
+
+# Columns of every exported table
+EXPORT_HEADERS = ["Date", "Title", "Description", "Execution_time", "Completed"]
+
+# Content type of the Excel export
+EXCEL_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Widest column of the Excel export, in characters
+EXPORT_MAX_COLUMN_WIDTH = 30
+
+# Number of rows read ahead by the streaming Excel export to size the columns of a sheet
+EXPORT_WIDTH_SAMPLE_ROWS = 1000
+
+# Number of history rows fetched per round trip by the exports
+EXPORT_CHUNK_SIZE = 2000
+
+# TaskHistory fields read by the exports
+HISTORY_READ_FIELDS = (
+    'date', 'task_type', 'title', 'description', 'execution_day', 'execution_time', 'execution_date',
+    'completed', 'task_id', 'carry_forward', 'carried_until', 'snapshot__title', 'snapshot__description',
+)
+
+# Salt of the signed resume cursors of the exports
+EXPORT_CURSOR_SALT = 'taskmaster.export.cursor'
+
+
+def format_execution(task):
+    """
+    Format the execution time of a history row or summary for its task type.
+
+    Args:
+        task (TaskHistory or TaskHistorySummary): The row to format.
+
+    Returns:
+        str: The execution time, prefixed by the day of the week or month when applicable.
+    """
+    execution_time = task.execution_time.strftime('%H:%M')
+    if task.task_type == 'weekly':
+        return f'{task.execution_day}, {execution_time}'
+    if task.task_type == 'monthly':
+        return f'Day {task.execution_date}, {execution_time}'
+    return execution_time
+
+
+def iter_export_rows(user, task_type, last_resets, since=None, until=None):
+    """
+    Yield the rows of the export of one task type, oldest first.
+
+    Compacted months are read from the summaries, followed by the archived and the database history, with
+    the carried-forward rows repeated for every period they stand for. The history is read in chunks with
+    only the exported columns, so the rows are produced with flat memory.
+
+    Args:
+        user (User): The user whose history is exported.
+        task_type (str): The type of task (daily, weekly, or monthly).
+        last_resets (dict): A mapping of task type to the date of the user's last reset.
+        since (datetime.date, optional): The first date (inclusive). Defaults to the oldest.
+        until (datetime.date, optional): The last date (inclusive). Defaults to the newest.
+
+    Returns:
+        generator: Lists of the values of the EXPORT_HEADERS columns.
+    """
+    for summary in iter_history_summaries(user, task_type, since, until):
+        yield [f'{summary.first_date.strftime("%d-%m-%Y")} - {summary.last_date.strftime("%d-%m-%Y")}',
+               summary.title, summary.description, format_execution(summary),
+               f'{summary.days_completed} of {summary.days_completed + summary.days_missed}']
+
+    for date, task in iter_history(user, task_type, last_resets, since, until):
+        # The title and description are joined back from the snapshot
+        title, description = task.get_text()
+        yield [date.strftime('%d-%m-%Y'), title, description,
+               format_execution(task), 'yes' if task.completed else 'no']
+
+
+def iter_history_summaries(user, task_type, since=None, until=None):
+    """
+    Yield the compacted months of one task type, oldest first. Summaries overlapping the range are yielded whole.
+
+    Args:
+        user (User): The user whose history is read.
+        task_type (str): The type of task (daily, weekly, or monthly).
+        since (datetime.date, optional): The first date (inclusive). Defaults to the oldest.
+        until (datetime.date, optional): The last date (inclusive). Defaults to the newest.
+
+    Returns:
+        iterator: The TaskHistorySummary rows.
+    """
+    summaries = TaskHistorySummary.objects.filter(
+        task_type=task_type, user=user).order_by('month', 'first_date')
+    if since is not None:
+        summaries = summaries.filter(last_date__gte=since)
+    if until is not None:
+        summaries = summaries.filter(first_date__lte=until)
+    return summaries.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def get_carried_history(user, task_type, last_resets, since):
+    """
+    Return the carried-forward rows from before a date that still stand for the periods from that date on.
+
+    Only the latest row of every task before the date is carried, and it is moved to the first period
+    starting on or after the date, so it is not expanded over the periods before it. The rows are read
+    through the partial index on the carried-forward rows.
+
+    Args:
+        user (User): The user whose history is read.
+        task_type (str): The type of task (daily, weekly, or monthly).
+        last_resets (dict): A mapping of task type to the date of the user's last reset.
+        since (datetime.date): The first date of the range.
+
+    Returns:
+        list: Unsaved TaskHistory rows with their snapshot, in date order.
+    """
+    first = since if get_period_start(task_type, since) == since else get_next_period_start(task_type, since)
+    latest = TaskHistory.objects.filter(
+        task=OuterRef('task'), task_type=task_type, date__lt=since).order_by('-date', '-pk').values('pk')[:1]
+    rows = TaskHistory.objects.filter(
+        user=user, task_type=task_type, carry_forward=True, date__lt=since,
+    ).filter(
+        # Rows of deleted tasks are closed, the others stand until the next row of their task
+        Q(task__isnull=True, carried_until__gte=first) | Q(task__isnull=False, pk=Subquery(latest)),
+    ).exclude(carried_until__lt=first).select_related('snapshot').only(*HISTORY_READ_FIELDS)
+
+    carried = []
+    for row in rows:
+        until = row.carried_until or last_resets.get(task_type)
+        if until is None or until < first:
+            continue
+        # The row now starts at the first period of the range
+        row.date = first
+        carried.append(row)
+    return carried
+
+
+def iter_history(user, task_type, last_resets, since=None, until=None):
+    """
+    Yield the day-level history of one task type, oldest first, optionally limited to a date range.
+
+    The archived and database history are merged by date, and the carried-forward rows are repeated for
+    every period they stand for. The database rows are read through a server-side cursor in chunks, with
+    only the exported columns, over the date range alone. Carried-forward rows from before the range are
+    read separately by get_carried_history and start at the first period of the range.
+
+    Args:
+        user (User): The user whose history is read.
+        task_type (str): The type of task (daily, weekly, or monthly).
+        last_resets (dict): A mapping of task type to the date of the user's last reset.
+        since (datetime.date, optional): The first date (inclusive). Defaults to the oldest.
+        until (datetime.date, optional): The last date (inclusive). Defaults to the newest.
+
+    Returns:
+        generator: (date, row) pairs, the row being a TaskHistory with its snapshot.
+    """
+    tasks = TaskHistory.objects.filter(task_type=task_type, user=user)
+    carried = []
+    if since is not None:
+        tasks = tasks.filter(date__gte=since)
+        carried = get_carried_history(user, task_type, last_resets, since)
+    if until is not None:
+        tasks = tasks.filter(date__lte=until)
+    tasks = tasks.select_related('snapshot').only(
+        *HISTORY_READ_FIELDS).order_by('date', 'pk').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    # Archived rows come first, then the rows carried into the range, merged by date with the rows of the
+    # range, so a row of the range supersedes a carried row of its task on the same date
+    history = heapq.merge(read_archived_history(user, task_type, since, until), carried, tasks,
+                          key=lambda row: row.date)
+    # Carried-forward rows are repeated for every period they stand for
+    for date, task in expand_history(history, last_resets):
+        if (since is None or date >= since) and (until is None or date <= until):
+            yield date, task
+
+
 def export_task_to_excel(request):
     """
     View function to export user's task history to an Excel file.
 
+    With ?mode=stream the workbook is written with write-only worksheets and returned as a streamed file,
+    so the memory used does not depend on the size of the history. The since, until and cursor parameters
+    of the history exports limit the exported dates, and the X-Next-Cursor header resumes after them.
+
     Args:
         request: The HTTP request object.
 
@@ -542,11 +780,26 @@ def export_task_to_excel(request):
     if not request.user.is_authenticated:
         return redirect('auth')
 
+    try:
+        _, since, until, positions = get_history_export_filters(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    # Carried-forward history rows stand for every period up to the last reset of the user
+    last_resets = get_last_resets(request.user)
+    ranges, next_cursor = get_history_export_ranges(
+        request.user, [task_type.lower() for task_type in EXPORT_TASK_TYPES], since, until, positions,
+        last_resets)
+
+    if request.GET.get('mode') == 'stream':
+        response = _stream_excel_export(request.user, last_resets, ranges)
+        response['X-Next-Cursor'] = next_cursor
+        return response
+
     # Create a new Excel workbook
     workbook = Workbook()
 
     # Write headers for each table section
-    task_types = ["Daily", "Weekly", "Monthly"]
+    task_types = EXPORT_TASK_TYPES
 
     # Function to write section header
     def write_section_header(section_name):
@@ -586,39 +839,26 @@ def export_task_to_excel(request):
         sheet = workbook.create_sheet(title=task_type)
 
         # Write headers for each table section
-        headers = ["Date", "Title", "Description",
-                   "Execution_time", "Completed"]
+        headers = EXPORT_HEADERS
 
         row_index = 1
 
         write_section_header(task_type)
 
-        # Fetch and populate tasks for each type
-        tasks = TaskHistory.objects.filter(
-            task_type=task_type.lower(), user=request.user)
-        for task in tasks:
-            execution_time = task.execution_time.strftime('%H:%M')
-            if task.task_type == 'daily':
-                data = [task.date.strftime(
-                    '%d-%m-%Y'), task.title, task.description, execution_time, 'yes' if task.completed else 'no']
-            elif task.task_type == 'weekly':
-                data = [task.date.strftime('%d-%m-%Y'), task.title, task.description,
-                        f'{task.execution_day}, {execution_time}', 'yes' if task.completed else 'no']
-            else:
-                data = [task.date.strftime('%d-%m-%Y'), task.title, task.description,
-                        f'Day {task.execution_date}, {execution_time}', 'yes' if task.completed else 'no']
+        rows = list(iter_export_rows(request.user, task_type.lower(), last_resets, *ranges[task_type.lower()]))
 
+        for data in rows:
             for col_index, value in enumerate(data, start=1):
                 sheet.cell(row=row_index, column=col_index, value=value)
                 col_letter = get_column_letter(col_index)
                 # Adjust width based on content length
                 column_width = len(str(value)) + 2
                 if sheet.column_dimensions[col_letter].width < column_width:
-                    sheet.column_dimensions[col_letter].width = column_width if column_width < 30 else 30
+                    sheet.column_dimensions[col_letter].width = min(column_width, EXPORT_MAX_COLUMN_WIDTH)
             row_index += 1
 
         # Add a border to the table
-        table_start_row = row_index - len(tasks) - 2
+        table_start_row = row_index - len(rows) - 2
         table_end_row = row_index - 1
         for col_index in range(1, len(headers) + 1):
             col_letter = get_column_letter(col_index)
@@ -633,9 +873,288 @@ def export_task_to_excel(request):
     workbook.remove(workbook['Sheet'])
 
     # Create the response with the Excel file
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    response = HttpResponse(content_type=EXCEL_CONTENT_TYPE)
     response["Content-Disposition"] = f"attachment; filename=Task_Master_Data_{request.user.username}.xlsx"
+    response["X-Next-Cursor"] = next_cursor
     workbook.save(response)
 
     return response
+
+
+def _add_export_styles(workbook):
+    """
+    Register the named styles of the streaming Excel export, shared by every cell instead of copied per cell.
+    """
+    side = Side(border_style='thin', color='000000')
+    border = Border(top=side, bottom=side, left=side, right=side)
+    for name, color in (('export_section', '999999'), ('export_header', 'C0C0C0')):
+        workbook.add_named_style(NamedStyle(
+            name=name, font=Font(bold=True), alignment=Alignment(horizontal='center'), border=border,
+            fill=PatternFill(start_color=color, end_color=color, fill_type='solid')))
+    workbook.add_named_style(NamedStyle(name='export_cell', border=border))
+
+
+def _stream_excel_export(user, last_resets, ranges):
+    """
+    Write the Excel export with write-only worksheets into a temporary file and stream it back.
+
+    The rows of every sheet are produced one at a time and written straight to the worksheet. The column
+    widths have to be known before the first row, so they are computed from a sample of the first rows.
+
+    Args:
+        user (User): The user whose history is exported.
+        last_resets (dict): A mapping of task type to the date of the user's last reset.
+        ranges (dict): A mapping of task type to its (first, last) exported dates.
+
+    Returns:
+        FileResponse: The Excel file, streamed from the temporary file, which is deleted once sent.
+    """
+    workbook = Workbook(write_only=True)
+    _add_export_styles(workbook)
+
+    def styled(sheet, value, style):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.style = style
+        return cell
+
+    for task_type in EXPORT_TASK_TYPES:
+        sheet = workbook.create_sheet(title=task_type)
+        rows = iter_export_rows(user, task_type.lower(), last_resets, *ranges[task_type.lower()])
+
+        # Size the columns from the headers and a sample of the rows
+        sample = list(islice(rows, EXPORT_WIDTH_SAMPLE_ROWS))
+        widths = [len(header) + 2 for header in EXPORT_HEADERS]
+        for data in sample:
+            for col_index, value in enumerate(data):
+                column_width = len(str(value)) + 2
+                if widths[col_index] < column_width:
+                    widths[col_index] = min(column_width, EXPORT_MAX_COLUMN_WIDTH)
+        for col_index, width in enumerate(widths, start=1):
+            sheet.column_dimensions[get_column_letter(col_index)].width = width
+
+        # Section header merged over the table, then the column headers and the rows
+        sheet.merged_cells.add(f'A1:{get_column_letter(len(EXPORT_HEADERS))}1')
+        sheet.append([styled(sheet, task_type, 'export_section')] +
+                     [styled(sheet, None, 'export_cell') for _ in EXPORT_HEADERS[1:]])
+        sheet.append([styled(sheet, header, 'export_header') for header in EXPORT_HEADERS])
+        for data in chain(sample, rows):
+            sheet.append([styled(sheet, value, 'export_cell') for value in data])
+
+    export_file = tempfile.TemporaryFile()
+    workbook.save(export_file)
+    export_file.seek(0)
+    return FileResponse(export_file, as_attachment=True, filename=f'Task_Master_Data_{user.username}.xlsx',
+                        content_type=EXCEL_CONTENT_TYPE)
+
+
+# Columns of the CSV and NDJSON history exports. A record spans the days from date to last_date, a single day
+# for the history rows and a month for the compacted summaries, which have no completed value
+HISTORY_EXPORT_FIELDS = ('date', 'task_type', 'title', 'description', 'execution_day', 'execution_time',
+                         'execution_date', 'completed', 'last_date', 'days_completed', 'days_total')
+
+# Number of history rows written per chunk of the streamed CSV and NDJSON exports
+HISTORY_EXPORT_ROWS_PER_CHUNK = 500
+
+
+class Echo:
+    """
+    File-like object returning what is written to it, so that csv.writer produces lines to stream.
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_history_export_filters(request):
+    """
+    Read the task type, date range and cursor parameters of the history exports.
+
+    Args:
+        request (HttpRequest): The request, with optional task_type, since and until (YYYY-MM-DD) parameters,
+            and the cursor returned in the X-Next-Cursor header of a previous export.
+
+    Returns:
+        tuple: The task types to export, the first and last dates (None when not given), and the last
+            exported date of every task type read from the cursor (empty without a cursor).
+
+    Raises:
+        ValueError: If a parameter is invalid.
+    """
+    task_type = request.GET.get('task_type')
+    if task_type and task_type not in dict(TaskHistory.DATE_TYPE_CHOICES):
+        raise ValueError(f'Invalid task type: {task_type}.')
+    task_types = [task_type] if task_type else [choice for choice, _ in TaskHistory.DATE_TYPE_CHOICES]
+    since, until = (datetime.date.fromisoformat(request.GET[name]) if request.GET.get(name) else None
+                    for name in ('since', 'until'))
+    if since and until and since > until:
+        raise ValueError('The since date is after the until date.')
+
+    positions = {}
+    if request.GET.get('cursor'):
+        try:
+            positions = {choice: datetime.date.fromisoformat(day) for choice, day in signing.loads(
+                request.GET['cursor'], salt=EXPORT_CURSOR_SALT).items()}
+        except (signing.BadSignature, AttributeError, TypeError):
+            raise ValueError('Invalid cursor.')
+    return task_types, since, until, positions
+
+
+def get_history_export_ranges(user, task_types, since, until, positions, last_resets):
+    """
+    Work out the date range exported for every task type, and the cursor resuming after it.
+
+    An export never goes past the last reset of a task type, the latest history date, so a reset
+    running during the export is left for the next one. With a cursor, every task type resumes the day
+    after the last date it exported. The cursor never moves past the history of a task type, so a task
+    type never reset nor written yet resumes from the same position.
+
+    Args:
+        user (User): The user whose history is exported.
+        task_types (list): The task types to export.
+        since (datetime.date or None): The first date requested.
+        until (datetime.date or None): The last date requested.
+        positions (dict): The last exported date of every task type, read from the cursor.
+        last_resets (dict): A mapping of task type to the date of the user's last reset.
+
+    Returns:
+        tuple: A mapping of task type to its (first, last) dates, and the next cursor.
+    """
+    ranges = {}
+    next_positions = {choice: day.isoformat() for choice, day in positions.items()}
+    for task_type in task_types:
+        first = since
+        if task_type in positions:
+            resumed = positions[task_type] + datetime.timedelta(days=1)
+            first = max(first, resumed) if first else resumed
+        end = last_resets.get(task_type) or get_history_end(user, task_type)
+        last = min(until, end) if until and end else until or end
+        ranges[task_type] = (first, last)
+        # Only the dates up to the last reset or the latest history are covered, a task type without either
+        # keeps its position so the history written later is still exported
+        covered = min(until, end) if until and end else end
+        if covered and (task_type not in positions or covered > positions[task_type]):
+            next_positions[task_type] = covered.isoformat()
+    return ranges, signing.dumps(next_positions, salt=EXPORT_CURSOR_SALT, compress=True)
+
+
+def get_history_end(user, task_type):
+    """
+    Return the latest date of the database or archived history of a user without reset watermark.
+    """
+    ends = [
+        TaskHistory.objects.filter(user=user, task_type=task_type).aggregate(end=Max('date'))['end'],
+        TaskHistoryArchiveBlock.objects.filter(
+            user=user, task_type=task_type).aggregate(end=Max('last_date'))['end'],
+    ]
+    return max((end for end in ends if end), default=None)
+
+
+def iter_history_records(user, ranges, last_resets):
+    """
+    Yield the history records of the CSV and NDJSON exports, the compacted months of every task type first.
+
+    Returns:
+        generator: Dictionaries of the HISTORY_EXPORT_FIELDS values.
+    """
+    def execution(task):
+        return {
+            'execution_day': task.execution_day,
+            'execution_time': task.execution_time.strftime('%H:%M') if task.execution_time else None,
+            'execution_date': task.execution_date,
+        }
+
+    for task_type, (since, until) in ranges.items():
+        for summary in iter_history_summaries(user, task_type, since, until):
+            yield {
+                'date': summary.first_date.isoformat(),
+                'task_type': summary.task_type,
+                'title': summary.title,
+                'description': summary.description,
+                **execution(summary),
+                'completed': None,
+                'last_date': summary.last_date.isoformat(),
+                'days_completed': summary.days_completed,
+                'days_total': summary.days_completed + summary.days_missed,
+            }
+        for date, task in iter_history(user, task_type, last_resets, since, until):
+            title, description = task.get_text()
+            yield {
+                'date': date.isoformat(),
+                'task_type': task.task_type,
+                'title': title,
+                'description': description,
+                **execution(task),
+                'completed': task.completed,
+                'last_date': date.isoformat(),
+                'days_completed': int(task.completed),
+                'days_total': 1,
+            }
+
+
+def _stream_history_export(request, content_type, extension, header, encode_rows):
+    """
+    Build the streamed response of a history export, written in chunks of rows after an optional header.
+    """
+    if not request.user.is_authenticated:
+        return redirect('auth')
+    try:
+        task_types, since, until, positions = get_history_export_filters(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    last_resets = get_last_resets(request.user)
+    ranges, next_cursor = get_history_export_ranges(
+        request.user, task_types, since, until, positions, last_resets)
+
+    def chunks():
+        # The header is sent before the first row is read, so the first byte leaves immediately
+        if header:
+            yield header
+        records = iter_history_records(request.user, ranges, last_resets)
+        while True:
+            rows = list(islice(records, HISTORY_EXPORT_ROWS_PER_CHUNK))
+            if not rows:
+                break
+            yield encode_rows(rows)
+
+    response = StreamingHttpResponse(chunks(), content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename=Task_Master_History_{request.user.username}.{extension}')
+    response['X-Next-Cursor'] = next_cursor
+    return response
+
+
+def export_history_csv(request):
+    """
+    View function to stream the task history of the user as CSV.
+
+    Args:
+        request (HttpRequest): The request, with optional task_type, since and until parameters.
+
+    Returns:
+        StreamingHttpResponse: The text/csv export, one line per history row after a header line.
+    """
+    writer = csv.writer(Echo())
+
+    def encode_rows(rows):
+        return ''.join(writer.writerow([
+            str(row[field]).lower() if field == 'completed' and row[field] is not None else row[field]
+            for field in HISTORY_EXPORT_FIELDS]) for row in rows)
+
+    return _stream_history_export(request, 'text/csv', 'csv', writer.writerow(HISTORY_EXPORT_FIELDS),
+                                  encode_rows)
+
+
+def export_history_ndjson(request):
+    """
+    View function to stream the task history of the user as newline-delimited JSON.
+
+    Args:
+        request (HttpRequest): The request, with optional task_type, since and until parameters.
+
+    Returns:
+        StreamingHttpResponse: The application/x-ndjson export, one JSON object per history row.
+    """
+    def encode_rows(rows):
+        return ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+
+    return _stream_history_export(request, 'application/x-ndjson', 'ndjson', '', encode_rows)